@@ -0,0 +1,92 @@
+"""
+Микро-бенчмарк JSON-кодеков на типичных пакетах Revers 8000.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_codec [--events 500] [--users 20000] [--seconds 2]
+"""
+import argparse
+import random
+import time
+
+from utils.codec import available_backends, get_codec
+
+_FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Сергей", "Ольга"]
+_LAST_NAMES = ["Иванов", "Петров", "Сидорова", "Кузнецова", "Смирнов", "Попова"]
+
+
+def make_events_frame(count: int) -> dict:
+    """Пакет events с `count` событиями прохода."""
+    return {
+        "Command": "events",
+        "Id": 1,
+        "Version": 1,
+        "Data": [
+            {
+                "EvTime": f"17.10.2026 09:{i // 60 % 60:02d}:{i % 60:02d}",
+                "EvAddr": random.randint(1, 64),
+                "EvUser": random.randint(0, 20000),
+                "EvCard": f"{random.randint(1, 255)}.{random.randint(1, 65535)}",
+                "EvCode": random.choice([1, 2, 17, 18]),
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def make_userlist_frame(count: int) -> dict:
+    """Пакет userlist с `count` владельцами карт."""
+    return {
+        "Command": "userlist",
+        "Id": 1,
+        "Version": 1,
+        "Data": [
+            {
+                "Id": i,
+                "FirstName": random.choice(_FIRST_NAMES),
+                "SecondName": random.choice(_FIRST_NAMES) + "ович",
+                "LastName": random.choice(_LAST_NAMES),
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def _rate(fn, seconds: float) -> float:
+    """Количество вызовов fn в секунду за интервал `seconds`."""
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        fn()
+        calls += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500, help="событий в пакете events")
+    parser.add_argument("--users", type=int, default=20000, help="владельцев в пакете userlist")
+    parser.add_argument("--seconds", type=float, default=2.0, help="длительность каждого замера")
+    args = parser.parse_args()
+
+    random.seed(42)
+    frames = {
+        f"events[{args.events}]": make_events_frame(args.events),
+        f"userlist[{args.users}]": make_userlist_frame(args.users),
+    }
+
+    print(f"{'codec':<10}{'frame':<18}{'size, KiB':>10}{'decode/s':>12}{'encode/s':>12}")
+    for backend in available_backends():
+        codec = get_codec(backend)
+        for name, frame in frames.items():
+            payload = codec.dumps(frame)
+            decode = _rate(lambda: codec.loads(payload), args.seconds)
+            encode = _rate(lambda: codec.dumps(frame), args.seconds)
+            print(f"{backend:<10}{name:<18}{len(payload) / 1024:>10.1f}{decode:>12.1f}{encode:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
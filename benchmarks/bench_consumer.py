@@ -0,0 +1,154 @@
+"""
+Бенчмарк обработки команд портала (issue/wdraw) потребителем RabbitMQ.
+
+Вместо брокера используется in-process заглушка AMQP: каждое сообщение
+доставляется отдельной задачей, как это делает aiormq, а подтверждения
+считаются локально. Контроллер Revers 8000 имитируется клиентом,
+отвечающий на каждую команду через `--latency` мс.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_consumer [--commands 2000] [--cards 500] [--latency 5]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+from core.command_manager import CommandManager
+from core.scheduler import CommandScheduler
+from core.settings import settings
+from core.tcpclient import TcpClient
+from rabbitmq.consumer import RabbitMQConsumer
+from rabbitmq.handlers import command_key, rmq_handler
+from utils import codec
+
+
+class StubMessage:
+    """Входящее сообщение AMQP."""
+    def __init__(self, body: dict, acks: list):
+        self.body = codec.dumps(body)
+        self._acks = acks
+
+    @asynccontextmanager
+    async def process(self):
+        yield
+        self._acks.append(self)
+
+
+class StubQueue:
+    def __init__(self):
+        self.callback = None
+
+    async def bind(self, exchange):
+        pass
+
+    async def consume(self, callback):
+        self.callback = callback
+
+
+class StubChannel:
+    """Канал AMQP: объявления ничего не делают, consume запоминает обработчик."""
+    def __init__(self):
+        self.queue = StubQueue()
+        self.prefetch_count = None
+
+    async def set_qos(self, prefetch_count: int):
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(self, *args, **kwargs):
+        return None
+
+    async def declare_queue(self, *args, **kwargs):
+        return self.queue
+
+    async def deliver(self, messages: list):
+        """Доставляет сообщения с учётом prefetch: не больше prefetch_count без подтверждения."""
+        window = asyncio.Semaphore(self.prefetch_count or len(messages))
+        tasks = []
+        for message in messages:
+            await window.acquire()
+            task = asyncio.create_task(self.queue.callback(message))
+            task.add_done_callback(lambda _: window.release())
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+
+
+class StubController(TcpClient):
+    """Контроллер, отвечающий ErrCode 0 на любую команду через `latency` секунд."""
+    def __init__(self, latency: float, logger):
+        super().__init__("stub", 0, "", "", "", logger, use_ssl=False)
+        self.latency = latency
+        self.writer = object()
+        self.order: dict[int, list] = {}
+
+    async def send(self, data: bytes):
+        command = codec.loads(data[4:])
+        card = command.get("Data", {}).get("CardNum", command.get("CardNum"))
+        self.order.setdefault(card, []).append(command["Command"])
+        reply = {"Command": command["Command"], "Id": command["Id"], "ErrCode": 0}
+        asyncio.get_running_loop().call_later(self.latency, self.resolve_reply, reply)
+
+
+def make_commands(count: int, cards: int) -> list[dict]:
+    """Поток команд: для каждой карты чередуются issue и wdraw."""
+    state = {}
+    commands = []
+    for event_id in range(1, count + 1):
+        card = random.randint(1, cards)
+        event_type = "wdraw" if state.get(card) == "issue" else "issue"
+        state[card] = event_type
+        commands.append({"event_id": event_id, "card_number": f"1.{card}", "event_type": event_type})
+    return commands
+
+
+async def run(commands: list[dict], latency: float, prefetch: int, concurrency: int, logger) -> tuple[float, bool]:
+    consumer = RabbitMQConsumer("stub", 0, "/", "", "", logger, prefetch_count=prefetch, concurrency=concurrency)
+    consumer.channel = StubChannel()
+    await consumer.channel.set_qos(prefetch_count=prefetch)
+    client = StubController(latency, logger)
+    acks = []
+
+    async with CommandScheduler(logger) as scheduler, CommandManager(logger) as command_manager:
+        async def handler(message):
+            return await rmq_handler(message, client, command_manager, scheduler)
+
+        await consumer.consume("commands", "bench", handler, key=command_key)
+        started = time.perf_counter()
+        await consumer.channel.deliver([StubMessage(command, acks) for command in commands])
+        elapsed = time.perf_counter() - started
+
+    expected: dict[int, list] = {}
+    for command in commands:
+        card = int(command["card_number"].split(".")[1]) | (1 << 16)
+        stages = ["addcard"] if command["event_type"] == "issue" else ["loadcard", "delcard"]
+        expected.setdefault(card, []).extend(stages)
+    ordered = len(acks) == len(commands) and client.order == expected
+    return elapsed, ordered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=2000, help="количество команд")
+    parser.add_argument("--cards", type=int, default=500, help="количество разных карт")
+    parser.add_argument("--latency", type=float, default=5.0, help="задержка ответа контроллера, мс")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    settings.WDRAW_DELCARD_DELAY = 0
+
+    random.seed(42)
+    commands = make_commands(args.commands, args.cards)
+
+    print(f"{'prefetch':>9}{'workers':>9}{'commands/s':>12}{'per-card order':>16}")
+    for prefetch, concurrency in [(1, 1), (16, 8), (64, 32), (256, 128)]:
+        elapsed, ordered = asyncio.run(run(commands, args.latency / 1000, prefetch, concurrency, logger))
+        print(f"{prefetch:>9}{concurrency:>9}{len(commands) / elapsed:>12.0f}{'ok' if ordered else 'VIOLATED':>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Бенчмарк разбора и форматирования дат PACS ("dd.MM.yyyy HH:mm:ss").
+
+Сравнивает strptime/strftime с кэширующими parse_datetime/format_datetime
+на пачке событий, похожей на выгрузку контроллера после переподключения:
+одна-две даты, несколько событий в одну секунду.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_datetime [--events 100000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from utils.timeutils import PACS_DATETIME_FORMAT, format_datetime, parse_datetime
+
+
+def make_ev_times(count: int) -> list[str]:
+    """EvTime для `count` событий: в среднем 3 события в секунду, начиная с 23:00."""
+    moment = datetime(2026, 10, 16, 23, 0, 0)
+    result = []
+    for _ in range(count):
+        moment += timedelta(seconds=random.choice([0, 0, 1]))
+        result.append(moment.strftime(PACS_DATETIME_FORMAT))
+    return result
+
+
+def _measure(fn, items) -> float:
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000, help="количество событий")
+    args = parser.parse_args()
+
+    random.seed(42)
+    ev_times = make_ev_times(args.events)
+    moments = [datetime.strptime(value, PACS_DATETIME_FORMAT) for value in ev_times]
+
+    parse_datetime.cache_clear()
+    cases = [
+        ("parse: strptime", lambda value: datetime.strptime(value, PACS_DATETIME_FORMAT), ev_times),
+        ("parse: parse_datetime", parse_datetime, ev_times),
+        ("format: strftime", lambda value: value.strftime(PACS_DATETIME_FORMAT), moments),
+        ("format: format_datetime", format_datetime, moments),
+    ]
+
+    print(f"{'case':<26}{'total, ms':>12}{'per event, µs':>16}")
+    for name, fn, items in cases:
+        elapsed = _measure(fn, items)
+        print(f"{name:<26}{elapsed * 1000:>12.1f}{elapsed / len(items) * 1e6:>16.3f}")
+    print(f"parse_datetime cache: {parse_datetime.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Сквозной бенчмарк приёма событий: симулятор контроллера → TLS → main.receive_data
+→ EventPipeline → Postgres/RabbitMQ.
+
+Контроллер — benchmarks.simulator в том же процессе. Вместо Postgres и
+RabbitMQ используются заглушки, отвечающие сразу (`--db-latency` добавляет
+задержку вставки), поэтому измеряется собственная стоимость клиента:
+TLS, разбор пакетов, модели, отсев дубликатов, конвейер. Для TLS
+создаётся временный самоподписанный сертификат (нужен openssl),
+`--plain` — без TLS.
+
+Отчёт: событий/сек, p50/p99 задержки от отправки пакета симулятором до
+вставки его событий в БД, прирост RSS процесса.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_e2e [--events 100000] [--batch 50] [--rate 0] [--db-latency 0] [--plain]
+    python -m benchmarks.bench_e2e --replay capture.bin --speed 0
+    python -m benchmarks.bench_e2e --replay capture.bin --offline   # без сети: детерминированно, для поиска регрессий
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import main as app
+from benchmarks.replay import CaptureReplayClient
+from benchmarks.simulator import ControllerSimulator, server_ssl_context
+from core.command_manager import CommandManager
+from core.pipeline import EventPipeline
+from core.settings import settings
+from core.tcpclient import TcpClient
+
+
+class StubDB:
+    """Postgres: INSERT ... RETURNING id возвращает id по числу строк, задержка ингеста считается по EvCard."""
+    def __init__(self, sent_at: dict[int, float], latency: float):
+        self.sent_at = sent_at
+        self.latency = latency
+        self.rows = 0
+        self.latencies: list[float] = []
+
+    async def fetch_all(self, query: str, *args):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.perf_counter()
+        # args — по массиву на колонку, card_number = "<номер пакета>.<номер в пакете>"
+        seen = set()
+        for card in args[3]:
+            seq = int(str(card).partition(".")[0])
+            sent_at = self.sent_at.get(seq)
+            if sent_at is not None and seq not in seen:
+                seen.add(seq)
+                self.latencies.append(now - sent_at)
+        columns = ("created", "ap_id", "owner_id", "card_number", "code")
+        records = [{"id": self.rows + i, **dict(zip(columns, row))} for i, row in enumerate(zip(*args))]
+        self.rows += len(records)
+        return records
+
+    async def fetch_row(self, query: str, *args):
+        return (await self.fetch_all(query, *args))[0]
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Пакеты длиннее EVENT_INSERT_BATCH_SIZE вставляются в транзакции; заглушка сама себе соединение."""
+        yield self
+
+    fetch = fetch_all
+    fetchrow = fetch_row
+
+
+class StubProducer:
+    """RabbitMQ: публикация считается мгновенной."""
+    def __init__(self):
+        self.published = 0
+
+    async def publish_many(self, exchange_name: str, messages: list, max_retries: int = 3):
+        self.published += len(messages)
+
+
+class StubDirectory:
+    """Синхронизация справочников не измеряется; имена — как у справочников симулятора."""
+    async def sync_card_owners(self, owners):
+        pass
+
+    async def sync_access_points(self, points):
+        pass
+
+    async def warm(self):
+        pass
+
+    def access_point_name(self, system_id: int) -> str:
+        return f"Точка доступа {system_id}"
+
+    def card_owner(self, system_id: int) -> tuple[str, str, str]:
+        return f"Имя{system_id}", f"Отчество{system_id}", f"Фамилия{system_id}"
+
+
+def make_certificate(directory: str, common_name: str) -> tuple[str, str]:
+    """Самоподписанный сертификат с CN и subjectAltName = common_name."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", f"/CN={common_name}",
+            "-addext", f"subjectAltName=DNS:{common_name}",
+        ],
+        check=True,
+        capture_output=True
+    )
+    return cert, key
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(args, logger) -> dict:
+    if args.offline:
+        return await run_offline(args, logger)
+    certs = None if args.plain else tempfile.mkdtemp()
+    try:
+        cert = key = ""
+        if certs is not None:
+            cert, key = make_certificate(certs, settings.TCP_SERVER_CERT_CN)
+        simulator = ControllerSimulator(logger, ssl_context=server_ssl_context(cert, key) if cert else None)
+        db = StubDB(simulator.sent_at, args.db_latency / 1000)
+        producer = StubProducer()
+        shutdown_event = asyncio.Event()
+
+        async with simulator, EventPipeline(db, producer, logger, directory=StubDirectory()) as pipeline:
+            client = TcpClient(
+                "127.0.0.1", simulator.port, cert, key, settings.TCP_SERVER_CERT_CN, logger, use_ssl=not args.plain
+            )
+            await client.connect(retries=1)
+            receiver = asyncio.create_task(app.receive_data(client, pipeline, shutdown_event, CommandManager(logger)))
+            await simulator.wait_subscribed()
+
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            if args.replay:
+                await simulator.replay(args.replay, args.speed)
+            else:
+                await simulator.send_events(args.events, args.batch, args.rate)
+            # все разосланные пакеты приняты, переданы в конвейер и сохранены
+            while client.frames_received < simulator.frames_sent or pipeline.stats()["submitted"] < client.frames_received:
+                await asyncio.sleep(0.001)
+            await pipeline.persist_queue.join()
+            elapsed = time.perf_counter() - started
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            shutdown_event.set()
+            await client.close()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+        return {
+            "events": db.rows,
+            "elapsed": elapsed,
+            "p50": percentile(db.latencies, 0.5),
+            "p99": percentile(db.latencies, 0.99),
+            "rss_growth_mb": (rss_after - rss_before) / 1024,
+            "rss_mb": rss_after / 1024,
+            "published": producer.published,
+        }
+    finally:
+        if certs is not None:
+            shutil.rmtree(certs, ignore_errors=True)
+
+
+async def run_offline(args, logger) -> dict:
+    """Пакеты из записи подаются в receive_data напрямую (CaptureReplayClient), без симулятора и сокета."""
+    db = StubDB({}, args.db_latency / 1000)  # время отправки пакетов неизвестно: задержка не считается
+    producer = StubProducer()
+
+    async with EventPipeline(db, producer, logger, directory=StubDirectory()) as pipeline:
+        client = CaptureReplayClient(args.replay, logger)
+        await client.connect()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        try:
+            await app.receive_data(client, pipeline, asyncio.Event(), CommandManager(logger))
+        except ConnectionError:
+            pass  # запись закончилась
+        await pipeline.persist_queue.join()
+        elapsed = time.perf_counter() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        "events": db.rows,
+        "elapsed": elapsed,
+        "p50": None,
+        "p99": None,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+        "rss_mb": rss_after / 1024,
+        "published": producer.published,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000, help="количество событий")
+    parser.add_argument("--batch", type=int, default=50, help="событий в пакете")
+    parser.add_argument("--rate", type=float, default=0.0, help="пакетов в секунду (0 — без ограничения)")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="задержка вставки в БД, мс")
+    parser.add_argument("--replay", help="вместо генерации воспроизвести запись трафика")
+    parser.add_argument("--speed", type=float, default=0.0, help="ускорение воспроизведения (0 — без пауз)")
+    parser.add_argument("--plain", action="store_true", help="без TLS")
+    parser.add_argument("--offline", action="store_true", help="с --replay: без симулятора и сети")
+    parser.add_argument("--enriched", action="store_true", help="публиковать события с именами (RMQ_EVENTS_ENRICHED)")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logging.getLogger("pacs_tcp_client").setLevel(logging.ERROR)
+    settings.SPOOL_DIR = ""
+    settings.RMQ_EVENTS_ENRICHED = args.enriched
+
+    result = asyncio.run(run(args, logger))
+    print(f"{'events':>10}{'events/s':>12}{'p50, ms':>10}{'p99, ms':>10}{'RSS, MB':>10}{'RSS +, MB':>11}")
+    # у воспроизведённой записи нет времени отправки пакетов симулятором — задержка не считается
+    p50, p99 = (f"{result[key] * 1000:.2f}" if result[key] is not None else "-" for key in ("p50", "p99"))
+    print(
+        f"{result['events']:>10}{result['events'] / result['elapsed']:>12.0f}{p50:>10}{p99:>10}"
+        f"{result['rss_mb']:>10.1f}{result['rss_growth_mb']:>11.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
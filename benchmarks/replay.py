@@ -0,0 +1,55 @@
+"""
+Воспроизведение записи трафика контроллера без сети — для benchmarks.bench_e2e --offline.
+"""
+import asyncio
+
+from core.tcpclient import FRAME_HEADER_SIZE, TcpClient
+from utils.capture import INBOUND, read_capture
+
+
+class CaptureReplayClient(TcpClient):
+    """
+    Клиент без сети: принимает пакеты контроллера из записи трафика.
+
+    Пакеты отдаются подряд, без пауз записи, поэтому тот же receive_data
+    и конвейер обрабатывают реальный поток так быстро, как могут, и
+    одинаково при каждом запуске. Отправленные пакеты только считаются.
+    Когда запись закончилась, receive_frame сообщает о разрыве соединения.
+    """
+    def __init__(self, path: str, logger):
+        """
+        :param path: файл записи (utils.capture)
+        :param logger:
+        """
+        super().__init__("replay", 0, "", "", "", logger, use_ssl=False)
+        self.path = path
+        self._frames = None
+
+    @property
+    def connected(self) -> bool:
+        return self._frames is not None
+
+    async def connect(self, retries: int = 5, delay: int = 5, timeout: float = 10.0):
+        self._frames = (payload for _, direction, payload in read_capture(self.path) if direction == INBOUND)
+        self.logger.info("Воспроизведение записи трафика %s", self.path)
+
+    async def send(self, data: bytes):
+        if not self.connected:
+            raise ConnectionError("Не подключено")
+        self.bytes_sent += len(data)
+
+    async def receive_frame(self, idle_timeout: float | None = None) -> bytes | None:
+        if self._frames is None:
+            raise ConnectionError("Не подключено")
+        payload = next(self._frames, None)
+        if payload is None:
+            self._frames = None
+            raise ConnectionError("Запись трафика воспроизведена")
+        self.frames_received += 1
+        self.bytes_received += FRAME_HEADER_SIZE + len(payload)
+        # receive_data не должен монополизировать цикл: у сети между пакетами есть точки переключения
+        await asyncio.sleep(0)
+        return payload
+
+    async def disconnect(self):
+        self._frames = None
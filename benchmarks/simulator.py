@@ -0,0 +1,328 @@
+"""
+Симулятор контроллера Revers 8000 для нагрузочного тестирования без СКУД.
+
+TLS (или обычный TCP) сервер asyncio, говорящий на протоколе контроллера:
+пакет — 4 байта длины (little-endian) и JSON. Поддерживаются команды
+filterevents, ping, aplist, userlist и addcard/editcard/loadcard/delcard
+с настраиваемым ErrCode. Поток событий генерируется или воспроизводится
+из записи трафика (utils.capture) с ускорением в N раз.
+
+Запуск из корня репозитория (клиент подключается к TCP_SERVER_HOST:TCP_SERVER_PORT):
+
+    python -m benchmarks.simulator --port 9000 --cert certs/cert.pem --key certs/key.pem \\
+        [--events 10000 --batch 50 --rate 200] [--replay capture.bin --speed 10] \\
+        [--errcode delcard=10] [--record capture.bin]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import ssl
+import time
+from datetime import datetime, timedelta
+
+from utils import codec
+from utils.capture import INBOUND, OUTBOUND, read_capture, write_header, write_record
+
+FRAME_HEADER_SIZE = 4
+CARD_COMMANDS = ("addcard", "editcard", "loadcard", "delcard")
+
+
+def server_ssl_context(cert: str, key: str) -> ssl.SSLContext:
+    """SSLContext сервера; сертификат клиента проверяется тем же сертификатом, если клиент его предъявил."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile=cert, keyfile=key)
+    context.load_verify_locations(cert)
+    context.verify_mode = ssl.CERT_OPTIONAL
+    return context
+
+
+def encode(message: dict | bytes) -> bytes:
+    data = message if isinstance(message, bytes) else codec.dumps(message)
+    return len(data).to_bytes(FRAME_HEADER_SIZE, "little") + data
+
+
+class ControllerSimulator:
+    """
+    Контроллер Revers 8000 в одном процессе с тестируемым кодом.
+
+    События рассылаются всем подключённым клиентам, запросившим их
+    командой filterevents. Номер карты события — "<номер пакета>.<номер
+    в пакете>", а время отправки пакета хранится в `sent_at`, поэтому
+    по сохранённому событию можно посчитать задержку приёма.
+    """
+    def __init__(
+        self,
+        logger,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ssl_context: ssl.SSLContext | None = None,
+        access_points: int = 64,
+        card_owners: int = 1000,
+        err_codes: dict[str, int] | None = None,
+        reply_latency: float = 0.0,
+        record: str | None = None
+    ):
+        """
+        :param logger:
+        :param host: адрес прослушивания
+        :param port: порт (0 — любой свободный, см. `port` после start)
+        :param ssl_context: контекст TLS сервера (None — без TLS)
+        :param access_points: размер ответа на aplist
+        :param card_owners: размер ответа на userlist
+        :param err_codes: ErrCode ответа для команд карт, по умолчанию 0
+        :param reply_latency: задержка ответа на команды карт (сек)
+        :param record: файл для записи трафика (utils.capture)
+        """
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.access_points = access_points
+        self.card_owners = card_owners
+        self.err_codes = err_codes or {}
+        self.reply_latency = reply_latency
+        self.record = record
+
+        self._server: asyncio.AbstractServer | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._subscribed: set[asyncio.StreamWriter] = set()
+        self._handlers: set[asyncio.Task] = set()
+        self._subscribed_event = asyncio.Event()
+        self._capture = None
+        self._capture_started = 0.0
+        self._seq = 0
+        self._base_time = datetime.now().replace(microsecond=0)
+
+        self.sent_at: dict[int, float] = {}
+        self.commands: dict[str, int] = {}
+        self.events_sent = 0
+        self.frames_sent = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        if self.record:
+            self._capture = open(self.record, "wb")
+            write_header(self._capture)
+            self._capture_started = time.monotonic()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.logger.info(
+            "Симулятор контроллера слушает %s:%s (%s)", self.host, self.port, "TLS" if self.ssl_context else "TCP"
+        )
+
+    async def stop(self):
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._capture is not None:
+            self._capture.close()
+            self._capture = None
+
+    async def wait_subscribed(self, clients: int = 1):
+        """Ждёт, пока `clients` клиентов запросят события командой filterevents."""
+        while len(self._subscribed) < clients:
+            self._subscribed_event.clear()
+            await self._subscribed_event.wait()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER_SIZE)
+                payload = await reader.readexactly(int.from_bytes(header, "little"))
+                self._record(OUTBOUND, payload)
+                await self._dispatch(writer, codec.loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            self._clients.discard(writer)
+            self._subscribed.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, message: dict):
+        command = message.get("Command")
+        self.commands[command] = self.commands.get(command, 0) + 1
+        match command:
+            case "filterevents":
+                self._subscribed.add(writer)
+                self._subscribed_event.set()
+            case "ping":
+                pass  # ответ клиента на наш ping
+            case "aplist":
+                await self._send(writer, {"Command": "aplist", "Data": [
+                    {"Id": i, "Name": f"Точка доступа {i}"} for i in range(1, self.access_points + 1)
+                ]})
+            case "userlist":
+                await self._send(writer, {"Command": "userlist", "Data": [
+                    {"Id": i, "FirstName": f"Имя{i}", "SecondName": f"Отчество{i}", "LastName": f"Фамилия{i}"}
+                    for i in range(1, self.card_owners + 1)
+                ]})
+            case command if command in CARD_COMMANDS:
+                reply = {"Command": command, "Id": message.get("Id"), "ErrCode": self.err_codes.get(command, 0)}
+                if self.reply_latency:
+                    asyncio.get_running_loop().call_later(
+                        self.reply_latency, lambda: asyncio.ensure_future(self._send(writer, reply))
+                    )
+                else:
+                    await self._send(writer, reply)
+            case _:
+                self.logger.debug("Симулятор: неизвестная команда %s", command)
+
+    async def _send(self, writer: asyncio.StreamWriter, message: dict | bytes):
+        if writer.is_closing():
+            return
+        data = message if isinstance(message, bytes) else codec.dumps(message)
+        self._record(INBOUND, data)
+        writer.write(encode(data))
+        self.frames_sent += 1
+        await writer.drain()
+
+    async def broadcast(self, message: dict | bytes):
+        """Отправить пакет всем клиентам, запросившим события."""
+        for writer in list(self._subscribed):
+            await self._send(writer, message)
+
+    def _record(self, direction: int, payload: bytes):
+        if self._capture is not None:
+            write_record(self._capture, time.monotonic() - self._capture_started, direction, payload)
+
+    def make_events_frame(self, batch_size: int) -> dict:
+        """Очередной пакет events из `batch_size` событий прохода."""
+        self._seq += 1
+        seq = self._seq
+        ev_time = (self._base_time + timedelta(seconds=seq)).strftime("%d.%m.%Y %H:%M:%S")
+        return {"Command": "events", "Data": [
+            {
+                "EvTime": ev_time,
+                "EvAddr": random.randint(1, self.access_points),
+                "EvUser": random.randint(0, self.card_owners),
+                "EvCard": f"{seq}.{i}",
+                "EvCode": random.choice((1, 2, 17)),
+            }
+            for i in range(batch_size)
+        ]}
+
+    async def send_events(self, count: int, batch_size: int = 50, rate: float = 0.0):
+        """
+        Разослать `count` событий пакетами по `batch_size`.
+
+        :param rate: пакетов в секунду (0 — так быстро, как клиенты успевают читать)
+        """
+        started = time.monotonic()
+        sent = 0
+        frames = 0
+        while sent < count:
+            frame = self.make_events_frame(min(batch_size, count - sent))
+            self.sent_at[self._seq] = time.perf_counter()
+            await self.broadcast(frame)
+            sent += len(frame["Data"])
+            frames += 1
+            if rate:
+                delay = started + frames / rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        self.events_sent += sent
+
+    async def ping(self):
+        await self.broadcast({"Command": "ping", "Id": 1, "Version": 1})
+
+    async def replay(self, path: str, speed: float = 1.0) -> int:
+        """
+        Воспроизвести пакеты контроллера из записи трафика.
+
+        Ответы на команды карт (они зависят от Id запросов клиента) не
+        воспроизводятся — их формирует сам симулятор.
+
+        :param path: файл записи (utils.capture)
+        :param speed: ускорение относительно записи (0 — без пауз)
+        :return: количество отправленных пакетов
+        """
+        started = time.monotonic()
+        first = None
+        frames = 0
+        for timestamp, direction, payload in read_capture(path):
+            if direction != INBOUND:
+                continue
+            if codec.loads(payload).get("Command") in CARD_COMMANDS:
+                continue
+            first = timestamp if first is None else first
+            if speed:
+                delay = started + (timestamp - first) / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.broadcast(payload)
+            frames += 1
+        return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--cert", help="сертификат сервера (без --cert — обычный TCP)")
+    parser.add_argument("--key", help="ключ сертификата")
+    parser.add_argument("--events", type=int, default=0, help="сколько событий разослать после подключения клиента")
+    parser.add_argument("--batch", type=int, default=50, help="событий в пакете")
+    parser.add_argument("--rate", type=float, default=0.0, help="пакетов в секунду (0 — без ограничения)")
+    parser.add_argument("--replay", help="воспроизвести запись трафика")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение воспроизведения (0 — без пауз)")
+    parser.add_argument("--errcode", action="append", default=[], help="ErrCode команды, например delcard=10")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа на команды карт, мс")
+    parser.add_argument("--ping", type=float, default=0.0, help="период ping, сек (0 — не отправлять)")
+    parser.add_argument("--record", help="записать трафик в файл")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] - %(message)s")
+    logger = logging.getLogger("simulator")
+    err_codes = {name: int(code) for name, _, code in (item.partition("=") for item in args.errcode)}
+
+    async def run():
+        simulator = ControllerSimulator(
+            logger,
+            args.host,
+            args.port,
+            server_ssl_context(args.cert, args.key) if args.cert else None,
+            err_codes=err_codes,
+            reply_latency=args.latency / 1000,
+            record=args.record
+        )
+        async with simulator:
+            if args.ping:
+                async def _ping():
+                    while True:
+                        await asyncio.sleep(args.ping)
+                        await simulator.ping()
+                asyncio.create_task(_ping())
+            await simulator.wait_subscribed()
+            if args.replay:
+                frames = await simulator.replay(args.replay, args.speed)
+                logger.info("Воспроизведено пакетов: %s", frames)
+            if args.events:
+                started = time.perf_counter()
+                await simulator.send_events(args.events, args.batch, args.rate)
+                elapsed = time.perf_counter() - started
+                logger.info("Разослано событий: %s за %.2f сек", args.events, elapsed)
+            await asyncio.Event().wait()  # до Ctrl+C
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,217 @@
-from datetime import datetime
+import asyncio
+import heapq
+import inspect
+import time
+from typing import Awaitable, Callable
+
+from core.models import PendingCommand
+from core.settings import settings
+
+# Причины, по которым команда снимается без ответа контроллера
+TIMEOUT = "timeout"
+EVICTED = "evicted"
+
+TimeoutCallback = Callable[[PendingCommand, str], Awaitable[None] | None]
 
 
 class CommandManager:
-    def __init__(self, logger):
-        self._pending = {}
+    """
+    Хранилище команд PACS, ожидающих ответа контроллера.
+
+    Команды индексируются по Id (event_id) и по номеру карты. Каждая
+    команда живёт не дольше ttl секунд с момента добавления или последней
+    смены стадии: просроченные команды снимаются фоновой задачей по куче
+    сроков и передаются в on_timeout, который может повторить команду или
+    сообщить о сбое. Число одновременно ожидающих команд ограничено
+    capacity — при переполнении вытесняется самая старая.
+    """
+    def __init__(
+        self,
+        logger,
+        ttl: float | None = None,
+        capacity: int | None = None,
+        on_timeout: TimeoutCallback | None = None,
+        sweep_interval: float = 1.0
+    ):
+        """
+        :param logger:
+        :param ttl: сколько ждать ответа на команду (сек)
+        :param capacity: максимум одновременно ожидающих команд
+        :param on_timeout: callback(command, reason) для просроченных (TIMEOUT) и вытесненных (EVICTED) команд
+        :param sweep_interval: период проверки сроков (сек)
+        """
+        self._pending: dict[int, PendingCommand] = {}
+        self._by_card: dict[int, int] = {}
+        self._deadlines: list[tuple[float, int]] = []
         self.logger = logger
+        self.ttl = ttl or settings.COMMAND_TTL
+        self.capacity = capacity or settings.COMMAND_CAPACITY
+        self.on_timeout = on_timeout
+        self.sweep_interval = sweep_interval
+        self._task: asyncio.Task | None = None
+        self._callbacks: set[asyncio.Task] = set()
+        self.timeouts = 0
+        self.evictions = 0
 
-    def add(self, event_id: int, card_number: int, event_type: str, stage: str):
-        self._pending[event_id] = {
-            "card_number": card_number,
-            "event_type": event_type,
-            "stage": stage,
-            "created_at": datetime.now()
-        }
+    def __repr__(self):
+        return f"CommandManager(pending={len(self._pending)}, ttl={self.ttl}, capacity={self.capacity})"
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def start(self):
+        """Запускает фоновую проверку сроков."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper(), name="command-manager-sweeper")
+
+    async def stop(self):
+        """Останавливает фоновую проверку сроков."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._callbacks, return_exceptions=True)
+
+    def add(self, event_id: int, card_number: int, event_type: str, stage: str, attempts: int = 0) -> bool:
+        """
+        Регистрирует команду, ожидающую ответа.
+
+        Если для той же карты уже ожидается команда того же типа, новая
+        считается дубликатом и не регистрируется. Команда другого типа
+        (например, wdraw после issue) заменяет ожидающую.
+
+        :return: False, если команда — дубликат и отправлять её не нужно
+        """
+        existing_id = self._by_card.get(card_number)
+        if existing_id is not None and existing_id != event_id:
+            existing = self._pending[existing_id]
+            if existing.event_type == event_type:
+                self.logger.warning(
+                    "Команда %s для карты %s уже ожидает ответа (event_id=%s), event_id=%s пропущен",
+                    event_type, card_number, existing_id, event_id
+                )
+                return False
+            self.logger.info(
+                "Команда %s (event_id=%s) заменяет ожидающую %s (event_id=%s) для карты %s",
+                event_type, event_id, existing.event_type, existing_id, card_number
+            )
+            self.remove(existing_id)
 
-    def get(self, event_id: int):
+        self.remove(event_id)
+        while len(self._pending) >= self.capacity:
+            self._evict_oldest()
+
+        command = PendingCommand(
+            event_id=event_id,
+            card_number=card_number,
+            event_type=event_type,
+            stage=stage,
+            attempts=attempts
+        )
+        self._pending[event_id] = command
+        self._by_card[card_number] = event_id
+        self._refresh_deadline(command)
+        return True
+
+    def get(self, event_id: int) -> PendingCommand | None:
         return self._pending.get(event_id)
 
+    def get_by_card(self, card_number: int) -> PendingCommand | None:
+        """Ожидающая команда для карты."""
+        event_id = self._by_card.get(card_number)
+        return self._pending.get(event_id) if event_id is not None else None
+
     def update_stage(self, event_id: int, stage: str):
-        if event_id in self._pending:
-            self._pending[event_id]["stage"] = stage
+        """Переводит команду на следующую стадию и продлевает срок ожидания."""
+        command = self._pending.get(event_id)
+        if command is not None:
+            command.stage = stage
+            self._refresh_deadline(command)
 
-    def remove(self, event_id: int):
-        if event_id in self._pending:
-            self.logger.debug(f"Удаление ожидающей команды для event_id={event_id}")
-            self._pending.pop(event_id, None)
+    def remove(self, event_id: int) -> PendingCommand | None:
+        command = self._pending.pop(event_id, None)
+        if command is not None:
+            self.logger.debug("Удаление ожидающей команды для event_id=%s", event_id)
+            if self._by_card.get(command.card_number) == event_id:
+                del self._by_card[command.card_number]
+        return command
 
     def all(self):
         return self._pending
+
+    def expire(self, now: float | None = None) -> list[PendingCommand]:
+        """
+        Снимает команды с истёкшим сроком ожидания.
+
+        :param now: текущее time.monotonic()
+        :return: просроченные команды
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, event_id = heapq.heappop(self._deadlines)
+            command = self._pending.get(event_id)
+            # запись устарела: команда уже снята или её срок продлён
+            if command is None or command.deadline != deadline:
+                continue
+            self.remove(event_id)
+            expired.append(command)
+        return expired
+
+    def stats(self) -> dict:
+        """Число ожидающих команд, возраст самой старой (сек) и счётчики снятых без ответа."""
+        oldest = min((command.created_at for command in self._pending.values()), default=None)
+        return {
+            "pending": len(self._pending),
+            "oldest_age_seconds": (time.time() - oldest.timestamp()) if oldest else 0.0,
+            "timeouts": self.timeouts,
+            "evictions": self.evictions,
+        }
+
+    def _refresh_deadline(self, command: PendingCommand):
+        command.deadline = time.monotonic() + self.ttl
+        heapq.heappush(self._deadlines, (command.deadline, command.event_id))
+
+    def _evict_oldest(self):
+        while self._deadlines:
+            deadline, event_id = heapq.heappop(self._deadlines)
+            command = self._pending.get(event_id)
+            if command is not None and command.deadline == deadline:
+                self.remove(event_id)
+                self.evictions += 1
+                self.logger.warning(
+                    "Превышен лимит ожидающих команд (%d), вытеснена event_id=%s", self.capacity, event_id
+                )
+                self._notify(command, EVICTED)
+                return
+
+    def _notify(self, command: PendingCommand, reason: str):
+        if self.on_timeout is None:
+            return
+        try:
+            result = self.on_timeout(command, reason)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._callbacks.add(task)
+                task.add_done_callback(self._callback_done)
+        except Exception as e:
+            self.logger.error("Ошибка обработки просроченной команды event_id=%s: %s", command.event_id, e)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._callbacks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Ошибка обработки просроченной команды: %s", task.exception())
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            for command in self.expire():
+                self.timeouts += 1
+                self.logger.warning(
+                    "Нет ответа на %s для event_id=%s за %s сек", command.stage, command.event_id, self.ttl
+                )
+                self._notify(command, TIMEOUT)
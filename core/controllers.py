@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from core.command_manager import CommandManager
+from core.models import PendingCommand
+from core.scheduler import RetryPolicy
+from core.settings import settings
+from core.supervisor import ConnectionSupervisor
+from core.tcpclient import TcpClient
+from utils.capture import CaptureWriter
+
+
+@dataclass(frozen=True)
+class ControllerEndpoint:
+    """
+    Адрес контроллера Revers 8000.
+
+    :ivar name: имя контроллера, по которому портал адресует команды
+    :ivar host: IP или домен
+    :ivar port: TCP порт
+    """
+    name: str
+    host: str
+    port: int
+
+
+def parse_controllers(spec: str, default_host: str, default_port: int) -> list[ControllerEndpoint]:
+    """
+    Разбирает список контроллеров вида "name=host:port,name2=host2:port2".
+
+    Имя и порт необязательны: без имени контроллер называется по хосту,
+    без порта используется default_port. Пустой список — один контроллер
+    default_host:default_port с именем "default".
+
+    :raises ValueError: при повторяющихся именах или некорректном порте
+    """
+    endpoints = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, address = entry.rpartition("=")
+        host, _, port = address.partition(":")
+        endpoints.append(ControllerEndpoint(name or host, host, int(port) if port else default_port))
+
+    if not endpoints:
+        endpoints.append(ControllerEndpoint("default", default_host, default_port))
+
+    names = [endpoint.name for endpoint in endpoints]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Повторяющиеся имена контроллеров: {names}")
+    return endpoints
+
+
+class ControllerSession:
+    """Соединение с одним контроллером: TCP клиент, супервизор и его ожидающие команды."""
+    def __init__(
+        self,
+        endpoint: ControllerEndpoint,
+        client: TcpClient,
+        supervisor: ConnectionSupervisor,
+        command_manager: CommandManager
+    ):
+        self.endpoint = endpoint
+        self.client = client
+        self.supervisor = supervisor
+        self.command_manager = command_manager
+
+    @property
+    def name(self) -> str:
+        return self.endpoint.name
+
+    def stats(self) -> dict:
+        """Метрики соединения и ожидающих команд контроллера."""
+        return {
+            "address": f"{self.endpoint.host}:{self.endpoint.port}",
+            **self.supervisor.stats(),
+            "commands": self.command_manager.stats(),
+            **({"capture": self.client.capture.stats()} if self.client.capture is not None else {}),
+        }
+
+
+class ControllerRegistry:
+    """
+    Реестр контроллеров, обслуживаемых одним процессом.
+
+    Для каждого контроллера создаются свой TcpClient, супервизор
+    переподключений и CommandManager; БД, конвейер и продюсер RabbitMQ
+    общие. Команды портала адресуются контроллеру по имени, команда без
+    имени уходит контроллеру по умолчанию (первому в списке).
+    """
+    def __init__(
+        self,
+        endpoints: list[ControllerEndpoint],
+        shutdown_event: asyncio.Event,
+        logger,
+        on_timeout: Callable[[ControllerSession, PendingCommand, str], Any] | None = None,
+        default: str | None = None
+    ):
+        """
+        :param endpoints: адреса контроллеров
+        :param shutdown_event: событие остановки приложения
+        :param logger:
+        :param on_timeout: вызывается с (сессия, команда, причина) для команды, снятой без ответа
+        :param default: имя контроллера по умолчанию (по умолчанию первый из endpoints);
+                        если его нет среди endpoints, команды без имени этим реестром не обслуживаются
+        """
+        self.logger = logger
+        self.sessions: dict[str, ControllerSession] = {}
+
+        policy = RetryPolicy(
+            max_attempts=settings.RECONNECT_MAX_ATTEMPTS,
+            delay=settings.RECONNECT_DELAY,
+            backoff=settings.RECONNECT_BACKOFF,
+            max_delay=settings.RECONNECT_MAX_DELAY,
+            jitter=settings.RECONNECT_JITTER
+        )
+        started = datetime.now().strftime("%Y%m%d-%H%M%S")
+        for endpoint in endpoints:
+            capture = None
+            if settings.TCP_CAPTURE_DIR:
+                capture = CaptureWriter(os.path.join(settings.TCP_CAPTURE_DIR, f"{endpoint.name}-{started}.cap"), logger)
+            client = TcpClient(
+                host=endpoint.host,
+                port=endpoint.port,
+                server_cert=settings.TCP_SERVER_CERT,
+                server_key=settings.TCP_SERVER_KEY,
+                server_cert_cn=settings.TCP_SERVER_CERT_CN,
+                logger=logger,
+                max_frame_size=settings.TCP_MAX_FRAME_SIZE,
+                frame_timeout=settings.TCP_FRAME_TIMEOUT or None,
+                reuse_tls_session=settings.TCP_TLS_SESSION_REUSE,
+                capture=capture,
+            )
+            session = ControllerSession(
+                endpoint,
+                client,
+                ConnectionSupervisor(client, policy, shutdown_event, logger),
+                CommandManager(logger)
+            )
+            if on_timeout is not None:
+                session.command_manager.on_timeout = functools.partial(on_timeout, session)
+            self.sessions[endpoint.name] = session
+
+        self.default = self.sessions.get(default or endpoints[0].name)
+
+    async def __aenter__(self):
+        for session in self.sessions.values():
+            if session.client.capture is not None:
+                os.makedirs(settings.TCP_CAPTURE_DIR, exist_ok=True)
+                session.client.capture.open()
+            session.command_manager.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def get(self, name: str | None) -> ControllerSession | None:
+        """
+        Сессия контроллера по имени.
+
+        :param name: имя контроллера; None — контроллер по умолчанию
+        :return: сессия или None, если контроллер не обслуживается этим реестром
+        """
+        if name is None:
+            return self.default
+        return self.sessions.get(name)
+
+    async def run(self, session_loop: Callable[[ControllerSession], Awaitable[None]]):
+        """
+        Обслуживать все контроллеры одновременно, каждый — со своими переподключениями.
+
+        Контроллер, для которого исчерпан лимит переподключений, выбывает,
+        остальные продолжают работу.
+
+        :param session_loop: цикл приёма данных для подключённого контроллера
+        """
+        async def _supervise(session: ControllerSession):
+            try:
+                await session.supervisor.run(lambda client: session_loop(session))
+            except ConnectionError as e:
+                self.logger.error("Контроллер '%s' отключён: %s", session.name, e)
+
+        await asyncio.gather(*(_supervise(session) for session in self.sessions.values()))
+
+    async def close(self):
+        """Останавливает менеджеры команд и закрывает соединения."""
+        for session in self.sessions.values():
+            await session.command_manager.stop()
+            await session.client.close()
+            if session.client.capture is not None:
+                await asyncio.to_thread(session.client.capture.close)
+
+    def stats(self) -> dict:
+        """Метрики по каждому контроллеру."""
+        return {name: session.stats() for name, session in self.sessions.items()}
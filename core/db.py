@@ -1,9 +1,38 @@
-from asyncpg import create_pool, Pool
+import reprlib
+from contextlib import asynccontextmanager
+
+from asyncpg import create_pool, Pool, PostgresError
 
 # from utils.logger import get_logger
 # from celery.bin.result import result
 
 
+# Запрос и параметры в журнале ошибок: пачка событий — это массивы на сотни значений
+_QUERY_LOG_LIMIT = 200
+_args_repr = reprlib.Repr()
+_args_repr.maxlist = _args_repr.maxtuple = 5
+_args_repr.maxstring = _args_repr.maxother = 100
+
+
+def _describe(query: str, args: tuple) -> str:
+    """Сокращённые запрос и параметры для сообщения об ошибке."""
+    query = " ".join(query.split())
+    if len(query) > _QUERY_LOG_LIMIT:
+        query = query[:_QUERY_LOG_LIMIT] + "..."
+    return f"query={query}, args={_args_repr.repr(args)}"
+
+
+def is_data_error(error: Exception) -> bool:
+    """
+    Отклонила ли БД сами данные (ошибки классов 22 и 23: неверное значение,
+    нарушение ограничения), а не недоступна ли она.
+
+    Такие данные бессмысленно повторять; всё остальное (разрыв соединения,
+    перезапуск сервера, исчерпание пула) — временный сбой.
+    """
+    return isinstance(error, PostgresError) and (error.sqlstate or "")[:2] in ("22", "23")
+
+
 class DB:
     """
     Асинхронный класс для работы с PostgreSQL через пул соединений.
@@ -40,7 +69,7 @@ class DB:
                 )
                 self.logger.info("Подключение к PostgreSQL установлено")
             except Exception as e:
-                self.logger.error(f"Ошибка подключения к БД: {e}")
+                self.logger.error("Ошибка подключения к БД: %s", e)
                 raise
 
     async def execute(self, query, *args):
@@ -57,7 +86,7 @@ class DB:
             async with self.pool.acquire() as conn:
                 return await conn.execute(query, *args)
         except Exception as e:
-            self.logger.error(f"Ошибка выполнения execute: {e}, query={query}, args={args}")
+            self.logger.error("Ошибка выполнения execute: %s, %s", e, _describe(query, args))
             raise
 
     async def fetch_row(self, query, *args):
@@ -74,7 +103,7 @@ class DB:
             async with self.pool.acquire() as conn:
                 return await conn.fetchrow(query, *args)
         except Exception as e:
-            self.logger.error(f"Ошибка выполнения fetch_row: {e}, query={query}, args={args}")
+            self.logger.error("Ошибка выполнения fetch_row: %s, %s", e, _describe(query, args))
             raise
 
     async def fetch_all(self, query: str, *args):
@@ -91,7 +120,29 @@ class DB:
             async with self.pool.acquire() as conn:
                 return await conn.fetch(query, *args)
         except Exception as e:
-            self.logger.error(f"Ошибка выполнения fetch_all: {e}, query={query}, args={args}")
+            self.logger.error("Ошибка выполнения fetch_all: %s, %s", e, _describe(query, args))
+            raise
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Выдаёт соединение из пула с открытой транзакцией.
+
+        Транзакция фиксируется при выходе из блока и откатывается при исключении:
+
+            async with db.transaction() as conn:
+                await conn.execute(...)
+
+        :return: asyncpg.Connection
+        """
+        if self.pool is None:
+            await self.connect()
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    yield conn
+        except Exception as e:
+            self.logger.error("Транзакция отменена: %s", e)
             raise
 
     async def close(self):
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from typing import Iterable
+
+from core.models import PacsEvent
+from core.settings import settings
+
+
+class EventDeduplicator:
+    """
+    Отсев повторно присланных контроллером событий.
+
+    Ключ события — (EvTime, EvAddr, EvUser, EvCard, EvCode), то есть
+    PacsEvent.as_row(). Ключи недавно сохранённых событий хранятся в
+    LRU-кэше; дубликаты, вышедшие за пределы кэша, отсекает уникальный
+    индекс pacs_event и ON CONFLICT DO NOTHING.
+    """
+    def __init__(self, cache_size: int | None = None):
+        """
+        :param cache_size: сколько последних ключей хранить (LRU)
+        """
+        self.cache_size = cache_size or settings.EVENT_DEDUP_CACHE_SIZE
+
+        self._cache: OrderedDict[tuple, None] = OrderedDict()
+
+        self.duplicates = 0
+
+    def _seen(self, key: tuple) -> bool:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return True
+        return False
+
+    def filter(self, events: Iterable[PacsEvent]) -> list[PacsEvent]:
+        """
+        Отбрасывает события, уже сохранённые недавно, и повторы внутри пачки.
+
+        Ключи не запоминаются: это делает `remember` после успешной вставки,
+        чтобы события, не сохранённые из-за сбоя БД, не считались дубликатами
+        при повторе.
+
+        :return: новые события в исходном порядке
+        """
+        fresh = []
+        batch_keys = set()
+        for event in events:
+            key = event.as_row()
+            if key in batch_keys or self._seen(key):
+                self.duplicates += 1
+                continue
+            batch_keys.add(key)
+            fresh.append(event)
+        return fresh
+
+    def remember(self, events: Iterable[PacsEvent]):
+        """Запоминает ключи сохранённых событий."""
+        cache = self._cache
+        for event in events:
+            key = event.as_row()
+            cache[key] = None
+            cache.move_to_end(key)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Размер кэша и число отсеянных событий."""
+        return {
+            "cache_size": len(self._cache),
+            "duplicates": self.duplicates,
+        }
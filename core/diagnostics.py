@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from core.metrics import registry
+from core.settings import settings
+
+LOOP_LAG_SECONDS = registry.histogram(
+    "pacs_event_loop_lag_seconds", "Опоздание пробуждения таймера цикла событий"
+)
+LOOP_STALLS = registry.counter(
+    "pacs_event_loop_stalls_total", "Случаи, когда цикл событий не отвечал дольше DIAGNOSTICS_STALL_THRESHOLD"
+)
+STAGE_SECONDS = registry.histogram(
+    "pacs_stage_seconds", "Длительность стадий обработки пакета (только при DIAGNOSTICS)", ("stage",)
+)
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(stage: str):
+    """
+    Замер стадии обработки в pacs_stage_seconds{stage=...}.
+
+    При выключенной диагностике возвращает пустой контекст и ничего не
+    стоит, поэтому вызовы можно оставлять в горячих путях.
+
+    :param stage: имя стадии
+    """
+    if not settings.DIAGNOSTICS:
+        return _NO_SPAN
+    return STAGE_SECONDS.time(stage)
+
+
+class LoopMonitor:
+    """
+    Диагностика цикла событий.
+
+    Задача-сэмплер каждые `interval` сек засыпает и измеряет, насколько
+    позже положенного она проснулась: это задержка, которую испытывают все
+    корутины (в том числе чтение сокета). Сторожевой поток следит за
+    пробуждениями сэмплера: если цикл не отвечает дольше `stall_threshold`,
+    значит какой-то обратный вызов выполняется синхронно слишком долго, и
+    поток снимает стек потока цикла — по нему видно, какой код его занял.
+    Стек пишется в файл `dump_path` или в журнал.
+    """
+    def __init__(self, logger, interval: float = 0.5, stall_threshold: float = 0.5, dump_path: str | None = None):
+        """
+        :param logger:
+        :param interval: период замера задержки (сек)
+        :param stall_threshold: сколько цикл может не отвечать до снятия стека (сек)
+        :param dump_path: файл для стеков зависаний (по умолчанию — журнал)
+        """
+        self.logger = logger
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.dump_path = dump_path
+
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop_thread_id: int | None = None
+        self._heartbeat = 0.0
+
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.longest_stall = 0.0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._thread = threading.Thread(target=self._watch, name="pacs-loop-watchdog", daemon=True)
+        self._thread.start()
+        self.logger.info(
+            "Диагностика цикла событий включена: замер каждые %s сек, стек при зависании дольше %s сек",
+            self.interval, self.stall_threshold
+        )
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _sample(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self):
+        stalled_since = None
+        heartbeat = self._heartbeat
+        while not self._stop.wait(min(self.interval, self.stall_threshold) / 2):
+            if self._heartbeat != heartbeat:
+                if stalled_since is not None:
+                    duration = self._heartbeat - stalled_since
+                    self.longest_stall = max(self.longest_stall, duration)
+                    self.logger.warning("Цикл событий не отвечал %.3f сек", duration)
+                    stalled_since = None
+                heartbeat = self._heartbeat
+                continue
+            silent = time.monotonic() - heartbeat - self.interval
+            if stalled_since is None and silent > self.stall_threshold:
+                stalled_since = heartbeat + self.interval
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                self._dump_stack(silent)
+
+    def _dump_stack(self, silent: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "стек недоступен\n"
+        header = f"Цикл событий не отвечает {silent:.3f} сек, стек потока цикла:"
+        if not self.dump_path:
+            self.logger.warning("%s\n%s", header, stack)
+            return
+        try:
+            with open(self.dump_path, "a", encoding="utf-8") as f:
+                f.write(f"[{datetime.now().isoformat()}] {header}\n{stack}\n")
+        except OSError as e:
+            self.logger.warning("Не удалось записать стек зависания в %s: %s", self.dump_path, e)
+
+    def stats(self) -> dict:
+        """Задержка цикла событий (последняя и максимальная) и зависания."""
+        return {
+            "loop_lag_seconds": round(self.last_lag, 4),
+            "loop_lag_max_seconds": round(self.max_lag, 4),
+            "stalls": self.stalls,
+            "longest_stall_seconds": round(self.longest_stall, 3),
+        }
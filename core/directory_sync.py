@@ -0,0 +1,250 @@
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Callable, Iterable
+
+from core.db import DB
+from core.models import AccessPoint, CardOwner
+from core.settings import settings
+
+
+@dataclass(frozen=True)
+class DirectorySpec:
+    """
+    Описание справочной таблицы PACS.
+
+    :ivar table: имя таблицы
+    :ivar columns: колонки, кроме system_id, в порядке полей модели
+    :ivar types: типы PostgreSQL массивов для system_id и колонок (для unnest)
+    :ivar values: модель → кортеж значений колонок
+    """
+    table: str
+    columns: tuple[str, ...]
+    types: tuple[str, ...]
+    values: Callable[[object], tuple]
+
+
+ACCESS_POINTS = DirectorySpec(
+    table="public.pacs_access_point",
+    columns=("name",),
+    types=("bigint[]", "text[]"),
+    values=attrgetter("name"),
+)
+
+CARD_OWNERS = DirectorySpec(
+    table="public.pacs_card_owner",
+    columns=("firstname", "secondname", "lastname"),
+    types=("bigint[]", "text[]", "text[]", "text[]"),
+    values=attrgetter("firstname", "secondname", "lastname"),
+)
+
+
+@dataclass
+class SyncResult:
+    """Итог синхронизации справочника."""
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+
+class DirectorySync:
+    """
+    Дифференциальная синхронизация справочников PACS (aplist, userlist).
+
+    Для каждой таблицы в памяти хранится хэш содержимого строки по system_id.
+    Входящий список сравнивается с ним, и в БД в одной транзакции уходят
+    только новые и изменённые строки; повторная выгрузка без изменений
+    не пишет в Postgres ничего. При первом обращении хэши строятся по
+    текущему содержимому таблицы.
+
+    С keep_names хранятся и сами значения строк: по ним публикуемые события
+    дополняются названием точки доступа и именем владельца карты без
+    запроса к БД (см. access_point_name, card_owner).
+    """
+    def __init__(
+        self,
+        db: DB,
+        logger,
+        delete_missing: bool | None = None,
+        copy_threshold: int | None = None,
+        keep_names: bool | None = None
+    ):
+        """
+        :param db: подключение к Postgres
+        :param logger:
+        :param delete_missing: удалять ли записи, которых больше нет в выгрузке контроллера
+        :param copy_threshold: с какого числа изменённых строк загружать их через COPY
+        :param keep_names: хранить значения строк в памяти (по умолчанию — если включён RMQ_EVENTS_ENRICHED)
+        """
+        self.db = db
+        self.logger = logger
+        self.delete_missing = settings.SYNC_DELETE_MISSING if delete_missing is None else delete_missing
+        self.copy_threshold = copy_threshold or settings.SYNC_COPY_THRESHOLD
+        self.keep_names = settings.RMQ_EVENTS_ENRICHED if keep_names is None else keep_names
+        self._hashes: dict[str, dict[int, int]] = {}
+        self._values: dict[str, dict[int, tuple]] = {}
+
+    async def sync_access_points(self, access_points: list[AccessPoint]) -> SyncResult:
+        """Синхронизирует pacs_access_point с выгрузкой aplist."""
+        return await self._sync(ACCESS_POINTS, access_points)
+
+    async def sync_card_owners(self, card_owners: list[CardOwner]) -> SyncResult:
+        """Синхронизирует pacs_card_owner с выгрузкой userlist."""
+        return await self._sync(CARD_OWNERS, card_owners)
+
+    async def warm(self):
+        """
+        Загружает справочники из БД, если они ещё не загружены, — чтобы имена
+        были известны до первой выгрузки aplist/userlist от контроллера.
+        """
+        for spec in (ACCESS_POINTS, CARD_OWNERS):
+            try:
+                await self._load_hashes(spec)
+            except Exception as e:
+                self.logger.warning("Не удалось загрузить %s: %s", spec.table, e)
+
+    def access_point_name(self, system_id: int) -> str | None:
+        """Название точки доступа или None, если она неизвестна."""
+        values = self._values.get(ACCESS_POINTS.table, {}).get(system_id)
+        return values[0] if values is not None else None
+
+    def card_owner(self, system_id: int) -> tuple[str, str, str] | None:
+        """(firstname, secondname, lastname) владельца карты или None, если он неизвестен."""
+        return self._values.get(CARD_OWNERS.table, {}).get(system_id)
+
+    def invalidate(self, spec: DirectorySpec | None = None):
+        """
+        Сбрасывает хэши (все или одной таблицы) — при следующей синхронизации
+        они будут перечитаны из БД. Значения строк остаются до перечитывания.
+        """
+        if spec is None:
+            self._hashes.clear()
+        else:
+            self._hashes.pop(spec.table, None)
+
+    @staticmethod
+    def _row_values(spec: DirectorySpec, item) -> tuple:
+        values = spec.values(item)
+        return values if isinstance(values, tuple) else (values,)
+
+    async def _load_hashes(self, spec: DirectorySpec) -> dict[int, int]:
+        hashes = self._hashes.get(spec.table)
+        if hashes is None:
+            records = await self.db.fetch_all(
+                f"SELECT system_id, {', '.join(spec.columns)} FROM {spec.table}"
+            )
+            hashes = {}
+            stored = {} if self.keep_names else None
+            for record in records:
+                values = tuple(record)
+                hashes[values[0]] = hash(values[1:])
+                if stored is not None:
+                    stored[values[0]] = values[1:]
+            self._hashes[spec.table] = hashes
+            if stored is not None:
+                self._values[spec.table] = stored
+        return hashes
+
+    async def _sync(self, spec: DirectorySpec, items: Iterable) -> SyncResult:
+        result = SyncResult()
+        try:
+            hashes = await self._load_hashes(spec)
+        except Exception as e:
+            self.logger.error("Не удалось прочитать %s для синхронизации: %s", spec.table, e)
+            return result
+
+        incoming: dict[int, tuple] = {}
+        for item in items:
+            incoming[item.system_id] = self._row_values(spec, item)
+
+        changed = {}
+        for system_id, values in incoming.items():
+            known = hashes.get(system_id)
+            if known is None:
+                result.inserted += 1
+            elif known != hash(values):
+                result.updated += 1
+            else:
+                result.unchanged += 1
+                continue
+            changed[system_id] = values
+
+        # пустая выгрузка скорее означает сбой на стороне контроллера, чем пустой справочник
+        missing = [system_id for system_id in hashes if system_id not in incoming] \
+            if self.delete_missing and incoming else []
+
+        try:
+            await self._apply(spec, changed, missing)
+        except Exception as e:
+            self.logger.error("Не удалось синхронизировать %s: %s", spec.table, e)
+            self.invalidate(spec)
+            return SyncResult()
+
+        stored = self._values.get(spec.table) if self.keep_names else None
+        for system_id, values in changed.items():
+            hashes[system_id] = hash(values)
+            if stored is not None:
+                stored[system_id] = values
+        for system_id in missing:
+            hashes.pop(system_id, None)
+            if stored is not None:
+                stored.pop(system_id, None)
+        result.deleted = len(missing)
+
+        self.logger.info(
+            "Синхронизация %s: добавлено %s, обновлено %s, удалено %s, без изменений %s",
+            spec.table, result.inserted, result.updated, result.deleted, result.unchanged
+        )
+        return result
+
+    async def _apply(self, spec: DirectorySpec, changed: dict[int, tuple], missing: list[int]):
+        """
+        Применяет изменения в одной транзакции, чтобы читатели не видели
+        наполовину загруженный справочник.
+
+        Небольшие изменения уходят одним INSERT ... SELECT FROM unnest(...),
+        крупные (например, первая загрузка в пустую БД) — через COPY во
+        временную таблицу и один INSERT ... SELECT ... ON CONFLICT из неё.
+        """
+        if not changed and not missing:
+            return
+
+        columns = ("system_id",) + spec.columns
+        column_list = ", ".join(columns)
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in spec.columns)
+
+        async with self.db.transaction() as conn:
+            if len(changed) >= self.copy_threshold:
+                staging = "_sync_" + spec.table.rsplit(".", 1)[-1]
+                await conn.execute(
+                    f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                    f"SELECT {column_list} FROM {spec.table} WITH NO DATA"
+                )
+                await conn.copy_records_to_table(
+                    staging,
+                    records=[(system_id, *values) for system_id, values in changed.items()],
+                    columns=columns
+                )
+                await conn.execute(
+                    f"""
+                    INSERT INTO {spec.table}({column_list})
+                    SELECT {column_list} FROM {staging}
+                    ON CONFLICT (system_id) DO UPDATE SET {updates}
+                    """
+                )
+            elif changed:
+                arrays = [list(changed)] + [list(column) for column in zip(*changed.values())]
+                unnest = ", ".join(f"${i + 1}::{array_type}" for i, array_type in enumerate(spec.types))
+                await conn.execute(
+                    f"""
+                    INSERT INTO {spec.table}({column_list})
+                    SELECT * FROM unnest({unnest})
+                    ON CONFLICT (system_id) DO UPDATE SET {updates}
+                    """,
+                    *arrays
+                )
+            if missing:
+                await conn.execute(
+                    f"DELETE FROM {spec.table} WHERE system_id = ANY($1::bigint[])",
+                    missing
+                )
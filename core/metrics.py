@@ -0,0 +1,279 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+# Границы корзин гистограмм задержек по умолчанию (сек)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метрика, вычисляемая при запросе: (имя, тип, описание, метки, значение)
+Sample = tuple[str, str, str, dict, float]
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_values())
+        return lines
+
+    def _render_values(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _render_values(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Значение, которое может как расти, так и уменьшаться."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def _render_values(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма значений (обычно задержек) с фиксированными корзинами."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки → [счётчики по корзинам (+Inf последней), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Измеряет длительность блока `with`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _render_values(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик в текстовом формате Prometheus.
+
+    Счётчики и гистограммы горячих путей обновляются на месте; метрики,
+    которые уже есть в stats() компонентов (очереди, переподключения,
+    ожидающие команды), снимаются коллекторами только при запросе.
+    """
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """
+        Добавляет коллектор — функцию, возвращающую метрики на момент запроса.
+
+        :param collector: функция без аргументов → [(имя, тип, описание, метки, значение), ...]
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        collected: dict[str, tuple[str, str, list]] = {}
+        for collector in self._collectors:
+            for name, kind, documentation, labels, value in collector():
+                collected.setdefault(name, (kind, documentation, []))[2].append((labels, value))
+        for name, (kind, documentation, values) in collected.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Минимальный HTTP-сервер, отдающий метрики по GET /metrics.
+
+    Работает в том же цикле событий, что и клиент, и не требует
+    дополнительных зависимостей. Если порт занят или адрес недоступен,
+    ошибка пишется в журнал, а сервис продолжает работу без метрик.
+    """
+    def __init__(self, registry: MetricsRegistry, host: str, port: int, logger):
+        """
+        :param registry: реестр метрик
+        :param host: адрес прослушивания
+        :param port: порт прослушивания
+        :param logger:
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self._server: asyncio.AbstractServer | None = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            self.logger.error("Не удалось открыть порт метрик %s:%s, метрики отключены: %s", self.host, self.port, e)
+            return
+        self.logger.info("Метрики доступны на http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            self.logger.debug("Запрос метрик прерван: %s", e)
+        finally:
+            writer.close()
+
+
+def samples_from_stats(prefix: str, stats: dict, labels: dict, counters: Iterable[str] = ()) -> list[Sample]:
+    """
+    Превращает словарь stats() компонента в метрики коллектора.
+
+    Числовые значения становятся метриками `<prefix>_<ключ>`, вложенные
+    словари разворачиваются с префиксом ключа, остальные значения
+    пропускаются.
+
+    :param prefix: префикс имён метрик
+    :param stats: результат stats()
+    :param labels: метки всех метрик (например, {"controller": "main"})
+    :param counters: ключи, которые являются счётчиками (остальные — gauge)
+    """
+    counters = set(counters)
+    samples = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            samples.extend(samples_from_stats(f"{prefix}_{key}", value, labels, counters))
+        elif isinstance(value, (int, float)):
+            kind = "counter" if key in counters else "gauge"
+            name = f"{prefix}_{key}_total" if kind == "counter" else f"{prefix}_{key}"
+            samples.append((name, kind, key.replace("_", " "), labels, float(value)))
+    return samples
+
+
+registry = MetricsRegistry()
+
+# Метрики горячих путей
+FRAMES_RECEIVED = registry.counter(
+    "pacs_frames_received_total", "Принятые от контроллера пакеты по полю Command", ("command",)
+)
+FRAME_DECODE_SECONDS = registry.histogram(
+    "pacs_frame_decode_seconds", "Разбор пакета: JSON и проверка моделей", ("command",)
+)
+RECEIVE_LOOP_SECONDS = registry.histogram(
+    "pacs_receive_loop_lag_seconds", "Задержка цикла приёма: от получения пакета до готовности читать следующий"
+)
+DB_INSERT_SECONDS = registry.histogram("pacs_db_insert_seconds", "Вставка пачки событий в Postgres")
+PUBLISH_SECONDS = registry.histogram("pacs_rmq_publish_seconds", "Публикация пачки сообщений в RabbitMQ")
@@ -0,0 +1,161 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Tuple, TypeVar
+
+from utils.timeutils import parse_datetime
+
+
+class ModelValidationError(ValueError):
+    """Данные пакета PACS не соответствуют ожидаемой модели."""
+
+
+def _require_int(raw: dict, key: str, allow_none: bool = False) -> int | None:
+    value = raw.get(key)
+    if value is None and allow_none:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ModelValidationError(f"поле {key} должно быть целым числом, получено {value!r}")
+    return value
+
+
+def _require_str(raw: dict, key: str) -> str:
+    value = raw.get(key)
+    if not isinstance(value, str):
+        raise ModelValidationError(f"поле {key} должно быть строкой, получено {value!r}")
+    return value
+
+
+@dataclass(slots=True)
+class PacsEvent:
+    """Событие прохода/тревоги из пакета events."""
+    created: datetime
+    ap_id: int
+    owner_id: int | None
+    card_number: str | int | None
+    code: int | None
+
+    @classmethod
+    def from_wire(cls, raw: Any) -> "PacsEvent":
+        """
+        Создаёт событие из элемента events.Data.
+
+        :param raw: {"EvTime", "EvAddr", "EvUser", "EvCard", "EvCode"}
+        :raises ModelValidationError: если обязательные поля отсутствуют или некорректны
+        """
+        if not isinstance(raw, dict):
+            raise ModelValidationError("событие не является dict")
+
+        ev_time = raw.get("EvTime")
+        if not ev_time or not raw.get("EvAddr") or raw.get("EvUser") is None:
+            raise ModelValidationError("отсутствуют обязательные поля")
+        try:
+            created = parse_datetime(ev_time)
+        except (TypeError, ValueError) as e:
+            raise ModelValidationError(f"неверный EvTime: {e}") from e
+
+        ev_user = _require_int(raw, "EvUser")
+        return cls(
+            created=created,
+            ap_id=_require_int(raw, "EvAddr"),
+            owner_id=ev_user if ev_user != 0 else None,
+            card_number=raw.get("EvCard"),
+            code=_require_int(raw, "EvCode", allow_none=True),
+        )
+
+    def as_row(self) -> tuple:
+        """Параметры для INSERT в pacs_event(created, ap_id, owner_id, card_number, code)."""
+        return self.created, self.ap_id, self.owner_id, self.card_number, self.code
+
+
+@dataclass(slots=True)
+class AccessPoint:
+    """Точка доступа из пакета aplist."""
+    system_id: int
+    name: str
+
+    @classmethod
+    def from_wire(cls, raw: Any) -> "AccessPoint":
+        """
+        Создаёт точку доступа из элемента aplist.Data.
+
+        :param raw: {"Id", "Name"}
+        :raises ModelValidationError: если поля отсутствуют или некорректны
+        """
+        if not isinstance(raw, dict):
+            raise ModelValidationError("точка доступа не является dict")
+        return cls(system_id=_require_int(raw, "Id"), name=_require_str(raw, "Name"))
+
+
+@dataclass(slots=True)
+class CardOwner:
+    """Владелец карты из пакета userlist."""
+    system_id: int
+    firstname: str
+    secondname: str
+    lastname: str
+
+    @classmethod
+    def from_wire(cls, raw: Any) -> "CardOwner":
+        """
+        Создаёт владельца карты из элемента userlist.Data.
+
+        :param raw: {"Id", "FirstName", "SecondName", "LastName"}
+        :raises ModelValidationError: если поля отсутствуют или некорректны
+        """
+        if not isinstance(raw, dict):
+            raise ModelValidationError("владелец карты не является dict")
+        return cls(
+            system_id=_require_int(raw, "Id"),
+            firstname=_require_str(raw, "FirstName"),
+            secondname=_require_str(raw, "SecondName"),
+            lastname=_require_str(raw, "LastName"),
+        )
+
+
+@dataclass(slots=True)
+class PendingCommand:
+    """Команда PACS, ожидающая ответа контроллера."""
+    event_id: int
+    card_number: int
+    event_type: str
+    stage: str
+    created_at: datetime = field(default_factory=datetime.now)
+    # попытка выполнения (0 — первая), растёт при повторе по таймауту
+    attempts: int = 0
+    # срок ожидания ответа по time.monotonic()
+    deadline: float = 0.0
+
+
+Model = TypeVar("Model", PacsEvent, AccessPoint, CardOwner)
+
+# Модель элементов поля Data для пакетов со списками
+FRAME_MODELS: dict[str, type] = {
+    "events": PacsEvent,
+    "aplist": AccessPoint,
+    "userlist": CardOwner,
+}
+
+
+def decode_list(model: type[Model], data: Any) -> Tuple[List[Model], List[Tuple[int, Any, str]]]:
+    """
+    Преобразует поле Data пакета в список моделей за один проход.
+
+    Некорректные элементы не прерывают разбор, а возвращаются отдельно.
+
+    :param model: класс модели (PacsEvent, AccessPoint, CardOwner)
+    :param data: поле Data пакета
+    :return: (модели, отклонённые элементы — (индекс, элемент, причина))
+    :raises ModelValidationError: если Data не является списком
+    """
+    if not isinstance(data, list):
+        raise ModelValidationError(f"ожидался список, получен {type(data)}")
+
+    items = []
+    rejected = []
+    from_wire = model.from_wire
+    for index, raw in enumerate(data):
+        try:
+            items.append(from_wire(raw))
+        except ModelValidationError as e:
+            rejected.append((index, raw, str(e)))
+    return items, rejected
@@ -0,0 +1,403 @@
+import asyncio
+import time
+from typing import Any
+
+from core.db import DB
+from core.dedup import EventDeduplicator
+from core.metrics import DB_INSERT_SECONDS, PUBLISH_SECONDS
+from core.diagnostics import span
+from core.directory_sync import DirectorySync
+from core.models import FRAME_MODELS, decode_list
+from core.settings import settings
+from core.spool import FRAME, PUBLISH, Spool, SpoolError, SpoolFullError
+from rabbitmq.producer import RabbitMQProducer
+from utils import codec
+from utils.functions import insert_events_batch, log_rejected
+from utils.timeutils import format_datetime
+
+
+class EventPipeline:
+    """
+    Ограниченный асинхронный конвейер обработки пакетов PACS.
+
+    Цикл чтения сокета только разбирает пакеты и кладёт их в очередь,
+    а запись в Postgres и публикация в RabbitMQ выполняются отдельными
+    стадиями:
+
+        reader → persist_queue → [persist] → publish_queue → [publish]
+
+    Очереди ограничены по размеру: если стадии не успевают, `submit`
+    ожидает свободного места (backpressure), и память не растёт бесконечно.
+
+    Если задан журнал (Spool), принятый пакет записывается в него до
+    сохранения, а сохранённые, но не опубликованные сообщения — до
+    публикации. Запись подтверждается, когда стадия завершилась успешно;
+    если Postgres или RabbitMQ недоступны, запись остаётся в журнале и
+    повторно подаётся в конвейер раз в retry_interval, в том числе после
+    перезапуска сервиса. Если журнал заполнен (SPOOL_MAX_BYTES или нет
+    места на диске), пакеты обрабатываются без записи в журнал и
+    учитываются в `unspooled`: при сбое Postgres/RabbitMQ они будут потеряны.
+    """
+    def __init__(
+        self,
+        db: DB,
+        producer: RabbitMQProducer,
+        logger,
+        queue_size: int | None = None,
+        publish_queue_size: int | None = None,
+        directory: DirectorySync | None = None,
+        publish_batch_size: int | None = None,
+        batch_event_messages: bool | None = None,
+        spool: Spool | None = None,
+        retry_interval: float | None = None,
+        dedup: EventDeduplicator | None = None,
+        enrich_event_messages: bool | None = None
+    ):
+        """
+        :param db: подключение к Postgres
+        :param producer: продюсер сообщений RabbitMQ
+        :param logger:
+        :param queue_size: ёмкость очереди пакетов на сохранение
+        :param publish_queue_size: ёмкость очереди сообщений на публикацию
+        :param directory: синхронизация справочников aplist/userlist
+        :param publish_batch_size: максимум сообщений в одной пачке публикации
+        :param batch_event_messages: публиковать одно сообщение {"new_pacs_event_ids": [...]}
+                                     на пачку событий вместо сообщения на каждое событие
+        :param spool: открытый журнал пакетов; None — необработанные из-за сбоя пакеты теряются
+        :param retry_interval: как часто повторять пакеты из журнала, не обработанные из-за сбоя (сек)
+        :param dedup: отсев повторно присланных событий (по умолчанию — если включён EVENT_DEDUP)
+        :param enrich_event_messages: добавлять в сообщения сами события с названием точки доступа
+                                      и именем владельца карты (по умолчанию — RMQ_EVENTS_ENRICHED)
+        """
+        self.db = db
+        self.producer = producer
+        self.logger = logger
+        self.enrich_event_messages = (
+            settings.RMQ_EVENTS_ENRICHED if enrich_event_messages is None else enrich_event_messages
+        )
+        self.directory = directory or DirectorySync(db, logger, keep_names=self.enrich_event_messages)
+        self._directory_warmed = False
+        self.publish_batch_size = publish_batch_size or settings.RMQ_PUBLISH_BATCH_SIZE
+        self.batch_event_messages = (
+            settings.RMQ_EVENTS_BATCH_MESSAGE if batch_event_messages is None else batch_event_messages
+        )
+
+        self.spool = spool
+        self.dedup = dedup if dedup is not None or not settings.EVENT_DEDUP else EventDeduplicator()
+        self.retry_interval = retry_interval or settings.SPOOL_RETRY_INTERVAL
+        # записи журнала, ожидающие повтора, и незавершённые публикации: id → [осталось сообщений, была ошибка]
+        self._deferred: list[int] = list(spool.recovered) if spool else []
+        self._publishing: dict[int, list] = {}
+        self._next_retry = 0.0
+        self._redrive_task: asyncio.Task | None = None
+
+        self.persist_queue: asyncio.Queue = asyncio.Queue(queue_size or settings.PIPELINE_QUEUE_SIZE)
+        self.publish_queue: asyncio.Queue = asyncio.Queue(publish_queue_size or settings.PIPELINE_PUBLISH_QUEUE_SIZE)
+
+        self._tasks: list[asyncio.Task] = []
+        self._counters = {
+            "submitted": 0,
+            "persisted": 0,
+            "published": 0,
+            "persist_errors": 0,
+            "publish_errors": 0,
+            "backpressure_waits": 0,
+            "redriven": 0,
+            "unspooled": 0,
+        }
+        self._backpressure_seconds = 0.0
+        self._backpressure_active = False
+        self._persist_high_watermark = 0
+        self._publish_high_watermark = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def start(self):
+        """Запускает рабочие стадии конвейера."""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._persist_worker(), name="pipeline-persist"),
+            asyncio.create_task(self._publish_worker(), name="pipeline-publish"),
+        ]
+        if self.spool is not None:
+            self._tasks.append(asyncio.create_task(self._spool_worker(), name="pipeline-spool"))
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Останавливает конвейер, дав стадиям дообработать очереди.
+
+        :param timeout: сколько ждать опустошения очередей (сек)
+        """
+        if not self._tasks:
+            return
+        if self._redrive_task is not None:
+            # неповторённые записи остаются в журнале до следующего запуска
+            self._redrive_task.cancel()
+            await asyncio.gather(self._redrive_task, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(
+                "Конвейер остановлен с необработанными данными: %s", self.stats()
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self):
+        await self.persist_queue.join()
+        await self.publish_queue.join()
+
+    async def submit(self, command: str, data: Any, raw: bytes | None = None):
+        """
+        Ставит пакет в очередь на сохранение.
+
+        Если очередь заполнена, ожидает свободного места (backpressure).
+
+        :param command: значение поля Command пакета
+        :param data: модели из поля Data пакета (см. core.models.FRAME_MODELS)
+        :param raw: исходные данные пакета для журнала
+        """
+        self._counters["submitted"] += 1
+        record_id = self._spool_append(FRAME, raw) if raw is not None else None
+        await self._put_persist(command, data, record_id)
+
+    def _spool_append(self, kind: int, payload: bytes) -> int | None:
+        """Записывает данные в журнал; при заполненном журнале возвращает None."""
+        if self.spool is None:
+            return None
+        try:
+            return self.spool.append(kind, payload)
+        except SpoolFullError as e:
+            self._counters["unspooled"] += 1
+            self.logger.warning("%s, пакет обрабатывается без журнала", e)
+            return None
+
+    async def _put_persist(self, command: str, data: Any, record_id: int | None):
+        if self.persist_queue.full():
+            self._counters["backpressure_waits"] += 1
+            if not self._backpressure_active:
+                self._backpressure_active = True
+                self.logger.warning(
+                    "Очередь сохранения заполнена (%s), чтение сокета приостановлено", self.persist_queue.maxsize
+                )
+            started = time.monotonic()
+            await self.persist_queue.put((command, data, record_id))
+            self._backpressure_seconds += time.monotonic() - started
+        else:
+            self._backpressure_active = False
+            self.persist_queue.put_nowait((command, data, record_id))
+        self._persist_high_watermark = max(self._persist_high_watermark, self.persist_queue.qsize())
+
+    async def _persist_worker(self):
+        """Стадия сохранения: пишет пакеты в Postgres."""
+        while True:
+            command, data, record_id = await self.persist_queue.get()
+            try:
+                with span(f"persist_{command}"):
+                    await self._persist(command, data)
+                self._counters["persisted"] += 1
+                self._ack(record_id)
+            except Exception as e:
+                self._counters["persist_errors"] += 1
+                self.logger.error("Ошибка сохранения пакета '%s': %s", command, e)
+                self._defer(record_id)
+            finally:
+                self.persist_queue.task_done()
+
+    async def _persist(self, command: str, data: Any):
+        match command:
+            case "events":
+                if self.dedup is not None:
+                    data = self.dedup.filter(data)
+                    if not data:
+                        return
+                with DB_INSERT_SECONDS.time():
+                    result = await insert_events_batch(self.db, data, self.logger)
+                log_rejected(result.rejected, "Событие", self.logger)
+                if self.dedup is not None:
+                    # отклонённые события (например, с ещё не загруженной точкой доступа) могут прийти снова
+                    rejected = {index for index, _, _ in result.rejected}
+                    self.dedup.remember(event for index, event in enumerate(data) if index not in rejected)
+                if not result.ids:
+                    return
+                events = None
+                if self.enrich_event_messages:
+                    if not self._directory_warmed:
+                        self._directory_warmed = True
+                        await self.directory.warm()
+                    events = [self._event_payload(record) for record in result.records]
+                if self.batch_event_messages:
+                    # одно сообщение на пачку событий вместо сообщения на каждое событие
+                    messages = [{"new_pacs_event_ids": result.ids}]
+                    if events is not None:
+                        messages[0]["events"] = events
+                elif events is not None:
+                    messages = [{"new_pacs_event_id": eid, "event": event} for eid, event in zip(result.ids, events)]
+                else:
+                    messages = [{"new_pacs_event_id": eid} for eid in result.ids]
+                await self._put_publish(settings.RMQ_EVENTS_EXCHANGE_NAME, messages)
+            case "userlist":
+                await self.directory.sync_card_owners(data)
+            case "aplist":
+                await self.directory.sync_access_points(data)
+            case _:
+                self.logger.warning("Конвейер не обрабатывает команду '%s'", command)
+
+    def _event_payload(self, record) -> dict:
+        """
+        Событие для сообщения RabbitMQ: сохранённая строка pacs_event, название точки доступа
+        и имя владельца карты из справочников в памяти (None, если они ещё не выгружены).
+        """
+        owner = self.directory.card_owner(record["owner_id"]) if record["owner_id"] is not None else None
+        return {
+            "id": str(record["id"]),
+            "created": format_datetime(record["created"]),
+            "ap_id": record["ap_id"],
+            "ap_name": self.directory.access_point_name(record["ap_id"]),
+            "owner_id": record["owner_id"],
+            "owner": dict(zip(("firstname", "secondname", "lastname"), owner)) if owner is not None else None,
+            "card_number": record["card_number"],
+            "code": record["code"],
+        }
+
+    async def _put_publish(self, exchange_name: str, messages: list, record_id: int | None = None):
+        """Ставит сообщения в очередь на публикацию, предварительно записав их в журнал."""
+        if self.spool is not None:
+            if record_id is None:
+                record_id = self._spool_append(
+                    PUBLISH, codec.dumps({"exchange": exchange_name, "messages": messages})
+                )
+            if record_id is not None:
+                self._publishing[record_id] = [len(messages), False]
+        for message in messages:
+            await self.publish_queue.put((exchange_name, message, record_id))
+        self._publish_high_watermark = max(self._publish_high_watermark, self.publish_queue.qsize())
+
+    async def _publish_worker(self):
+        """
+        Стадия публикации: отправляет сообщения в RabbitMQ.
+
+        Забирает из очереди всё накопившееся (до publish_batch_size) и
+        публикует пачкой через publish_many, не дожидаясь подтверждения
+        каждого сообщения по отдельности.
+        """
+        while True:
+            batch = [await self.publish_queue.get()]
+            while len(batch) < self.publish_batch_size and not self.publish_queue.empty():
+                batch.append(self.publish_queue.get_nowait())
+
+            by_exchange: dict[str, list] = {}
+            for exchange_name, message, record_id in batch:
+                by_exchange.setdefault(exchange_name, []).append((message, record_id))
+
+            for exchange_name, items in by_exchange.items():
+                messages = [message for message, _ in items]
+                try:
+                    with PUBLISH_SECONDS.time():
+                        await self.producer.publish_many(exchange_name, messages)
+                    self._counters["published"] += len(messages)
+                    published = True
+                except Exception as e:
+                    self._counters["publish_errors"] += len(messages)
+                    self.logger.error("Ошибка публикации %s сообщений в '%s': %s", len(messages), exchange_name, e)
+                    published = False
+                for _, record_id in items:
+                    self._published(record_id, published)
+
+            for _ in batch:
+                self.publish_queue.task_done()
+
+    def _published(self, record_id: int | None, ok: bool):
+        state = self._publishing.get(record_id)
+        if state is None:
+            return
+        state[0] -= 1
+        state[1] = state[1] or not ok
+        if state[0] == 0:
+            del self._publishing[record_id]
+            if state[1]:
+                # запись повторяется целиком: часть её сообщений может быть опубликована дважды
+                self._defer(record_id)
+            else:
+                self._ack(record_id)
+
+    def _ack(self, record_id: int | None):
+        if record_id is not None:
+            self.spool.ack(record_id)
+
+    def _defer(self, record_id: int | None):
+        if record_id is not None:
+            self._deferred.append(record_id)
+
+    async def _spool_worker(self):
+        """
+        Обслуживание журнала: сброс на диск, компактирование и повтор записей,
+        не обработанных из-за недоступности Postgres или RabbitMQ.
+
+        Повтор выполняется отдельной задачей: при большом объёме он ждёт
+        места в очередях конвейера, а сброс журнала на диск не должен
+        останавливаться на это время.
+        """
+        while True:
+            await asyncio.sleep(settings.SPOOL_FLUSH_INTERVAL)
+            try:
+                self.spool.flush()
+                self.spool.compact()
+            except (OSError, SpoolError) as e:
+                self.logger.error("Ошибка обслуживания журнала %s: %s", self.spool.directory, e)
+            redriving = self._redrive_task is not None and not self._redrive_task.done()
+            if self._deferred and not redriving and time.monotonic() >= self._next_retry:
+                self._next_retry = time.monotonic() + self.retry_interval
+                self._redrive_task = asyncio.create_task(self._redrive(), name="pipeline-redrive")
+
+    async def _redrive(self):
+        deferred, self._deferred = self._deferred, []
+        self.logger.info("Повтор %s пакетов из журнала", len(deferred))
+        for position, record_id in enumerate(deferred):
+            try:
+                kind, payload = self.spool.read(record_id)
+                body = codec.loads(payload)
+                if kind == FRAME:
+                    command = body.get("Command")
+                    items, _ = decode_list(FRAME_MODELS[command], body.get("Data"))
+                    await self._put_persist(command, items, record_id)
+                else:
+                    await self._put_publish(body["exchange"], body["messages"], record_id)
+                self._counters["redriven"] += 1
+            except SpoolError:
+                continue
+            except asyncio.CancelledError:
+                self._deferred[:0] = deferred[position:]
+                raise
+            except Exception as e:
+                # запись, которую невозможно разобрать, повторять бессмысленно
+                self.logger.error("Запись журнала %s отброшена: %s", record_id, e)
+                self.spool.ack(record_id)
+
+    def stats(self) -> dict:
+        """
+        Текущие метрики конвейера.
+
+        :return: глубина очередей, их максимум и счётчики стадий
+        """
+        return {
+            "persist_queue_depth": self.persist_queue.qsize(),
+            "persist_queue_size": self.persist_queue.maxsize,
+            "persist_queue_high_watermark": self._persist_high_watermark,
+            "publish_queue_depth": self.publish_queue.qsize(),
+            "publish_queue_size": self.publish_queue.maxsize,
+            "publish_queue_high_watermark": self._publish_high_watermark,
+            "backpressure_seconds": round(self._backpressure_seconds, 3),
+            "deferred": len(self._deferred),
+            **self._counters,
+            **({"spool": self.spool.stats()} if self.spool is not None else {}),
+            **({"dedup": self.dedup.stats()} if self.dedup is not None else {}),
+        }
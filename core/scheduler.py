@@ -0,0 +1,225 @@
+import asyncio
+import heapq
+import itertools
+import random
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class CommandCancelledError(Exception):
+    """Отложенная команда снята с планировщика до выполнения."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Политика повторов команды с экспоненциальной задержкой.
+
+    :ivar max_attempts: максимум повторов
+    :ivar delay: задержка перед первым повтором (сек)
+    :ivar backoff: множитель задержки для следующих повторов
+    :ivar max_delay: верхняя граница задержки (сек)
+    :ivar jitter: доля задержки (0..1), на которую она случайно уменьшается,
+                  чтобы повторы многих клиентов не совпадали по времени
+    """
+    max_attempts: int
+    delay: float
+    backoff: float = 2.0
+    max_delay: float = 300.0
+    jitter: float = 0.0
+
+    def delay_for(self, attempt: int) -> float:
+        """Задержка перед повтором номер `attempt` (с 1)."""
+        delay = min(self.delay * self.backoff ** (attempt - 1), self.max_delay)
+        if self.jitter:
+            delay -= delay * self.jitter * random.random()
+        return delay
+
+
+@dataclass
+class _Entry:
+    seq: int
+    when: float
+    callback: Callable[..., Awaitable[Any]]
+    args: tuple
+    future: asyncio.Future
+
+
+class CommandScheduler:
+    """
+    Планировщик отложенных и повторных команд PACS.
+
+    Задания хранятся в куче по времени срабатывания и выполняются одной
+    фоновой задачей, поэтому ожидание не блокирует цикл приёма данных.
+    У каждого задания есть ключ (обычно Id команды): повторное планирование
+    с тем же ключом заменяет задание, а `cancel` снимает его, например,
+    когда пришло подтверждение от контроллера. Результат задания можно
+    дождаться через возвращаемый Future.
+    """
+    def __init__(self, logger):
+        self.logger = logger
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._entries: dict[Hashable, _Entry] = {}
+        self._attempts: dict[Hashable, int] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def start(self):
+        """Запускает фоновую задачу планировщика."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="command-scheduler")
+
+    async def stop(self):
+        """Останавливает планировщик; невыполненные задания отбрасываются."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self._entries:
+            self.logger.warning("Планировщик остановлен, отброшено заданий: %s", len(self._entries))
+        for key in list(self._entries):
+            self.cancel(key)
+        self._heap.clear()
+
+    def schedule(
+        self,
+        key: Hashable,
+        delay: float,
+        callback: Callable[..., Awaitable[Any]],
+        *args
+    ) -> asyncio.Future:
+        """
+        Запланировать вызов `await callback(*args)` через `delay` секунд.
+
+        Задание с тем же ключом заменяется (его Future завершается CommandCancelledError).
+
+        :param key: ключ задания
+        :param delay: задержка (сек)
+        :param callback: асинхронная функция
+        :param args: аргументы callback
+        :return: Future с результатом callback
+        """
+        self._drop(key)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # ошибки задания логируются в _execute; ждать результат необязательно
+        future.add_done_callback(_consume_exception)
+
+        seq = next(self._seq)
+        when = loop.time() + delay
+        self._entries[key] = _Entry(seq, when, callback, args, future)
+        heapq.heappush(self._heap, (when, seq, key))
+        self._wakeup.set()
+        return future
+
+    def retry(
+        self,
+        key: Hashable,
+        policy: RetryPolicy,
+        callback: Callable[..., Awaitable[Any]],
+        *args
+    ) -> asyncio.Future | None:
+        """
+        Запланировать очередной повтор команды по политике повторов.
+
+        :param key: ключ задания
+        :param policy: политика повторов
+        :param callback: асинхронная функция
+        :param args: аргументы callback
+        :return: Future с результатом callback или None, если лимит повторов исчерпан
+        """
+        attempt = self._attempts.get(key, 0) + 1
+        if attempt > policy.max_attempts:
+            self._attempts.pop(key, None)
+            return None
+        future = self.schedule(key, policy.delay_for(attempt), callback, *args)
+        self._attempts[key] = attempt
+        return future
+
+    def attempts(self, key: Hashable) -> int:
+        """Сколько повторов уже запланировано для ключа."""
+        return self._attempts.get(key, 0)
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Снять задание и сбросить счётчик повторов.
+
+        :param key: ключ задания
+        :return: True, если задание ещё ожидало выполнения
+        """
+        self._attempts.pop(key, None)
+        return self._drop(key)
+
+    def _drop(self, key: Hashable) -> bool:
+        # запись в куче остаётся и будет пропущена при извлечении
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        if not entry.future.done():
+            entry.future.set_exception(CommandCancelledError(f"Отложенная команда {key} отменена"))
+        return True
+
+    def pending(self) -> int:
+        """Количество ожидающих заданий."""
+        return len(self._entries)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            when, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is None or entry.seq != seq:
+                heapq.heappop(self._heap)  # задание отменено или заменено
+                continue
+
+            delay = when - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._heap)
+            del self._entries[key]
+            task = asyncio.create_task(self._execute(key, entry))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, key: Hashable, entry: _Entry):
+        try:
+            result = await entry.callback(*entry.args)
+        except asyncio.CancelledError:
+            if not entry.future.done():
+                entry.future.set_exception(CommandCancelledError(f"Отложенная команда {key} прервана"))
+            raise
+        except Exception as e:
+            self.logger.error("Ошибка выполнения отложенной команды %s: %s", key, e)
+            if not entry.future.done():
+                entry.future.set_exception(e)
+        else:
+            if not entry.future.done():
+                entry.future.set_result(result)
+
+
+def _consume_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
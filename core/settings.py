@@ -7,7 +7,13 @@ load_dotenv()
 
 class Settings(BaseSettings):
     # Debug mode
-    DEBUG_MODE:bool = bool(os.getenv("DEBUG_MODE", "False").lower())
+    DEBUG_MODE:bool = os.getenv("DEBUG_MODE", "False").lower() in ("1", "true", "yes")
+    # Журнал: формат вывода ("text" или "json" — одна запись JSON на строку), размер очереди до потока вывода,
+    # не больше LOG_RATE_LIMIT одинаковых сообщений за LOG_RATE_INTERVAL сек (0 — без ограничения)
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    LOG_RATE_LIMIT: int = int(os.getenv("LOG_RATE_LIMIT", 20))
+    LOG_RATE_INTERVAL: float = float(os.getenv("LOG_RATE_INTERVAL", 10))
 
     # RabbitMQ
     RMQ_HOST: str = os.getenv("RMQ_HOST", "rabbitmq")
@@ -17,6 +23,19 @@ class Settings(BaseSettings):
     RMQ_PASSWORD: str  = os.getenv("RMQ_PASSWORD", "guest")
     RMQ_EVENTS_EXCHANGE_NAME: str  = os.getenv("RMQ_EVENTS_EXCHANGE_NAME", "pacs_client")
     RMQ_COMMANDS_EXCHANGE_NAME: str  = os.getenv("RMQ_COMMANDS_EXCHANGE_NAME", "pacs_client")
+    # Обменник для сообщений {"pacs_command_failed": ...} о невыполненных командах портала ("" — не публиковать)
+    RMQ_COMMAND_FAILURES_EXCHANGE_NAME: str = os.getenv("RMQ_COMMAND_FAILURES_EXCHANGE_NAME", "")
+    # Потребитель команд: prefetch (basic_qos) и число одновременно обрабатываемых команд
+    RMQ_PREFETCH_COUNT: int = int(os.getenv("RMQ_PREFETCH_COUNT", 64))
+    RMQ_CONSUMER_CONCURRENCY: int = int(os.getenv("RMQ_CONSUMER_CONCURRENCY", 32))
+    # Сколько сообщений может ожидать подтверждения брокера одновременно
+    RMQ_PUBLISH_MAX_IN_FLIGHT: int = int(os.getenv("RMQ_PUBLISH_MAX_IN_FLIGHT", 256))
+    # Максимум сообщений в одной пачке публикации
+    RMQ_PUBLISH_BATCH_SIZE: int = int(os.getenv("RMQ_PUBLISH_BATCH_SIZE", 500))
+    # Публиковать одно сообщение {"new_pacs_event_ids": [...]} на пачку событий
+    RMQ_EVENTS_BATCH_MESSAGE: bool = os.getenv("RMQ_EVENTS_BATCH_MESSAGE", "False").lower() in ("1", "true", "yes")
+    # Добавлять в сообщения о новых событиях сами события с названием точки доступа и именем владельца карты
+    RMQ_EVENTS_ENRICHED: bool = os.getenv("RMQ_EVENTS_ENRICHED", "False").lower() in ("1", "true", "yes")
 
     # Celery
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "")
@@ -28,6 +47,27 @@ class Settings(BaseSettings):
     TCP_SERVER_CERT: str  = os.getenv("TCP_SERVER_CERT", "certs/cert.pem")
     TCP_SERVER_KEY: str  = os.getenv("TCP_SERVER_KEY", "certs/key.pem")
     TCP_SERVER_CERT_CN: str  = os.getenv("TCP_SERVER_CERT_CN", "SKD")
+    # Несколько контроллеров в одном процессе: "name=host:port,name2=host2:port2".
+    # Если не задано — один контроллер TCP_SERVER_HOST:TCP_SERVER_PORT
+    TCP_CONTROLLERS: str = os.getenv("TCP_CONTROLLERS", "")
+    # Число рабочих процессов, между которыми распределяются контроллеры (1 — всё в одном процессе)
+    WORKERS: int = int(os.getenv("WORKERS", 1))
+    # Перезапуск упавшего рабочего процесса: задержки (сек) и лимит подряд (0 — без ограничения)
+    WORKER_RESTART_DELAY: float = float(os.getenv("WORKER_RESTART_DELAY", 1))
+    WORKER_RESTART_MAX_DELAY: float = float(os.getenv("WORKER_RESTART_MAX_DELAY", 60))
+    WORKER_RESTART_MAX_ATTEMPTS: int = int(os.getenv("WORKER_RESTART_MAX_ATTEMPTS", 0))
+    # Очередь команд рабочего процесса (pacs_client.N) удаляется RabbitMQ, если у неё нет
+    # потребителей дольше стольких секунд (x-expires) — после уменьшения WORKERS (0 — не удалять)
+    WORKER_QUEUE_EXPIRES: float = float(os.getenv("WORKER_QUEUE_EXPIRES", 3600))
+    # Возобновлять TLS-сессию при переподключении к контроллеру
+    TCP_TLS_SESSION_REUSE: bool = os.getenv("TCP_TLS_SESSION_REUSE", "True").lower() in ("1", "true", "yes")
+    # Защита от повреждённого заголовка: максимальная длина данных одного пакета (байт)
+    TCP_MAX_FRAME_SIZE: int = int(os.getenv("TCP_MAX_FRAME_SIZE", 64 * 1024 * 1024))
+    # За сколько должны прийти данные пакета после его заголовка (сек, 0 — без ограничения);
+    # иначе соединение считается зависшим и переустанавливается
+    TCP_FRAME_TIMEOUT: float = float(os.getenv("TCP_FRAME_TIMEOUT", 30))
+    # Запись всего трафика контроллеров в каталог (файл <контроллер>-<время запуска>.cap; пусто — не записывать)
+    TCP_CAPTURE_DIR: str = os.getenv("TCP_CAPTURE_DIR", "")
 
     # Postgres
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "postgres")
@@ -35,6 +75,67 @@ class Settings(BaseSettings):
     DATABASE_PASSWORD: str = os.getenv("DATABASE_PASSWORD", "postgres")
     DATABASE_HOST: str = os.getenv("DATABASE_USER", "localhost")
     DATABASE_PORT: int = int(os.getenv("DATABASE_PORT", 5432))
+    # Максимум событий в одном многострочном INSERT (5 параметров на событие, лимит asyncpg — 32767)
+    EVENT_INSERT_BATCH_SIZE: int = int(os.getenv("EVENT_INSERT_BATCH_SIZE", 1000))
+
+    # JSON-кодек: auto (orjson → msgspec → json), orjson, msgspec или json
+    JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")
+
+    # Конвейер обработки пакетов
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 1000))
+    PIPELINE_PUBLISH_QUEUE_SIZE: int = int(os.getenv("PIPELINE_PUBLISH_QUEUE_SIZE", 10000))
+
+    # Отсев повторно присланных событий: LRU-кэш ключей (EVENT_DEDUP=False — отключить)
+    EVENT_DEDUP: bool = os.getenv("EVENT_DEDUP", "True").lower() in ("1", "true", "yes")
+    EVENT_DEDUP_CACHE_SIZE: int = int(os.getenv("EVENT_DEDUP_CACHE_SIZE", 100000))
+
+    # Журнал пакетов на диске на время недоступности Postgres/RabbitMQ
+    # (по умолчанию выключен; включается каталогом, например SPOOL_DIR=spool)
+    SPOOL_DIR: str = os.getenv("SPOOL_DIR", "")
+    SPOOL_SEGMENT_SIZE: int = int(os.getenv("SPOOL_SEGMENT_SIZE", 16 * 1024 * 1024))
+    # Предел места под сегменты журнала (0 — без ограничения); при его достижении пакеты
+    # обрабатываются без журнала (счётчик unspooled), пока место не освободится
+    SPOOL_MAX_BYTES: int = int(os.getenv("SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+    SPOOL_FLUSH_INTERVAL: float = float(os.getenv("SPOOL_FLUSH_INTERVAL", 1))
+    SPOOL_RETRY_INTERVAL: float = float(os.getenv("SPOOL_RETRY_INTERVAL", 10))
+
+    # HTTP endpoint /metrics в формате Prometheus (по умолчанию отключён; включается
+    # портом, например METRICS_PORT=9470; в режиме WORKERS > 1 процесс N слушает
+    # METRICS_PORT + N). Слушает только локально; для сбора из другого контейнера
+    # или хоста — METRICS_HOST=0.0.0.0
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", 0))
+
+    # Диагностика: задержка цикла событий, стек при зависании дольше DIAGNOSTICS_STALL_THRESHOLD сек
+    # (в DIAGNOSTICS_FILE или журнал) и длительность стадий обработки пакета в /metrics
+    DIAGNOSTICS: bool = os.getenv("DIAGNOSTICS", "False").lower() in ("1", "true", "yes")
+    DIAGNOSTICS_LAG_INTERVAL: float = float(os.getenv("DIAGNOSTICS_LAG_INTERVAL", 0.5))
+    DIAGNOSTICS_STALL_THRESHOLD: float = float(os.getenv("DIAGNOSTICS_STALL_THRESHOLD", 0.5))
+    DIAGNOSTICS_FILE: str = os.getenv("DIAGNOSTICS_FILE", "")
+
+    # Синхронизация справочников aplist/userlist: удалять записи, пропавшие из выгрузки контроллера
+    SYNC_DELETE_MISSING: bool = os.getenv("SYNC_DELETE_MISSING", "False").lower() in ("1", "true", "yes")
+    # С какого числа изменённых записей справочник загружается через COPY во временную таблицу
+    SYNC_COPY_THRESHOLD: int = int(os.getenv("SYNC_COPY_THRESHOLD", 500))
+
+    # Ожидающие команды PACS: срок ожидания ответа (сек), лимит, повторы по таймауту
+    COMMAND_TTL: float = float(os.getenv("COMMAND_TTL", 300))
+    COMMAND_CAPACITY: int = int(os.getenv("COMMAND_CAPACITY", 10000))
+    COMMAND_TIMEOUT_RETRIES: int = int(os.getenv("COMMAND_TIMEOUT_RETRIES", 1))
+
+    # Отложенные и повторные команды PACS
+    WDRAW_DELCARD_DELAY: float = float(os.getenv("WDRAW_DELCARD_DELAY", 2))
+    DELCARD_RETRY_MAX_ATTEMPTS: int = int(os.getenv("DELCARD_RETRY_MAX_ATTEMPTS", 5))
+    DELCARD_RETRY_DELAY: float = float(os.getenv("DELCARD_RETRY_DELAY", 10))
+    DELCARD_RETRY_BACKOFF: float = float(os.getenv("DELCARD_RETRY_BACKOFF", 2))
+    DELCARD_RETRY_MAX_DELAY: float = float(os.getenv("DELCARD_RETRY_MAX_DELAY", 120))
+
+    # Переподключение к контроллеру: задержки (сек), разброс и лимит попыток подряд (0 — без ограничения)
+    RECONNECT_DELAY: float = float(os.getenv("RECONNECT_DELAY", 1))
+    RECONNECT_BACKOFF: float = float(os.getenv("RECONNECT_BACKOFF", 2))
+    RECONNECT_MAX_DELAY: float = float(os.getenv("RECONNECT_MAX_DELAY", 30))
+    RECONNECT_JITTER: float = float(os.getenv("RECONNECT_JITTER", 0.5))
+    RECONNECT_MAX_ATTEMPTS: int = int(os.getenv("RECONNECT_MAX_ATTEMPTS", 0))
 
     # Константы конфигурации Реверс 8000
     REVERS_TEMPLATE_ID: int = int(os.getenv("REVERS_TEMPLATE_ID", 16))
@@ -0,0 +1,339 @@
+import mmap
+import os
+import struct
+import zlib
+
+# Типы записей журнала
+FRAME = 1    # принятый от контроллера пакет, ещё не сохранённый в БД
+PUBLISH = 2  # сообщения, сохранённые в БД, но ещё не опубликованные в RabbitMQ
+
+# Заголовок записи: длина данных, crc32 (id + данные), id записи, тип.
+# Тип не входит в crc: при подтверждении в нём на месте выставляется флаг _ACKED
+_HEADER = struct.Struct("<IIQB")
+_ACKED = 0x80
+_CHECKPOINT = struct.Struct("<Q")
+_SEGMENT_SUFFIX = ".seg"
+
+
+class SpoolError(Exception):
+    """Ошибка журнала (например, запись не найдена)."""
+
+
+class SpoolFullError(SpoolError):
+    """Журнал достиг SPOOL_MAX_BYTES или на диске нет места под новый сегмент."""
+
+
+class _Segment:
+    def __init__(self, seq: int, path: str, size: int, create: bool):
+        self.seq = seq
+        self.path = path
+        self.live = 0        # неподтверждённые записи
+        self.live_bytes = 0
+        self.offset = 0      # позиция следующей записи
+        with open(path, "r+b" if not create else "w+b") as f:
+            if create:
+                try:
+                    _allocate(f, size)
+                except OSError:
+                    f.close()
+                    os.remove(path)
+                    raise
+            self.size = os.fstat(f.fileno()).st_size
+            self.mm = mmap.mmap(f.fileno(), self.size)
+
+    def close(self):
+        self.mm.close()
+
+
+class Spool:
+    """
+    Журнал упреждающей записи (write-ahead) пакетов PACS на диске.
+
+    Записи дописываются в сегменты фиксированного размера, отображённые
+    в память (mmap), поэтому запись — это копирование в page cache без
+    системных вызовов, и она переживает падение процесса. Заполненный
+    сегмент сбрасывается на диск при переходе к следующему, а остальные
+    изменения, включая подтверждения в старых сегментах, — в `flush`
+    (периодически, из конвейера) и `close`.
+
+    Место под сегмент выделяется на диске целиком при его создании
+    (posix_fallocate): иначе на заполненном диске запись в разреженный
+    файл через mmap завершила бы процесс по SIGBUS. Если места нет или
+    сегменты заняли бы больше `max_bytes`, `append` выбрасывает
+    SpoolFullError, а уже записанное остаётся в журнале.
+
+    Каждая запись получает возрастающий id и защищена crc32: при
+    восстановлении недописанный хвост сегмента отбрасывается. Подтверждённые
+    (`ack`) записи больше не нужны; сегмент без неподтверждённых записей
+    удаляется, а из почти пустых сегментов оставшиеся записи переносятся
+    в текущий сегмент (компактирование).
+
+    В файле checkpoint хранится наименьший неподтверждённый id: записи
+    до него при восстановлении пропускаются.
+    """
+    def __init__(self, directory: str, logger, segment_size: int = 16 * 1024 * 1024, max_bytes: int = 0):
+        """
+        :param directory: каталог сегментов (создаётся при необходимости)
+        :param logger:
+        :param segment_size: размер сегмента (байт)
+        :param max_bytes: максимальный суммарный размер сегментов (байт, 0 — без ограничения)
+        """
+        self.directory = directory
+        self.logger = logger
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+
+        self._segments: dict[int, _Segment] = {}
+        self._active: _Segment | None = None
+        self._opened = False
+        # сегменты с изменениями, ещё не сброшенными на диск (новые записи и флаги _ACKED)
+        self._dirty: set[int] = set()
+        # неподтверждённые записи: id → (сегмент, смещение, полная длина); порядок вставки = порядок id
+        self._records: dict[int, tuple[int, int, int]] = {}
+        self._next_id = 1
+        self._checkpoint = 0
+        self.recovered: list[int] = []
+
+        self.appended = 0
+        self.acked = 0
+        self.compacted = 0
+
+    def open(self):
+        """Открывает журнал и находит записи, не подтверждённые до остановки."""
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint_path = os.path.join(self.directory, "checkpoint")
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "rb") as f:
+                self._checkpoint = _CHECKPOINT.unpack(f.read(_CHECKPOINT.size))[0]
+        self._next_id = max(self._next_id, self._checkpoint)
+
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(_SEGMENT_SUFFIX):
+                self._recover_segment(int(name[:-len(_SEGMENT_SUFFIX)]), os.path.join(self.directory, name))
+
+        for segment in list(self._segments.values()):
+            if segment.live == 0:
+                self._remove_segment(segment)
+
+        self._opened = True
+        # новые записи пишутся в новый сегмент, а не после возможно повреждённого хвоста
+        try:
+            self._roll(max(self._segments, default=0) + 1, 0)
+        except SpoolFullError as e:
+            self.logger.warning("%s: новые записи не сохраняются, пока место не освободится", e)
+        self.recovered = list(self._records)
+        if self.recovered:
+            self.logger.warning(
+                "В журнале %s найдено неподтверждённых записей: %s", self.directory, len(self.recovered)
+            )
+
+    def _recover_segment(self, seq: int, path: str):
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+            return
+        segment = _Segment(seq, path, 0, create=False)
+        self._segments[seq] = segment
+        mm = segment.mm
+        offset = 0
+        while offset + _HEADER.size <= segment.size:
+            length, crc, record_id, kind = _HEADER.unpack_from(mm, offset)
+            end = offset + _HEADER.size + length
+            if length == 0 and crc == 0:
+                break  # длина и crc пишутся последними: запись не начата или не дописана
+            if end > segment.size or crc != _crc(mm[offset + 8:offset + 16], mm[offset + _HEADER.size:end]):
+                self.logger.warning("Повреждённая запись в %s по смещению %s, хвост сегмента отброшен", path, offset)
+                break
+            if record_id >= self._checkpoint and not kind & _ACKED and record_id not in self._records:
+                self._records[record_id] = (seq, offset, end - offset)
+                segment.live += 1
+                segment.live_bytes += end - offset
+            self._next_id = max(self._next_id, record_id + 1)
+            offset = end
+        segment.offset = offset
+        # перенесённые при компактировании записи могли оказаться в более новом сегменте раньше старых
+        self._records = dict(sorted(self._records.items()))
+
+    def close(self):
+        """Сбрасывает журнал на диск и закрывает сегменты."""
+        if not self._opened:
+            return
+        self.flush()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+        self._active = None
+        self._opened = False
+
+    def append(self, kind: int, payload: bytes) -> int:
+        """
+        Дописать запись.
+
+        :param kind: тип записи (FRAME, PUBLISH)
+        :param payload: данные
+        :return: id записи
+        :raises SpoolFullError: если под запись нужен новый сегмент, а журнал заполнен
+        """
+        self._write(self._next_id, kind, payload)
+        self._next_id += 1
+        self.appended += 1
+        return self._next_id - 1
+
+    def _write(self, record_id: int, kind: int, payload: bytes):
+        size = _HEADER.size + len(payload)
+        if self._active is None or self._active.offset + size > self._active.size:
+            self._roll(max(self._segments, default=0) + 1, size)
+        segment = self._active
+        offset = segment.offset
+        id_bytes = struct.pack("<Q", record_id)
+        segment.mm[offset + 8:offset + size] = id_bytes + bytes((kind,)) + payload
+        segment.mm[offset:offset + 8] = struct.pack("<II", len(payload), _crc(id_bytes, payload))
+        segment.offset += size
+        segment.live += 1
+        segment.live_bytes += size
+        self._records[record_id] = (segment.seq, offset, size)
+        self._dirty.add(segment.seq)
+
+    def _roll(self, seq: int, min_size: int):
+        previous = self._active
+        size = max(self.segment_size, min_size)
+        if self.max_bytes:
+            used = sum(segment.size for segment in self._segments.values() if segment is not previous or previous.live)
+            if used + size > self.max_bytes:
+                raise SpoolFullError(f"Журнал {self.directory} заполнен: {used} из {self.max_bytes} байт")
+        path = os.path.join(self.directory, f"{seq:012d}{_SEGMENT_SUFFIX}")
+        try:
+            segment = _Segment(seq, path, size, create=True)
+        except OSError as e:
+            raise SpoolFullError(f"Не удалось создать сегмент журнала {path}: {e}") from e
+        self._active = segment
+        self._segments[seq] = segment
+        if previous is not None and previous.live == 0:
+            self._remove_segment(previous)
+        elif previous is not None and previous.seq in self._dirty:
+            # заполненный сегмент больше не меняется, кроме флагов подтверждения
+            previous.mm.flush()
+            self._dirty.discard(previous.seq)
+
+    def read(self, record_id: int) -> tuple[int, bytes]:
+        """
+        Прочитать неподтверждённую запись.
+
+        :return: тип записи и данные
+        :raises SpoolError: если записи нет (уже подтверждена)
+        """
+        location = self._records.get(record_id)
+        if location is None:
+            raise SpoolError(f"Запись {record_id} отсутствует в журнале")
+        seq, offset, size = location
+        mm = self._segments[seq].mm
+        kind = mm[offset + _HEADER.size - 1]
+        return kind, mm[offset + _HEADER.size:offset + size]
+
+    def ack(self, record_id: int):
+        """Подтвердить запись: она обработана и больше не нужна."""
+        location = self._records.pop(record_id, None)
+        if location is None:
+            return
+        self.acked += 1
+        seq, offset, size = location
+        segment = self._segments[seq]
+        segment.mm[offset + _HEADER.size - 1] |= _ACKED
+        segment.live -= 1
+        segment.live_bytes -= size
+        if segment.live == 0 and segment is not self._active:
+            self._remove_segment(segment)
+        else:
+            self._dirty.add(seq)
+
+    def _remove_segment(self, segment: _Segment):
+        segment.close()
+        os.remove(segment.path)
+        del self._segments[segment.seq]
+        self._dirty.discard(segment.seq)
+
+    def compact(self, max_live_ratio: float = 0.25):
+        """
+        Переносит оставшиеся записи из почти пустых закрытых сегментов
+        в текущий и удаляет эти сегменты.
+
+        Если журнал заполнен (SpoolFullError при переносе), компактирование
+        прекращается: непоместившиеся записи остаются в своём сегменте,
+        а у уже перенесённых старые копии помечаются подтверждёнными.
+
+        :param max_live_ratio: доля занятого неподтверждёнными записями места,
+                               ниже которой сегмент компактируется
+        """
+        for segment in [s for s in self._segments.values() if s is not self._active]:
+            if segment.live_bytes > segment.size * max_live_ratio:
+                continue
+            moved = [(record_id, location) for record_id, location in self._records.items() if location[0] == segment.seq]
+            copied = []
+            try:
+                for record_id, (_, offset, size) in moved:
+                    kind = segment.mm[offset + _HEADER.size - 1]
+                    payload = bytes(segment.mm[offset + _HEADER.size:offset + size])
+                    self._write(record_id, kind, payload)
+                    segment.live -= 1
+                    segment.live_bytes -= size
+                    copied.append(offset)
+            except SpoolFullError as e:
+                self.logger.warning("Компактирование %s прервано: %s", segment.path, e)
+                if copied:
+                    self._active.mm.flush()
+                    self._dirty.discard(self._active.seq)
+                    # после сброса копий старые можно пометить: при восстановлении они не повторятся
+                    for offset in copied:
+                        segment.mm[offset + _HEADER.size - 1] |= _ACKED
+                    self._dirty.add(segment.seq)
+                return
+            # копии должны попасть на диск раньше, чем исчезнет исходный сегмент
+            if moved:
+                self._active.mm.flush()
+                self._dirty.discard(self._active.seq)
+            self._remove_segment(segment)
+            self.compacted += 1
+
+    def flush(self):
+        """Сбрасывает на диск все изменённые сегменты и сохраняет checkpoint."""
+        if not self._opened:
+            return
+        for seq in self._dirty:
+            self._segments[seq].mm.flush()
+        self._dirty.clear()
+        checkpoint = next(iter(self._records), self._next_id)
+        if checkpoint != self._checkpoint:
+            path = os.path.join(self.directory, "checkpoint")
+            with open(path + ".tmp", "wb") as f:
+                f.write(_CHECKPOINT.pack(checkpoint))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self._checkpoint = checkpoint
+
+    def pending(self) -> int:
+        """Количество неподтверждённых записей."""
+        return len(self._records)
+
+    def stats(self) -> dict:
+        """Сегменты, неподтверждённые записи и счётчики журнала."""
+        return {
+            "segments": len(self._segments),
+            "pending_records": len(self._records),
+            "pending_bytes": sum(segment.live_bytes for segment in self._segments.values()),
+            "segment_bytes": sum(segment.size for segment in self._segments.values()),
+            "appended": self.appended,
+            "acked": self.acked,
+            "compacted_segments": self.compacted,
+        }
+
+
+def _crc(id_bytes, payload) -> int:
+    return zlib.crc32(payload, zlib.crc32(id_bytes))
+
+
+def _allocate(f, size: int):
+    """Выделяет место под файл на диске; без posix_fallocate (не Linux) — только задаёт размер."""
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(f.fileno(), 0, size)
+    else:
+        f.truncate(size)
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from core.scheduler import RetryPolicy
+from core.tcpclient import TcpClient
+
+
+class ConnectionSupervisor:
+    """
+    Поддерживает соединение с контроллером PACS.
+
+    Запускает сессию (цикл приёма данных) поверх подключённого клиента и,
+    если соединение разорвано, переподключается с экспоненциальной
+    задержкой со случайным разбросом. После каждого подключения
+    повторно отправляются команды, ожидающие ответа, и сессия запускается
+    заново (она же заново запрашивает filterevents/aplist/userlist).
+    """
+    def __init__(
+        self,
+        client: TcpClient,
+        policy: RetryPolicy,
+        shutdown_event: asyncio.Event,
+        logger,
+        stable_after: float | None = None
+    ):
+        """
+        :param client: TCP клиент контроллера
+        :param policy: задержки между попытками; max_attempts = 0 — пытаться бесконечно
+        :param shutdown_event: событие остановки приложения
+        :param logger:
+        :param stable_after: через сколько секунд работы соединение считается
+                             стабильным и задержка сбрасывается (по умолчанию policy.max_delay)
+        """
+        self.client = client
+        self.policy = policy
+        self.shutdown_event = shutdown_event
+        self.logger = logger
+        self.stable_after = policy.max_delay if stable_after is None else stable_after
+
+        self.reconnects = 0
+        self.last_downtime = 0.0
+
+    async def run(self, session: Callable[[TcpClient], Awaitable[None]]):
+        """
+        Выполнять сессию до сигнала остановки, переподключаясь при разрыве.
+
+        :param session: корутина-функция, работающая с подключённым клиентом;
+                        разрыв соединения она сообщает через ConnectionError
+        :raises ConnectionError: если исчерпан лимит попыток подряд
+        """
+        attempt = 0
+        disconnected_at = None
+        while not self.shutdown_event.is_set():
+            connected_at = None
+            try:
+                if not self.client.connected:
+                    await self.client.connect(retries=1)
+                connected_at = time.monotonic()
+                if disconnected_at is not None:
+                    self.reconnects += 1
+                    self.last_downtime = connected_at - disconnected_at
+                    self.logger.info("Соединение восстановлено за %.1f сек", self.last_downtime)
+                    disconnected_at = None
+                await self.client.replay()
+                await session(self.client)
+                return
+            except ConnectionError as e:
+                self.logger.error("Соединение с %s:%s потеряно: %s", self.client.host, self.client.port, e)
+
+            await self.client.disconnect()
+            now = time.monotonic()
+            if disconnected_at is None:
+                disconnected_at = now
+            if connected_at is not None and now - connected_at >= self.stable_after:
+                attempt = 0
+
+            attempt += 1
+            if self.policy.max_attempts and attempt > self.policy.max_attempts:
+                raise ConnectionError(
+                    f"Не удалось восстановить соединение после {self.policy.max_attempts} попыток"
+                )
+            delay = self.policy.delay_for(attempt)
+            self.logger.info("Переподключение через %.1f сек (попытка %s)", delay, attempt)
+            try:
+                await asyncio.wait_for(self.shutdown_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        """Количество переподключений, длительность последнего простоя (сек) и метрики клиента."""
+        return {
+            "connected": self.client.connected,
+            "reconnects": self.reconnects,
+            "last_downtime_seconds": round(self.last_downtime, 3),
+            **self.client.stats(),
+        }
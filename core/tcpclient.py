@@ -1,7 +1,49 @@
 import asyncio
 import ssl
+import time
+from typing import Any, Dict
+
+from utils import codec
+from utils.capture import INBOUND, OUTBOUND, CaptureWriter
 # from utils.logger import get_logger
 
+FRAME_HEADER_SIZE = 4
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    """
+    Сериализует команду в JSON и упаковывает в бинарный буфер с 4-байтовым заголовком (little-endian).
+
+    :param message: команда PACS
+    :return: бинарный пакет (длина + данные)
+    """
+    data = codec.dumps(message)
+    return len(data).to_bytes(FRAME_HEADER_SIZE, 'little') + data
+
+
+class FrameTooLargeError(ConnectionError):
+    """Заголовок пакета указывает длину больше допустимой — поток повреждён или рассинхронизирован."""
+
+
+class DuplicateRequestError(RuntimeError):
+    """Запрос с теми же Id и Command уже ожидает ответа контроллера."""
+
+
+class SessionReusingContext(ssl.SSLContext):
+    """
+    SSLContext, возобновляющий сохранённую TLS-сессию.
+
+    asyncio не позволяет передать ssl.SSLSession в open_connection, поэтому
+    сессия подставляется при создании SSLObject в `wrap_bio`.
+    """
+    session: ssl.SSLSession | None = None
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.session
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
 class TcpClient:
     """
     Асинхронный TCP клиент с поддержкой TLS.
@@ -9,7 +51,20 @@ class TcpClient:
     Позволяет подключаться к удалённому серверу,
     отправлять и получать данные по защищённому соединению.
     """
-    def __init__(self, host: str, port: int, server_cert: str, server_key: str, server_cert_cn: str, logger, use_ssl: bool = True):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        server_cert: str,
+        server_key: str,
+        server_cert_cn: str,
+        logger,
+        use_ssl: bool = True,
+        max_frame_size: int = 64 * 1024 * 1024,
+        reuse_tls_session: bool = True,
+        capture: CaptureWriter | None = None,
+        frame_timeout: float | None = 30.0
+    ):
         """
         Инициализация клиента.
 
@@ -20,6 +75,10 @@ class TcpClient:
         :param server_cert_cn:  CN имя для проверки сертификата
         :param logger: объект логгера (если None → создаётся дефолтный)
         :param use_ssl: использовать ли SSL/TLS
+        :param max_frame_size: максимальная длина данных одного пакета (байт)
+        :param reuse_tls_session: возобновлять TLS-сессию при переподключении
+        :param capture: запись всех принятых и отправленных пакетов (utils.capture)
+        :param frame_timeout: за сколько должны прийти данные пакета после заголовка (сек), None — без ограничения
         """
         self.host = host
         self.port = port
@@ -27,11 +86,28 @@ class TcpClient:
         self.server_key = server_key
         self.server_cert_cn = server_cert_cn
         self.use_ssl = use_ssl
+        self.max_frame_size = max_frame_size
+        self.reuse_tls_session = reuse_tls_session
+        self.capture = capture
+        self.frame_timeout = frame_timeout
+
+        self._ssl_context: SessionReusingContext | None = None
+        self._handshakes = {"full": 0, "resumed": 0}
+        self._handshake_seconds = {"full": 0.0, "resumed": 0.0}
+        self.last_handshake_seconds = 0.0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
 
         self.reader: asyncio.StreamReader | None = None
         self.writer: asyncio.StreamWriter | None = None
         self.logger = logger
 
+        # запросы, ожидающие ответа: (Id, Command) → Future с ответом
+        self._requests: dict[tuple[int, str], asyncio.Future] = {}
+        # команды этих запросов — для повторной отправки после переподключения
+        self._commands: dict[tuple[int, str], Dict[str, Any]] = {}
+
     async def __aenter__(self):
         """Поддержка `async with TcpClient()`"""
         await self.connect()
@@ -50,82 +126,291 @@ class TcpClient:
         :param timeout: таймаут подключения (сек)
         :raises ConnectionError: если подключиться не удалось
         """
-        # context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        # context.options &= ~ssl.OP_NO_TLSv1_3 & ~ssl.OP_NO_TLSv1_2 & ~ssl.OP_NO_TLSv1_1
-        # context.verify_mode = ssl.CERT_REQUIRED
-        # context.minimum_version = ssl.TLSVersion.TLSv1
-        # context.set_ciphers('DEFAULT@SECLEVEL=0')
-        # context.load_verify_locations(self.server_cert)
-        # context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
-        # context.check_hostname = False
-
-        ssl_context = None
-        if self.use_ssl:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            # ssl_context.check_hostname = True
-            ssl_context.verify_mode = ssl.CERT_REQUIRED
-            ssl_context.minimum_version = ssl.TLSVersion.TLSv1
-            ssl_context.set_ciphers("DEFAULT@SECLEVEL=0")
-            ssl_context.load_verify_locations(self.server_cert)
-            ssl_context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
+        ssl_context = self.ssl_context() if self.use_ssl else None
 
         for attempt in range(retries):
             try:
+                started = time.monotonic()
                 self.reader, self.writer = await asyncio.wait_for(
-                    asyncio.open_connection(self.host, self.port, ssl=ssl_context, server_hostname=self.server_cert_cn),
+                    asyncio.open_connection(
+                        self.host,
+                        self.port,
+                        ssl=ssl_context,
+                        server_hostname=self.server_cert_cn if ssl_context else None
+                    ),
                     timeout=timeout
                 )
-                self.logger.info(f"Подключено к {self.host}:{self.port}")
+                self._record_handshake(time.monotonic() - started)
                 return
             except Exception as e:
-                self.logger.warning(f"Попытка подключения {attempt + 1}/{retries} не удалась: {e}")
+                if ssl_context is not None and ssl_context.session is not None:
+                    # контроллер мог не принять сохранённую сессию — следующая попытка без неё
+                    ssl_context.session = None
+                self.logger.warning("Попытка подключения %s/%s не удалась: %s", attempt + 1, retries, e)
                 if attempt < retries - 1:
                     await asyncio.sleep(delay)
 
-            raise ConnectionError(f"Не удалось подключиться к {self.host}:{self.port} после {retries} попыток")
+        raise ConnectionError(f"Не удалось подключиться к {self.host}:{self.port} после {retries} попыток")
+
+    def ssl_context(self) -> SessionReusingContext:
+        """
+        SSLContext клиента. Создаётся один раз: сертификат и ключ читаются
+        с диска только при первом подключении.
+        """
+        if self._ssl_context is None:
+            # context.options &= ~ssl.OP_NO_TLSv1_3 & ~ssl.OP_NO_TLSv1_2 & ~ssl.OP_NO_TLSv1_1
+            # context.check_hostname = False
+            ssl_context = SessionReusingContext(ssl.PROTOCOL_TLS_CLIENT)
+            # ssl_context.check_hostname = True
+            ssl_context.verify_mode = ssl.CERT_REQUIRED
+            ssl_context.minimum_version = ssl.TLSVersion.TLSv1
+            ssl_context.set_ciphers("DEFAULT@SECLEVEL=0")
+            ssl_context.load_verify_locations(self.server_cert)
+            ssl_context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
+            self._ssl_context = ssl_context
+        return self._ssl_context
+
+    def _record_handshake(self, seconds: float):
+        ssl_object = self.writer.get_extra_info("ssl_object")
+        kind = "resumed" if ssl_object is not None and ssl_object.session_reused else "full"
+        self._handshakes[kind] += 1
+        self._handshake_seconds[kind] += seconds
+        self.last_handshake_seconds = seconds
+        if ssl_object is None:
+            self.logger.info("Подключено к %s:%s", self.host, self.port)
+        else:
+            self.logger.info(
+                "Подключено к %s:%s (%s, %s, %.0f мс)",
+                self.host, self.port, ssl_object.version(),
+                "сессия возобновлена" if kind == "resumed" else "полное рукопожатие", seconds * 1000
+            )
+
+    def _save_tls_session(self):
+        # в TLS 1.3 билет сессии приходит после рукопожатия, поэтому сессия запоминается при отключении
+        if not self.reuse_tls_session or self._ssl_context is None or self.writer is None:
+            return
+        ssl_object = self.writer.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.session is not None:
+            self._ssl_context.session = ssl_object.session
+
+    def stats(self) -> dict:
+        """
+        Метрики подключений.
+
+        :return: принятые пакеты и байты, отправленные байты, число полных и возобновлённых рукопожатий,
+                 их среднее и последнее время (сек)
+        """
+        stats = {
+            "in_flight": self.in_flight(),
+            "frames_received": self.frames_received,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "last_handshake_seconds": round(self.last_handshake_seconds, 4),
+        }
+        for kind in ("full", "resumed"):
+            count = self._handshakes[kind]
+            stats[f"handshakes_{kind}"] = count
+            stats[f"handshake_{kind}_avg_seconds"] = round(self._handshake_seconds[kind] / count, 4) if count else 0.0
+        return stats
 
+    @property
+    def connected(self) -> bool:
+        """Установлено ли соединение."""
+        return self.writer is not None and not self.writer.is_closing()
 
     async def send(self, data: bytes):
         """
         Отправить данные серверу.
 
         :param data: байты для отправки
-        :raises ConnectionError: если соединение не установлено
+        :raises ConnectionError: если соединение не установлено или разорвано (в том числе ошибка TLS)
         """
-        if not self.writer:
+        if not self.connected:
             raise ConnectionError("Не подключено")
-        self.writer.write(data)
-        await self.writer.drain()
-        self.logger.info(f"Отправлено {len(data)} байт")
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except ConnectionError:
+            raise
+        except OSError as e:
+            raise ConnectionError(f"Ошибка отправки: {e}") from e
+        self.bytes_sent += len(data)
+        self.logger.debug("Отправлено %d байт", len(data))
+        if self.capture is not None:
+            self.capture.write(OUTBOUND, data[FRAME_HEADER_SIZE:])
+
+    async def request(self, command: Dict[str, Any], timeout: float | None = None) -> Dict[str, Any]:
+        """
+        Отправить команду и дождаться ответа контроллера на неё.
+
+        Ответ сопоставляется с командой по паре (Id, Command), поэтому по одному
+        соединению может одновременно выполняться много запросов. Ответы
+        доставляет цикл приёма через `resolve_reply`.
+
+        Если соединение разорвано, запрос продолжает ждать: после
+        переподключения команда будет отправлена снова (см. `replay`).
+
+        :param command: команда PACS с полями Id и Command
+        :param timeout: сколько ждать ответа (сек), None — без ограничения
+        :return: ответ контроллера
+        :raises DuplicateRequestError: если запрос с теми же Id и Command уже ожидает ответа
+        :raises asyncio.TimeoutError: если ответ не пришёл за timeout
+        :raises ConnectionError: если клиент закрыт до ответа
+        """
+        key = (int(command["Id"]), command["Command"])
+        if key in self._requests:
+            raise DuplicateRequestError(f"Команда {key[1]} с Id={key[0]} уже ожидает ответа")
+
+        future = asyncio.get_running_loop().create_future()
+        self._requests[key] = future
+        self._commands[key] = command
+        try:
+            try:
+                await self.send(encode_frame(command))
+            except ConnectionError as e:
+                self.logger.warning("Команда %s с Id=%s будет отправлена после переподключения: %s", key[1], key[0], e)
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            if self._requests.get(key) is future:
+                del self._requests[key]
+                del self._commands[key]
+
+    async def replay(self) -> int:
+        """
+        Повторно отправить команды всех запросов, ожидающих ответа.
+
+        Вызывается после переподключения: ответы на команды, отправленные
+        в разорванное соединение, уже не придут.
+
+        :return: количество отправленных команд
+        :raises ConnectionError: если соединение снова разорвано
+        """
+        commands = list(self._commands.values())
+        for command in commands:
+            await self.send(encode_frame(command))
+        if commands:
+            self.logger.info("Повторно отправлено ожидающих команд: %s", len(commands))
+        return len(commands)
+
+    def resolve_reply(self, reply: Dict[str, Any]) -> bool:
+        """
+        Передать ответ контроллера ожидающему запросу.
+
+        :param reply: разобранный пакет ответа
+        :return: True, если нашёлся запрос с теми же Id и Command
+        """
+        try:
+            key = (int(reply.get("Id")), reply.get("Command"))
+        except (TypeError, ValueError):
+            return False
+        future = self._requests.pop(key, None)
+        self._commands.pop(key, None)
+        if future is None or future.done():
+            return False
+        future.set_result(reply)
+        return True
+
+    def fail_request(self, request_id: int, command: str, error: Exception) -> bool:
+        """
+        Завершить ожидающий запрос ошибкой (например, по истечении срока команды).
 
-    async def receive_exactly(self, n):
+        :return: True, если запрос ожидал ответа
+        """
+        future = self._requests.pop((request_id, command), None)
+        self._commands.pop((request_id, command), None)
+        if future is None or future.done():
+            return False
+        future.set_exception(error)
+        return True
+
+    def in_flight(self) -> int:
+        """Количество запросов, ожидающих ответа."""
+        return len(self._requests)
+
+    async def receive_exactly(self, n: int) -> bytes:
         """
         Получить ровно N байт от сервера.
 
+        Данные собираются во внутреннем буфере StreamReader и копируются
+        один раз, без наращивания промежуточных bytes.
+
         :param n: количество байт
         :return: байтовая строка
-        :raises ConnectionError: если соединение разорвано
+        :raises ConnectionError: если соединение разорвано (в том числе ошибка TLS)
         """
-
         if not self.reader:
             raise ConnectionError("Не подключено")
 
-        data = b''
-        while len(data) < n:
-            chunk = await self.reader.read(n - len(data))
-            if not chunk:
-                raise ConnectionError("Соединение закрыто")
-            data += chunk
-        self.logger.debug(f"Получено {len(data)} байт")
-        return data
+        try:
+            return await self.reader.readexactly(n)
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError(f"Соединение закрыто (получено {len(e.partial)} из {n} байт)") from e
+        except ConnectionError:
+            raise
+        except OSError as e:
+            # ssl.SSLError и прочие ошибки сокета: вызывающий обрабатывает только ConnectionError
+            raise ConnectionError(f"Ошибка чтения: {e}") from e
 
-    async def close(self):
+    async def receive_frame(self, idle_timeout: float | None = None) -> bytes | None:
+        """
+        Получить данные одного пакета протокола PACS: 4-байтовая длина (little-endian) + данные.
+
+        Таймаут ожидания idle_timeout действует только на заголовок: readexactly
+        не забирает байты из буфера, пока их не наберётся нужное количество,
+        поэтому отмена по таймауту не рассинхронизирует поток. Данные пакета,
+        начавшего поступать, должны прийти за frame_timeout: иначе соединение
+        считается зависшим (граница следующего пакета уже потеряна).
+
+        :param idle_timeout: сколько ждать начала пакета (сек), None — без ограничения
+        :return: данные пакета без заголовка или None, если пакет не начал поступать за idle_timeout
+        :raises FrameTooLargeError: если длина в заголовке больше max_frame_size
+        :raises ConnectionError: если соединение разорвано или данные пакета не пришли за frame_timeout
+        """
+        try:
+            header = await asyncio.wait_for(self.receive_exactly(FRAME_HEADER_SIZE), timeout=idle_timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        length = int.from_bytes(header, "little")
+        if length > self.max_frame_size:
+            raise FrameTooLargeError(
+                f"Длина пакета {length} байт превышает допустимую {self.max_frame_size} байт"
+            )
+
+        try:
+            async with asyncio.timeout(self.frame_timeout):
+                payload = await self.receive_exactly(length)
+        except TimeoutError:
+            raise ConnectionError(
+                f"Данные пакета ({length} байт) не получены за {self.frame_timeout} сек"
+            ) from None
+        self.frames_received += 1
+        self.bytes_received += FRAME_HEADER_SIZE + length
+        self.logger.debug("Получено %d байт", FRAME_HEADER_SIZE + length)
+        if self.capture is not None:
+            self.capture.write(INBOUND, payload)
+        return payload
+
+    async def disconnect(self):
         """
-        Закрыть соединение.
+        Закрыть соединение, сохранив ожидающие ответа запросы для `replay`.
         """
         if self.writer:
-            self.writer.close()
-            await self.writer.wait_closed()
-            self.logger.info("TCP соединение закрыто")
+            self._save_tls_session()
+            writer = self.writer
             self.writer = None
             self.reader = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError) as e:
+                self.logger.debug("Ошибка при закрытии TCP соединения: %s", e)
+            self.logger.info("TCP соединение закрыто")
+
+    async def close(self):
+        """
+        Закрыть соединение; ожидающие ответа запросы завершаются ConnectionError.
+        """
+        await self.disconnect()
+        for (request_id, command) in list(self._requests):
+            self.fail_request(request_id, command, ConnectionError("Соединение закрыто до получения ответа"))
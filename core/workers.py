@@ -0,0 +1,164 @@
+import multiprocessing
+import multiprocessing.connection
+import signal
+import time
+import zlib
+from typing import Callable
+
+from core.controllers import ControllerEndpoint
+from core.scheduler import RetryPolicy
+
+
+def shard_controllers(endpoints: list[ControllerEndpoint], workers: int) -> list[list[ControllerEndpoint]]:
+    """
+    Распределяет контроллеры по рабочим процессам.
+
+    Номер процесса — crc32 имени контроллера по модулю числа процессов,
+    поэтому при том же числе процессов контроллер всегда обслуживается
+    одним и тем же процессом (и между перезапусками сервиса тоже, в отличие
+    от hash(), который зависит от PYTHONHASHSEED).
+
+    :param endpoints: все контроллеры
+    :param workers: число рабочих процессов
+    :return: список контроллеров для каждого процесса (может быть пустым)
+    """
+    shards: list[list[ControllerEndpoint]] = [[] for _ in range(workers)]
+    for endpoint in endpoints:
+        shards[zlib.crc32(endpoint.name.encode("utf-8")) % workers].append(endpoint)
+    return shards
+
+
+class _Worker:
+    def __init__(self, index: int, endpoints: list[ControllerEndpoint]):
+        self.index = index
+        self.endpoints = endpoints
+        self.process: multiprocessing.Process | None = None
+        self.started_at = 0.0
+        self.restart_at: float | None = None
+        self.restarts = 0
+        self.attempt = 0
+
+
+class WorkerPool:
+    """
+    Пул рабочих процессов, каждый из которых обслуживает свою часть контроллеров.
+
+    У каждого процесса свой цикл событий, пул соединений с БД и соединения
+    с RabbitMQ. Родительский процесс только следит за ними: процесс,
+    завершившийся без запроса остановки (с любым кодом), перезапускается
+    с экспоненциальной задержкой, а по SIGINT/SIGTERM сигнал передаётся
+    всем процессам и пул ждёт их завершения.
+    """
+    def __init__(
+        self,
+        shards: list[list[ControllerEndpoint]],
+        target: Callable[[int, list[ControllerEndpoint]], None],
+        logger,
+        restart_policy: RetryPolicy,
+        stop_timeout: float = 30.0
+    ):
+        """
+        :param shards: контроллеры каждого процесса (см. shard_controllers); пустые пропускаются
+        :param target: функция процесса target(index, endpoints), должна импортироваться по имени (spawn)
+        :param logger:
+        :param restart_policy: задержки перезапуска; max_attempts = 0 — перезапускать бесконечно
+        :param stop_timeout: сколько ждать завершения процессов при остановке (сек)
+        """
+        self.target = target
+        self.logger = logger
+        self.restart_policy = restart_policy
+        self.stop_timeout = stop_timeout
+        self.workers = [_Worker(index, endpoints) for index, endpoints in enumerate(shards) if endpoints]
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = False
+
+    def run(self):
+        """Запускает процессы и следит за ними до остановки (блокирующий вызов)."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._on_signal)
+
+        for worker in self.workers:
+            self._start(worker)
+
+        while not self._stopping:
+            alive = {worker.process.sentinel: worker for worker in self.workers if worker.process is not None}
+            for sentinel in multiprocessing.connection.wait(list(alive), timeout=1.0):
+                self._on_exit(alive[sentinel])
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is not None and worker.restart_at <= now and not self._stopping:
+                    self._start(worker)
+            if all(worker.process is None and worker.restart_at is None for worker in self.workers):
+                break
+
+        self._stop_all()
+
+    def _on_signal(self, signum, frame):
+        self.logger.info("Получен сигнал %s, останавливаем рабочие процессы...", signal.Signals(signum).name)
+        self._stopping = True
+
+    def _start(self, worker: _Worker):
+        names = ", ".join(endpoint.name for endpoint in worker.endpoints)
+        worker.process = self._context.Process(
+            target=self.target,
+            args=(worker.index, worker.endpoints),
+            name=f"pacs-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        self.logger.info(
+            "Рабочий процесс %s (pid %s) запущен, контроллеры: %s", worker.index, worker.process.pid, names
+        )
+
+    def _on_exit(self, worker: _Worker):
+        process = worker.process
+        process.join()
+        worker.process = None
+        if self._stopping:
+            self.logger.info("Рабочий процесс %s завершён", worker.index)
+            return
+        # без запроса остановки процесс не должен завершаться, даже с кодом 0:
+        # иначе его контроллеры остаются без обслуживания
+
+        if time.monotonic() - worker.started_at >= self.restart_policy.max_delay:
+            worker.attempt = 0
+        worker.attempt += 1
+        if self.restart_policy.max_attempts and worker.attempt > self.restart_policy.max_attempts:
+            self.logger.error(
+                "Рабочий процесс %s завершился (код %s), лимит перезапусков исчерпан",
+                worker.index, process.exitcode
+            )
+            return
+
+        delay = self.restart_policy.delay_for(worker.attempt)
+        worker.restarts += 1
+        worker.restart_at = time.monotonic() + delay
+        self.logger.error(
+            "Рабочий процесс %s завершился (код %s), перезапуск через %.1f сек", worker.index, process.exitcode, delay
+        )
+
+    def _stop_all(self):
+        running = [worker.process for worker in self.workers if worker.process is not None]
+        for process in running:
+            process.terminate()  # SIGTERM — процесс завершает работу штатно
+        deadline = time.monotonic() + self.stop_timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                self.logger.warning(
+                    "Процесс %s не завершился за %s сек, принудительная остановка", process.name, self.stop_timeout
+                )
+                process.kill()
+                process.join()
+
+    def stats(self) -> dict:
+        """Состояние рабочих процессов: pid, число перезапусков и контроллеры."""
+        return {
+            worker.index: {
+                "pid": worker.process.pid if worker.process is not None else None,
+                "restarts": worker.restarts,
+                "controllers": [endpoint.name for endpoint in worker.endpoints],
+            }
+            for worker in self.workers
+        }
@@ -1,29 +1,41 @@
 import asyncio
-import json
+import contextlib
+import os
 import signal
-from datetime import datetime, timedelta
+import sys
+import time
 
-from core.command_manager import CommandManager
+from core.command_manager import CommandManager, TIMEOUT
+from core.controllers import ControllerEndpoint, ControllerRegistry, ControllerSession, parse_controllers
 from core.settings import settings
 from core.db import DB
-from rabbitmq.handlers import rmq_handler
-from core.tcpclient import TcpClient
+from core.metrics import (
+    FRAME_DECODE_SECONDS,
+    FRAMES_RECEIVED,
+    RECEIVE_LOOP_SECONDS,
+    MetricsServer,
+    registry as metrics,
+    samples_from_stats
+)
+from core.models import FRAME_MODELS, ModelValidationError, PendingCommand, decode_list
+from core.pipeline import EventPipeline
+from core.diagnostics import LoopMonitor, span
+from core.directory_sync import DirectorySync
+from core.scheduler import CommandScheduler, RetryPolicy
+from core.spool import Spool
+from rabbitmq.handlers import command_controller, command_key, rmq_handler
+from core.tcpclient import TcpClient, encode_frame
+from core.workers import WorkerPool, shard_controllers
 from rabbitmq.consumer import RabbitMQConsumer
 from rabbitmq.producer import RabbitMQProducer
 from utils.logger import get_logger
 
-from utils.functions import (
-    create_buffer,
-    insert_event_to_db,
-    chunk_data_async,
-    load_system_ap,
-    load_system_card_owner
-)
-from utils.revers_commands import get_edit_card_command, get_delete_card_command
+from utils import codec
+from utils.functions import create_buffer, chunk_data_async, log_rejected
+from utils.revers_commands import get_stage_command
 
 logger = get_logger(settings.DEBUG_MODE)
 
-command_manager = CommandManager(logger)
 
 # глобальное событие остановки
 # shutdown_event = asyncio.Event()
@@ -38,13 +50,32 @@ command_manager = CommandManager(logger)
 #     if producer_instance:
 #         producer_instance.close()  # жёстко рвём соединение
 
-async def receive_data(client: TcpClient, db: DB, producer: RabbitMQProducer, shutdown_event, command_manager):
+# Значения метки command: контроллер может прислать что угодно в поле Command,
+# а каждое новое значение метки — отдельный временной ряд в Prometheus
+CARD_COMMANDS = ("addcard", "editcard", "loadcard", "delcard")
+COMMAND_LABELS = frozenset(FRAME_MODELS) | {"ping", *CARD_COMMANDS}
+
+
+def command_label(command) -> str:
+    """Значение метки command для метрик пакета: известная команда или "other"."""
+    return command if isinstance(command, str) and command in COMMAND_LABELS else "other"
+
+
+async def receive_data(
+    client: TcpClient,
+    pipeline: EventPipeline,
+    shutdown_event,
+    command_manager
+):
     """
     Основной цикл приёма данных от PACS.
 
+    Цикл только читает и разбирает пакеты: события и справочники передаются
+    в конвейер, поэтому медленные Postgres/RabbitMQ не задерживают чтение
+    сокета и ответы на ping.
+
     :param client: экземпляр TcpClient
-    :param db: подключение к Postgres
-    :param producer: продюсер сообщений RabbitMQ
+    :param pipeline: конвейер сохранения и публикации
     :param shutdown_event:
     :param command_manager: Менеджер ожидающих команд
     """
@@ -54,126 +85,57 @@ async def receive_data(client: TcpClient, db: DB, producer: RabbitMQProducer, sh
     await client.send(create_buffer(settings.USERLIST_CMD))
 
     logger.debug(command_manager)
+    received_at = None
     while not shutdown_event.is_set():
         try:
-            try:
-                raw_data = await asyncio.wait_for(
-                    chunk_data_async(client),
-                    timeout=5
-                )
-            except asyncio.TimeoutError:
-                continue
-            # raw_data = await chunk_data_async(client)
-            if not raw_data or len(raw_data) < 4:
+            with span("receive_wait"):
+                payload = await chunk_data_async(client)
+            if payload is None:
+                continue  # просто проверили таймаут → снова в цикл
+            if not payload:
                 logger.warning("Получены пустые или недействительные данные")
-                continue # просто проверили таймаут → снова в цикл
+                continue
 
-            payload = raw_data[4:]
+            received_at = time.perf_counter()
             try:
-                received = json.loads(payload.decode('utf-8'))
-            except json.JSONDecodeError as e:
-                logger.error(f"Получен недопустимый JSON: {e}, данные: {payload[:200]}...")
+                received = codec.loads(payload)
+            except codec.DecodeError as e:
+                logger.error("Получен недопустимый JSON: %s, данные: %s...", e, payload[:200])
                 continue
 
             command = received.get("Command")
             data = received.get("Data")
+            label = command_label(command)
+            FRAMES_RECEIVED.inc(label)
+            if command not in FRAME_MODELS:
+                FRAME_DECODE_SECONDS.observe(time.perf_counter() - received_at, label)
 
             match command:
                 case "ping":
                     await client.send(create_buffer(settings.PING_CMD))
-                    logger.debug(f"RECEIVED: {received}")
-
-                case "events":
-                    logger.debug(f"RECEIVED: {received}")
-                    if isinstance(data, list):
-                        event_ids = await insert_event_to_db(db, data, logger)
-                        for eid in event_ids:
-                            await producer.publish(settings.RMQ_EVENTS_EXCHANGE_NAME, {"new_pacs_event_id": eid})
-                    else:
-                        logger.warning(f"Ожидался список в 'events.Data', получен {type(data)}: {data}")
-
-                case "userlist":
-                    if isinstance(data, list):
-                        await load_system_card_owner(db, data, logger)
-                    else:
-                        logger.warning(f"Ожидался список в 'userlist.Data', получен {type(data)}: {data}")
-
-                case "aplist":
-                    if isinstance(data, list):
-                        await load_system_ap(db, data, logger)
-                    else:
-                        logger.warning(f"Ожидался список в 'aplist.Data', получен {type(data)}: {data}")
-
-                case "addcard":
-                    # logger.debug(f"Pending before get: {command_manager.all()}")
-                    err = received.get("ErrCode")
-                    event_id = int(received.get("Id"))
-
-                    logger.debug(f"Ответ от команды addcard: {received}")
-
-                    cmd = command_manager.get(event_id)
-                    if not cmd:
-                        logger.warning(f"Нет ожидающей команды для event_id={event_id}")
-                        continue
-                    if err == 9:
-                        logger.info("Карта существует → пробуем editcard")
-
-                        now = datetime.now()
-                        dt_start = now - timedelta(hours=1)
-                        dt_end = now + timedelta(hours=8)
-
-                        edit_cmd = get_edit_card_command(
-                            event_id,
-                            cmd["card_number"],
-                            dt_start,
-                            dt_end
-                        )
-
-                        command_manager.update_stage(event_id, "editcard")
-                        await client.send(create_buffer(json.dumps(edit_cmd)))
-
-                    elif err == 0:
-                        command_manager.remove(event_id)
-
-                case "editcard":
-                    err = received.get("ErrCode")
-                    event_id = int(received.get("Id"))
-
-                    logger.debug(f"Ответ от команды editcard: {received}")
-
-                    if err in (0, 10):
-                        command_manager.remove(event_id)
-
-                case "loadcard":
-                    logger.debug(f"Ответ от команды loadcard: {received}")
-                case "delcard":
-                    # logger.debug(f"Pending before get: {command_manager.all()}")
-                    err = received.get("ErrCode")
-                    event_id = int(received.get("Id"))
-
-                    logger.debug(f"Ответ от команды delcard: {received}")
-
-                    cmd = command_manager.get(event_id)
-                    if not cmd:
-                        logger.warning(f"Нет ожидающей команды для event_id={event_id}")
+                    logger.debug("RECEIVED: %s", received)
+
+                case "events" | "userlist" | "aplist":
+                    if command == "events":
+                        logger.debug("RECEIVED: %s", received)
+                    try:
+                        items, rejected = decode_list(FRAME_MODELS[command], data)
+                    except ModelValidationError as e:
+                        logger.warning("Некорректное поле '%s.Data' (%s): %s", command, e, data)
                         continue
+                    FRAME_DECODE_SECONDS.observe(time.perf_counter() - received_at, command)
+                    log_rejected(rejected, command, logger)
+                    with span("submit"):
+                        await pipeline.submit(command, items, payload)
 
-                    if err == 6:
-                        logger.info(f"Повторное удаление карты {cmd["card_number"]}")
-
-                        delete_cmd = get_delete_card_command(
-                            event_id,
-                            cmd["card_number"]
-                        )
-
-                        await asyncio.sleep(10)
-                        await client.send(create_buffer(json.dumps(delete_cmd)))
-
-                    if err in (0, 10):
-                        command_manager.remove(event_id)
+                case "addcard" | "editcard" | "loadcard" | "delcard":
+                    logger.debug("Ответ от команды %s: %s", command, received)
+                    # ответ передаётся обработчику, ожидающему его в TcpClient.request
+                    if not client.resolve_reply(received):
+                        logger.warning("Нет ожидающей команды %s для Id=%s", command, received.get("Id"))
 
                 case _:
-                    logger.warning(f"Неизвестная или отсутствующая команда: {received}")
+                    logger.warning("Неизвестная или отсутствующая команда: %s", received)
 
         except ConnectionError:
             raise  # ВАЖНО
@@ -182,16 +144,94 @@ async def receive_data(client: TcpClient, db: DB, producer: RabbitMQProducer, sh
             if shutdown_event.is_set():
                 logger.info("receive_data остановлен")
             else:
-                logger.error(f"Ошибка в receive_data: {e}")
+                logger.error("Ошибка в receive_data: %s", e)
             await asyncio.sleep(1) # чтобы не зациклиться
 
+        finally:
+            if received_at is not None:
+                RECEIVE_LOOP_SECONDS.observe(time.perf_counter() - received_at)
+                received_at = None
+
+
+async def handle_command_timeout(
+    command: PendingCommand,
+    reason: str,
+    client: TcpClient,
+    producer: RabbitMQProducer,
+    command_manager: CommandManager,
+    scheduler: CommandScheduler,
+    controller: str | None = None
+):
+    """
+    Обрабатывает команду, на которую контроллер не ответил.
+
+    Просроченная команда повторяется (не более COMMAND_TIMEOUT_RETRIES раз):
+    ответ на повтор получит тот же ожидающий обработчик. Иначе — как и
+    вытесненная при переполнении — команда прерывается и, если задан
+    RMQ_COMMAND_FAILURES_EXCHANGE_NAME, публикуется в RabbitMQ как невыполненная.
+
+    :param command: снятая команда
+    :param reason: TIMEOUT или EVICTED
+    :param controller: имя контроллера, которому была отправлена команда
+    """
+    if reason == TIMEOUT and command.attempts < settings.COMMAND_TIMEOUT_RETRIES:
+        attempt = command.attempts + 1
+        logger.info(
+            "Повтор %s для event_id=%s (попытка %s/%s)",
+            command.stage, command.event_id, attempt, settings.COMMAND_TIMEOUT_RETRIES
+        )
+        command_manager.add(
+            event_id=command.event_id,
+            card_number=command.card_number,
+            event_type=command.event_type,
+            stage=command.stage,
+            attempts=attempt
+        )
+        if client.connected:
+            await client.send(encode_frame(get_stage_command(command.stage, command.event_id, command.card_number)))
+        # иначе команда будет отправлена повторно после переподключения (TcpClient.replay)
+        return
+
+    scheduler.cancel(command.event_id)
+    client.fail_request(
+        command.event_id,
+        command.stage,
+        asyncio.TimeoutError(f"Нет ответа на {command.stage} для event_id={command.event_id}")
+    )
+    if not settings.RMQ_COMMAND_FAILURES_EXCHANGE_NAME:
+        return
+    # отдельный обменник: потребители новых событий не получают сообщений другого формата
+    await producer.publish(settings.RMQ_COMMAND_FAILURES_EXCHANGE_NAME, {
+        "pacs_command_failed": {
+            "event_id": command.event_id,
+            "event_type": command.event_type,
+            "stage": command.stage,
+            "reason": reason,
+            "controller": controller,
+        }
+    })
+
+
+# Ключи stats(), которые отдаются в /metrics как счётчики (остальные — gauge)
+CONTROLLER_COUNTERS = (
+    "reconnects", "frames_received", "bytes_received", "bytes_sent",
+    "handshakes_full", "handshakes_resumed", "timeouts", "evictions", "written", "dropped"
+)
+PIPELINE_COUNTERS = (
+    "submitted", "persisted", "published", "persist_errors", "publish_errors", "backpressure_waits",
+    "redriven", "unspooled", "appended", "acked", "compacted_segments", "duplicates"
+)
+
 
-async def main():
+async def main(endpoints: list[ControllerEndpoint] | None = None, worker: int | None = None):
     """
     Точка входа в приложение.
 
     Инициализация БД, RabbitMQ и TCP клиента.
     Запуск цикла обработки данных.
+
+    :param endpoints: контроллеры этого процесса (по умолчанию все из настроек)
+    :param worker: номер рабочего процесса в режиме WORKERS > 1
     """
     shutdown_event = asyncio.Event()
 
@@ -222,6 +262,31 @@ async def main():
     #     logger.info("Получен сигнал отключения...")
     #     shutdown_event.set()
         
+    all_endpoints = parse_controllers(
+        settings.TCP_CONTROLLERS,
+        settings.TCP_SERVER_HOST,
+        settings.TCP_SERVER_PORT
+    )
+    endpoints = endpoints or all_endpoints
+    directory = None
+    if len(all_endpoints) > 1 and settings.SYNC_DELETE_MISSING:
+        # каждый контроллер выгружает только свои точки доступа и владельцев карт
+        logger.warning("SYNC_DELETE_MISSING отключён: справочники заполняются несколькими контроллерами")
+        directory = DirectorySync(db, logger, delete_missing=False)
+
+    spool = None
+    if settings.SPOOL_DIR:
+        spool_dir = settings.SPOOL_DIR if worker is None else os.path.join(settings.SPOOL_DIR, f"worker-{worker}")
+        spool = Spool(spool_dir, logger, settings.SPOOL_SEGMENT_SIZE, settings.SPOOL_MAX_BYTES)
+        spool.open()
+
+    metrics_port = settings.METRICS_PORT + (worker or 0) if settings.METRICS_PORT else 0
+
+    def _on_command_timeout(session: ControllerSession, command: PendingCommand, reason: str):
+        return handle_command_timeout(
+            command, reason, session.client, producer, session.command_manager, scheduler, session.name
+        )
+
     try:
         async with (
             RabbitMQConsumer(
@@ -230,7 +295,9 @@ async def main():
                 virtual_host=settings.RMQ_VIRTUAL_HOST,
                 username=settings.RMQ_USER,
                 password=settings.RMQ_PASSWORD,
-                logger=logger
+                logger=logger,
+                prefetch_count=settings.RMQ_PREFETCH_COUNT,
+                concurrency=settings.RMQ_CONSUMER_CONCURRENCY
             ) as consumer,
             RabbitMQProducer(
                     host=settings.RMQ_HOST,
@@ -238,37 +305,128 @@ async def main():
                     virtual_host=settings.RMQ_VIRTUAL_HOST,
                     username=settings.RMQ_USER,
                     password=settings.RMQ_PASSWORD,
-                    logger=logger
-            ) as producer, TcpClient(
-                host=settings.TCP_SERVER_HOST,
-                port=settings.TCP_SERVER_PORT,
-                server_cert=settings.TCP_SERVER_CERT,
-                server_key=settings.TCP_SERVER_KEY,
-                server_cert_cn=settings.TCP_SERVER_CERT_CN,
-                logger=logger,
-            ) as client):
-                logger.info("Клиент PACS TCP запущен")
+                    logger=logger,
+                    max_in_flight=settings.RMQ_PUBLISH_MAX_IN_FLIGHT
+            ) as producer,
+            EventPipeline(db, producer, logger, directory=directory, spool=spool) as pipeline,
+            CommandScheduler(logger) as scheduler,
+            ControllerRegistry(
+                endpoints,
+                shutdown_event,
+                logger,
+                _on_command_timeout,
+                default=all_endpoints[0].name
+            ) as registry,
+            contextlib.AsyncExitStack() as stack):
+                logger.info("Клиент PACS TCP запущен, контроллеры: %s", ", ".join(registry.sessions))
+                if metrics_port:
+                    metrics.register_collector(lambda: [
+                        sample
+                        for name, session in registry.sessions.items()
+                        for sample in samples_from_stats(
+                            "pacs_controller", session.stats(), {"controller": name}, CONTROLLER_COUNTERS
+                        )
+                    ])
+                    metrics.register_collector(
+                        lambda: samples_from_stats("pacs_pipeline", pipeline.stats(), {}, PIPELINE_COUNTERS)
+                    )
+                    await stack.enter_async_context(MetricsServer(metrics, settings.METRICS_HOST, metrics_port, logger))
+                if settings.DIAGNOSTICS:
+                    monitor = await stack.enter_async_context(LoopMonitor(
+                        logger,
+                        settings.DIAGNOSTICS_LAG_INTERVAL,
+                        settings.DIAGNOSTICS_STALL_THRESHOLD,
+                        settings.DIAGNOSTICS_FILE or None
+                    ))
+                    metrics.register_collector(
+                        lambda: samples_from_stats("pacs_diagnostics", monitor.stats(), {}, ("stalls",))
+                    )
                 await consumer.connect()
 
-                # Определяем обработчик внутри области видимости, чтобы захватить 'client'
+                # команда портала выполняется на контроллере из поля "controller"
+                all_names = {endpoint.name for endpoint in all_endpoints}
+
                 async def _rmq_handler_wrapped(message):
-                    return await rmq_handler(message, client, command_manager)
+                    controller = command_controller(message)
+                    session = registry.get(controller)
+                    if session is None:
+                        # обменник fanout: команду получают все процессы, о неизвестном
+                        # контроллере сообщает только процесс контроллера по умолчанию
+                        if registry.default is not None and controller not in all_names:
+                            logger.error(
+                                "Команда для неизвестного контроллера '%s': %s", controller, message.body[:200]
+                            )
+                        return
+                    return await rmq_handler(message, session.client, session.command_manager, scheduler)
 
                 # Регистрируем обработчики очередей
                 # await consumer.consume("events", events_handler)
-                await consumer.consume(settings.RMQ_COMMANDS_EXCHANGE_NAME, "pacs_client", _rmq_handler_wrapped)
+                # у каждого рабочего процесса своя очередь, привязанная к тому же обменнику;
+                # очереди процессов, которых больше нет (WORKERS уменьшен), RabbitMQ удаляет сам
+                queue_arguments = None
+                if worker is not None and settings.WORKER_QUEUE_EXPIRES:
+                    queue_arguments = {"x-expires": int(settings.WORKER_QUEUE_EXPIRES * 1000)}
+                await consumer.consume(
+                    settings.RMQ_COMMANDS_EXCHANGE_NAME,
+                    "pacs_client" if worker is None else f"pacs_client.{worker}",
+                    _rmq_handler_wrapped,
+                    key=command_key,
+                    arguments=queue_arguments
+                )
 
-                await receive_data(client, db, producer, shutdown_event, command_manager)
+                # при разрыве соединения супервизор контроллера переподключается и запускает приём заново
+                await registry.run(
+                    lambda session: receive_data(session.client, pipeline, shutdown_event, session.command_manager)
+                )
+                if not shutdown_event.is_set():
+                    raise ConnectionError("все контроллеры отключены")
     except Exception as e:
-        logger.error(f"TCP соединение не удалось: {e}")
-        # sys.exit(1)
+        logger.error("TCP соединение не удалось: %s", e)
+        failed = True
+    else:
+        failed = False
     finally:
         logger.info("Закрытие соединений...")
         await db.close()
         logger.info("DB закрыта")
+        if spool is not None:
+            spool.close()
+
+    if failed and not shutdown_event.is_set():
+        # ненулевой код: процесс перезапустит пул рабочих процессов (или Docker)
+        sys.exit(1)
+
+def run_worker(index: int, endpoints: list[ControllerEndpoint]):
+    """Точка входа рабочего процесса: обслуживает свою часть контроллеров."""
+    asyncio.run(main(endpoints, worker=index))
+
+
+def run():
+    """
+    Запуск сервиса: в одном процессе или, при WORKERS > 1, в пуле рабочих
+    процессов, между которыми контроллеры распределены по имени.
+    """
+    if settings.WORKERS <= 1:
+        asyncio.run(main())
+        return
+
+    endpoints = parse_controllers(settings.TCP_CONTROLLERS, settings.TCP_SERVER_HOST, settings.TCP_SERVER_PORT)
+    pool = WorkerPool(
+        shard_controllers(endpoints, settings.WORKERS),
+        run_worker,
+        logger,
+        RetryPolicy(
+            max_attempts=settings.WORKER_RESTART_MAX_ATTEMPTS,
+            delay=settings.WORKER_RESTART_DELAY,
+            max_delay=settings.WORKER_RESTART_MAX_DELAY,
+            jitter=settings.RECONNECT_JITTER
+        )
+    )
+    pool.run()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
     # try:
     #     asyncio.run(main())
     # except KeyboardInterrupt:
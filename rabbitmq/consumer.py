@@ -3,13 +3,35 @@ import aio_pika
 from aio_pika.abc import AbstractRobustConnection, AbstractRobustChannel, AbstractIncomingMessage
 from aio_pika.exceptions import AMQPConnectionError
 
+from rabbitmq.dispatcher import KeyedDispatcher
+
 
 class RabbitMQConsumer:
     """
      Асинхронный потребитель RabbitMQ для получения сообщений.
      Использует aio-pika (поддержка reconnect).
      """
-    def __init__(self, host: str, port: int, virtual_host: str, username: str, password: str, logger=None):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        virtual_host: str,
+        username: str,
+        password: str,
+        logger=None,
+        prefetch_count: int = 64,
+        concurrency: int = 32
+    ):
+        """
+        :param host: хост RabbitMQ
+        :param port: порт RabbitMQ
+        :param virtual_host: виртуальный хост
+        :param username: имя пользователя
+        :param password: пароль
+        :param logger:
+        :param prefetch_count: сколько неподтверждённых сообщений брокер выдаёт потребителю (basic_qos)
+        :param concurrency: сколько сообщений обрабатывается одновременно
+        """
         self.host = host
         self.port = port
         self.virtual_host = virtual_host
@@ -19,6 +41,8 @@ class RabbitMQConsumer:
 
         self.connection:AbstractRobustConnection | None = None
         self.channel: AbstractRobustChannel | None = None
+        self.prefetch_count = prefetch_count
+        self.dispatcher = KeyedDispatcher(concurrency, logger)
 
     async def __aenter__(self):
         """Вход в асинхронный контекстный менеджер."""
@@ -47,18 +71,25 @@ class RabbitMQConsumer:
                     timeout=10
                 )
                 self.channel = await self.connection.channel()
-                self.logger.info(f"Подключение к RabbitMQ {self.host}:{self.port}/{self.virtual_host}")
+                await self.channel.set_qos(prefetch_count=self.prefetch_count)
+                self.logger.info("Подключение к RabbitMQ %s:%s/%s", self.host, self.port, self.virtual_host)
                 return
             except AMQPConnectionError as e:
-                self.logger.warning(f"Попытка подключения {attempt}/{retries} не удалась: {e}")
+                self.logger.warning("Попытка подключения %s/%s не удалась: %s", attempt, retries, e)
                 await asyncio.sleep(delay)
 
         raise ConnectionError(f"Не удалось подключиться к RabbitMQ по адресу {self.host}:{self.port}")
 
-    async def consume(self, exchange_name: str, queue_name: str, handler):
+    async def consume(self, exchange_name: str, queue_name: str, handler, key=None, arguments: dict | None = None):
         """
         Подписка на очередь и обработка сообщений.
         handler — это асинхронная функция, которая принимает message: IncomingMessage
+
+        Сообщения обрабатываются параллельно (не больше concurrency), но
+        сообщения с одинаковым ключом — строго в порядке получения.
+
+        :param key: функция message → ключ упорядочивания (None — без упорядочивания)
+        :param arguments: аргументы объявления очереди (например, {"x-expires": ...})
         """
         if not self.channel:
             raise RuntimeError("Канал RabbitMQ не инициализирован. Сначала вызовите метод connect().")
@@ -71,28 +102,37 @@ class RabbitMQConsumer:
         )
         # Объявляем Queue
         # Имя очереди лучше делать явным, если нужно, чтобы она не исчезала после отключения
-        queue = await self.channel.declare_queue(f"{exchange_name}.{queue_name}", durable=True)
+        queue = await self.channel.declare_queue(f"{exchange_name}.{queue_name}", durable=True, arguments=arguments)
 
         # Биндим очередь к обменнику
         # Для FANOUT routing_key игнорируется
         await queue.bind(exchange)  # все сообщения из exchange попадают в очередь
 
         async def wrapper(message: AbstractIncomingMessage):
-            await self._handle_message(message, handler)
+            # постановка в очередь ключа — синхронно, до первого await,
+            # чтобы порядок сообщений одного ключа совпадал с порядком доставки
+            try:
+                message_key = key(message) if key else None
+            except Exception as e:
+                self.logger.warning("Не удалось определить ключ сообщения: %s", e)
+                message_key = None
+            await self.dispatcher.submit(message_key, lambda: self._handle_message(message, handler))
 
         await queue.consume(wrapper)
-        self.logger.info(f"Начал слушать очередь {exchange_name}.{queue_name}")
+        self.logger.info("Начал слушать очередь %s.%s", exchange_name, queue_name)
 
     async def _handle_message(self, message: AbstractIncomingMessage, handler):
         """Вызов пользовательского обработчика"""
         try:
-            async with message.process():  # подтверждение ack/nack автоматически
+            # ack/reject автоматически, если обработчик сам не вернул сообщение в очередь
+            async with message.process(ignore_processed=True):
                 await handler(message)  # вызываем твой кастомный обработчик
         except Exception as e:
-            self.logger.error(f"Ошибка обработки сообщения: {e}")
+            self.logger.error("Ошибка обработки сообщения: %s", e)
 
     async def close(self):
         """Закрытие соединения."""
+        await self.dispatcher.close()
         if self.connection and not self.connection.is_closed:
             await self.connection.close()
             self.logger.info("Соединение RabbitMQ закрыто")
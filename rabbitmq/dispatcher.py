@@ -0,0 +1,77 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class KeyedDispatcher:
+    """
+    Параллельное выполнение задач с сохранением порядка по ключу.
+
+    Задачи с разными ключами выполняются одновременно (не больше
+    `concurrency`), а задачи с одинаковым ключом — строго по очереди,
+    в порядке вызова `submit`. Используется для команд портала: команды
+    по разным картам обрабатываются параллельно, а issue и wdraw одной
+    карты никогда не переставляются.
+    """
+    def __init__(self, concurrency: int, logger):
+        """
+        :param concurrency: максимум одновременно выполняемых задач
+        :param logger:
+        """
+        self.concurrency = concurrency
+        self.logger = logger
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues: dict[Hashable, deque] = {}
+        self._workers: set[asyncio.Task] = set()
+        self.active = 0
+
+    def submit(self, key: Hashable | None, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Поставить задачу в очередь ключа.
+
+        :param key: ключ упорядочивания; None — задача ни с чем не упорядочивается
+        :param job: функция без аргументов, возвращающая awaitable
+        :return: Future с результатом задачи
+        """
+        if key is None:
+            key = object()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            queue.append((job, future))
+            worker = asyncio.create_task(self._drain(key, queue))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        else:
+            queue.append((job, future))
+        return future
+
+    def pending(self) -> int:
+        """Количество задач, ожидающих выполнения или выполняющихся."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def _drain(self, key: Hashable, queue: deque):
+        try:
+            while queue:
+                # задача остаётся в очереди до завершения, чтобы новые задачи ключа вставали за ней
+                job, future = queue[0]
+                async with self._semaphore:
+                    self.active += 1
+                    try:
+                        future.set_result(await job())
+                    except Exception as e:
+                        future.set_exception(e)
+                    finally:
+                        self.active -= 1
+                queue.popleft()
+        finally:
+            del self._queues[key]
+            for _, future in queue:
+                future.cancel()
+
+    async def close(self):
+        """Прерывает выполняющиеся и отбрасывает ожидающие задачи."""
+        for worker in list(self._workers):
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -1,11 +1,18 @@
 import asyncio
-import json
-import os
 from datetime import datetime, timedelta
 
-from utils.functions import create_buffer, calculate_card_number
+from core.scheduler import CommandCancelledError, CommandScheduler, RetryPolicy
+from core.settings import settings
+from core.tcpclient import DuplicateRequestError
+from utils import codec
+from utils.functions import calculate_card_number
 from utils.logger import get_logger
-from utils.revers_commands import get_load_card_command, get_delete_card_command, get_add_card_command
+from utils.revers_commands import (
+    get_add_card_command,
+    get_delete_card_command,
+    get_edit_card_command,
+    get_load_card_command
+)
 
 # from rabbitmq.schemas import Event
 #
@@ -14,56 +21,165 @@ from utils.revers_commands import get_load_card_command, get_delete_card_command
 # # async def events_handler(message):
 # #     logger.debug(f"📩 [events] {message.body.decode()}")
 #
-logger = get_logger(os.getenv("DEBUG_MODE", True))
+logger = get_logger(settings.DEBUG_MODE)
 
-async def rmq_handler(message, tcp_client, command_manager):
+delcard_retry = RetryPolicy(
+    max_attempts=settings.DELCARD_RETRY_MAX_ATTEMPTS,
+    delay=settings.DELCARD_RETRY_DELAY,
+    backoff=settings.DELCARD_RETRY_BACKOFF,
+    max_delay=settings.DELCARD_RETRY_MAX_DELAY
+)
+
+
+async def issue_card(tcp_client, command_manager, event_id: int, card_number: int, dt_start: datetime, dt_end: datetime):
+    """
+    Выдача гостевой карты: addcard, а если карта уже существует (ErrCode 9) — editcard.
+
+    :return: ответ контроллера на последнюю команду
+    """
+    reply = await tcp_client.request(get_add_card_command(event_id, card_number, dt_start, dt_end))
+    if reply.get("ErrCode") == 9:
+        logger.info("Карта существует → пробуем editcard")
+        command_manager.update_stage(event_id, "editcard")
+        reply = await tcp_client.request(get_edit_card_command(event_id, card_number, dt_start, dt_end))
+    return reply
+
+
+async def withdraw_card(tcp_client, command_manager, scheduler: CommandScheduler, event_id: int, card_number: int):
+    """
+    Изъятие гостевой карты: loadcard (запрет использования), затем через паузу delcard.
+
+    Пока контроллер отвечает на delcard ErrCode 6, удаление повторяется
+    по политике delcard_retry. Паузы выдерживает планировщик, поэтому
+    обработчик не занимает цикл событий.
+
+    :return: ответ контроллера на последнюю команду
+    """
+    delete_cmd = get_delete_card_command(event_id, card_number)
+
+    # запрет использования карты
+    await tcp_client.request(get_load_card_command(event_id, card_number))
+
+    # удаление карты
+    command_manager.update_stage(event_id, "delcard")
+    reply = await scheduler.schedule(event_id, settings.WDRAW_DELCARD_DELAY, tcp_client.request, delete_cmd)
+
+    while reply.get("ErrCode") == 6:
+        retry = scheduler.retry(event_id, delcard_retry, tcp_client.request, delete_cmd)
+        if retry is None:
+            logger.error("Карта %s не удалена: исчерпаны повторы delcard", card_number)
+            break
+        logger.info(
+            "Повторное удаление карты %s (попытка %s/%s)",
+            card_number, scheduler.attempts(event_id), delcard_retry.max_attempts
+        )
+        command_manager.update_stage(event_id, "delcard")
+        reply = await retry
+    return reply
+
+
+def command_key(message):
+    """
+    Ключ упорядочивания команды портала — номер карты.
+
+    Команды по одной карте выполняются строго последовательно.
+    """
+    return codec.loads(message.body).get("card_number")
+
+
+def command_controller(message):
+    """
+    Имя контроллера, которому адресована команда портала (поле "controller").
+
+    None — команда для контроллера по умолчанию.
+    """
+    return codec.loads(message.body).get("controller")
+
+
+async def requeue(message, reason: str):
+    """
+    Возвращает сообщение в очередь RabbitMQ, чтобы команду выполнил следующий потребитель.
+
+    Если канал уже закрыт, брокер сам вернёт неподтверждённое сообщение в очередь.
+    """
+    try:
+        await message.nack(requeue=True)
+        logger.warning("Команда возвращена в очередь (%s): %s", reason, message.body[:200])
+    except Exception as e:
+        logger.warning("Не удалось вернуть команду в очередь (%s): %s", reason, e)
+
+
+async def rmq_handler(message, tcp_client, command_manager, scheduler: CommandScheduler):
+    """
+    Обработка команды портала (issue/wdraw) из RabbitMQ.
+
+    Обработчик дожидается ответа контроллера, поэтому сообщение
+    подтверждается в RabbitMQ только после того, как PACS выполнил команду
+    (или она окончательно не удалась). Если соединение с контроллером
+    закрыто или обработка прервана остановкой, сообщение возвращается
+    в очередь (nack с requeue) и не подтверждается.
+    """
     # Текущее время как точка отсчёта
     request_tstamp = datetime.now()
     dt_start = request_tstamp - timedelta(hours=1)  # -1 час
     dt_end = request_tstamp + timedelta(hours=8)  # +8 часов
 
-    message_body = json.loads(message.body.decode())
+    message_body = codec.loads(message.body)
 
     event_id = int(message_body["event_id"])
     raw_card_number = message_body["card_number"]
     revers_card_number = calculate_card_number(raw_card_number)
     event_type = message_body["event_type"]
 
-
     match event_type:
         case "issue":
-            logger.info(f"Добавление гостевой карты {raw_card_number}")
-
-            add_cmd = get_add_card_command(
-                event_id,
-                revers_card_number,
-                dt_start,
-                dt_end
-            )
-            command_manager.add(
-                event_id=event_id,
-                card_number=revers_card_number,
-                event_type=event_type,
-                stage="addcard"
-            )
-
-            await tcp_client.send(create_buffer(json.dumps(add_cmd)))
-
+            logger.info("Добавление гостевой карты %s", raw_card_number)
+            stage = "addcard"
         case "wdraw":
-            logger.info(f"Удаление гостевой карты {raw_card_number}")
-
-            command_manager.add(
-                event_id=event_id,
-                card_number=revers_card_number,
-                event_type=event_type,
-                stage="loadcard"
-            )
-            load_cmd = get_load_card_command(event_id, revers_card_number)
-            delete_cmd = get_delete_card_command(event_id, revers_card_number)
-
-            # запрет использования карты
-            await tcp_client.send(create_buffer(json.dumps(load_cmd)))
-            await asyncio.sleep(2)
-            # удаление карты
-            command_manager.update_stage(event_id, "delcard")
-            await tcp_client.send(create_buffer(json.dumps(delete_cmd)))
+            logger.info("Удаление гостевой карты %s", raw_card_number)
+            stage = "loadcard"
+        case _:
+            logger.warning("Неизвестный тип команды '%s': %s", event_type, message_body)
+            return
+
+    if not command_manager.add(
+        event_id=event_id,
+        card_number=revers_card_number,
+        event_type=event_type,
+        stage=stage
+    ):
+        logger.warning(
+            "Команда %s для карты %s (event_id=%s) не выполнена: такая же команда уже ожидает ответа",
+            event_type, raw_card_number, event_id
+        )
+        return
+
+    duplicate = False
+    try:
+        if event_type == "issue":
+            reply = await issue_card(tcp_client, command_manager, event_id, revers_card_number, dt_start, dt_end)
+        else:
+            reply = await withdraw_card(tcp_client, command_manager, scheduler, event_id, revers_card_number)
+
+        err = reply.get("ErrCode")
+        if err in (0, 10):
+            logger.info("Команда %s для карты %s выполнена (%s)", event_type, raw_card_number, reply.get("Command"))
+        else:
+            logger.error("Команда %s для карты %s не выполнена: %s", event_type, raw_card_number, reply)
+    except DuplicateRequestError as e:
+        # та же команда уже выполняется (например, повторная доставка сообщения) —
+        # её ожидание, планировщик и запись в менеджере команд не трогаем
+        duplicate = True
+        logger.warning("Команда %s для карты %s (event_id=%s) пропущена: %s", event_type, raw_card_number, event_id, e)
+    except ConnectionError as e:
+        logger.error("Команда %s для карты %s прервана: %s", event_type, raw_card_number, e)
+        await requeue(message, "нет соединения с контроллером")
+    except asyncio.CancelledError:
+        await requeue(message, "обработка прервана")
+        raise
+    except (asyncio.TimeoutError, CommandCancelledError) as e:
+        logger.error("Команда %s для карты %s прервана: %s", event_type, raw_card_number, e)
+    finally:
+        if not duplicate:
+            scheduler.cancel(event_id)
+            command_manager.remove(event_id)
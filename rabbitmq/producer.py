@@ -1,10 +1,11 @@
 import asyncio
 import aio_pika
-import json
 from aio_pika import Message, DeliveryMode
 from aio_pika.exceptions import AMQPConnectionError
-from aio_pika.abc import AbstractRobustConnection, AbstractRobustChannel
-from typing import Dict
+from aio_pika.abc import AbstractRobustConnection, AbstractRobustChannel, AbstractExchange
+from typing import Dict, List
+
+from utils import codec
 
 
 class RabbitMQProducer:
@@ -13,7 +14,25 @@ class RabbitMQProducer:
     Использует aio-pika (поддержка reconnect).
     """
 
-    def __init__(self, host: str, port: int, virtual_host: str, username: str, password: str, logger):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        virtual_host: str,
+        username: str,
+        password: str,
+        logger,
+        max_in_flight: int = 256
+    ):
+        """
+        :param host: хост RabbitMQ
+        :param port: порт RabbitMQ
+        :param virtual_host: виртуальный хост
+        :param username: имя пользователя
+        :param password: пароль
+        :param logger:
+        :param max_in_flight: сколько сообщений может ожидать подтверждения брокера одновременно
+        """
         self.host = host
         self.port = port
         self.virtual_host = virtual_host
@@ -23,6 +42,8 @@ class RabbitMQProducer:
 
         self.connection: AbstractRobustConnection | None = None
         self.channel: AbstractRobustChannel | None = None
+        self._exchanges: Dict[str, AbstractExchange] = {}
+        self._in_flight = asyncio.Semaphore(max_in_flight)
 
     async def __aenter__(self):
         """Вход в асинхронный контекстный менеджер."""
@@ -50,15 +71,35 @@ class RabbitMQProducer:
                     virtualhost=self.virtual_host,
                     timeout=10
                 )
-                self.channel = await self.connection.channel()
-                self.logger.info(f"Подключение к RabbitMQ {self.host}:{self.port}/{self.virtual_host}")
+                self.channel = await self.connection.channel(publisher_confirms=True)
+                self._exchanges.clear()
+                self.logger.info("Подключение к RabbitMQ %s:%s/%s", self.host, self.port, self.virtual_host)
                 return
             except AMQPConnectionError as e:
-                self.logger.warning(f"Попытка подключения {attempt}/{retries} не удалась: {e}")
+                self.logger.warning("Попытка подключения %s/%s не удалась: %s", attempt, retries, e)
                 await asyncio.sleep(delay)
 
         raise ConnectionError(f"Не удалось подключиться к RabbitMQ по адресу {self.host}:{self.port}")
 
+    async def _get_exchange(self, exchange_name: str) -> AbstractExchange:
+        """Возвращает обменник из кэша, объявляя его только при первом обращении."""
+        exchange = self._exchanges.get(exchange_name)
+        if exchange is None:
+            exchange = await self.channel.declare_exchange(exchange_name, type="fanout", durable=True)
+            self._exchanges[exchange_name] = exchange
+        return exchange
+
+    async def _publish_body(self, exchange: AbstractExchange, body: bytes):
+        """Публикует одно сообщение и ждёт подтверждения брокера (publisher confirms)."""
+        async with self._in_flight:
+            await exchange.publish(
+                Message(
+                    body=body,
+                    delivery_mode=DeliveryMode.PERSISTENT
+                ),
+                routing_key=''
+            )
+
     async def publish(self, exchange_name: str, message: Dict[str, any], max_retries: int = 3):
         """
         Асинхронная отправка сообщения в очередь с ограниченным числом попыток.
@@ -67,14 +108,36 @@ class RabbitMQProducer:
         :param message: тело сообщения (должно быть сериализуемо в JSON)
         :param max_retries: максимальное количество попыток отправки (по умолчанию 3)
         """
+        await self.publish_many(exchange_name, [message], max_retries)
+
+    async def publish_many(self, exchange_name: str, messages: List[Dict[str, any]], max_retries: int = 3):
+        """
+        Публикует пачку сообщений с конвейеризацией подтверждений.
+
+        Сообщения отправляются одновременно (не более max_in_flight без
+        подтверждения), поэтому пачка занимает примерно один round trip до
+        брокера, а не по round trip на сообщение. Сообщения, которые брокер
+        не подтвердил, повторяются с экспоненциальной задержкой.
+
+        :param exchange_name: имя обменника
+        :param messages: тела сообщений (должны быть сериализуемы в JSON)
+        :param max_retries: максимальное количество попыток отправки (по умолчанию 3)
+        :raises ConnectionError: если не удалось подключиться к RabbitMQ
+        :raises RuntimeError: если часть сообщений не опубликована после всех попыток
+        """
+        # Сериализуем сообщения в JSON и кодируем в байты
+        bodies = [codec.dumps(message) for message in messages]
+        pending = bodies
+
         for attempt in range(1, max_retries + 1):
             if not self.channel or self.channel.is_closed:
                 self.logger.warning(
-                    f"[Попытка {attempt}/{max_retries}] Нет активного подключения RabbitMQ. Повторное подключение...")
+                    "[Попытка %s/%s] Нет активного подключения RabbitMQ. Повторное подключение...",
+                    attempt, max_retries)
                 try:
                     await self.connect()
                 except Exception as connect_error:
-                    self.logger.error(f"Не удалось восстановить соединение: {connect_error}")
+                    self.logger.error("Не удалось восстановить соединение: %s", connect_error)
                     if attempt == max_retries:
                         raise ConnectionError(
                             f"Не удалось подключиться к RabbitMQ после {max_retries} попыток") from connect_error
@@ -82,37 +145,37 @@ class RabbitMQProducer:
                     continue
 
             try:
-                # Сериализуем сообщение в JSON и кодируем в байты
-                body = json.dumps(message, ensure_ascii=False).encode('utf-8')
-
-                exchange = await self.channel.declare_exchange(exchange_name, type="fanout", durable=True)
-
-                # queue = await self.channel.declare_queue(queue_name, durable=True)
-                # await self.channel.default_exchange.publish(
-                await exchange.publish(
-                    Message(
-                        body=body,
-                        delivery_mode=DeliveryMode.PERSISTENT
-                    ),
-                    routing_key=''
-                    # routing_key = queue.name
+                exchange = await self._get_exchange(exchange_name)
+                results = await asyncio.gather(
+                    *(self._publish_body(exchange, body) for body in pending),
+                    return_exceptions=True
                 )
-                self.logger.info(f"Опубликовано сообщение в обменнике '{exchange_name}' (попытка {attempt})")
+            except Exception as e:
+                results = [e] * len(pending)
+
+            failed = [body for body, result in zip(pending, results) if isinstance(result, Exception)]
+            if not failed:
+                self.logger.info(
+                    "Опубликовано %d сообщений в обменнике '%s' (попытка %d)", len(pending), exchange_name, attempt)
                 return  # Успешно — выходим из функции
 
-            except Exception as e:
-                self.logger.error(f"[Попытка {attempt}/{max_retries}] Ошибка публикации в обменнике '{exchange_name}': {e}")
+            error = next(result for result in results if isinstance(result, Exception))
+            self._exchanges.pop(exchange_name, None)
+            self.logger.error(
+                "[Попытка %s/%s] Ошибка публикации %s/%s сообщений в обменнике '%s': %s",
+                attempt, max_retries, len(failed), len(pending), exchange_name, error)
 
-                # Если это последняя попытка — пробрасываем исключение
-                if attempt == max_retries:
-                    raise RuntimeError(
-                        f"Не удалось опубликовать сообщение в обменнике '{exchange_name}' после {max_retries} попыток") from e
+            # Если это последняя попытка — пробрасываем исключение
+            if attempt == max_retries:
+                raise RuntimeError(
+                    f"Не удалось опубликовать {len(failed)} сообщений в обменнике '{exchange_name}' "
+                    f"после {max_retries} попыток") from error
 
-                # Перед следующей попыткой — ждём немного
-                await asyncio.sleep(2 ** attempt)  # экспоненциальная задержка: 2, 4, 8 сек...
+            pending = failed
+            # Перед следующей попыткой — ждём немного
+            await asyncio.sleep(2 ** attempt)  # экспоненциальная задержка: 2, 4, 8 сек...
 
-            # Теоретически сюда не должно дойти, но на всякий случай
-        raise RuntimeError("Не удалось опубликовать сообщение — все попытки исчерпаны")
+        raise RuntimeError("Не удалось опубликовать сообщения — все попытки исчерпаны")
 
     async def close(self):
         """Закрытие соединения."""
@@ -0,0 +1,38 @@
+-- Уникальный индекс по естественному ключу события PACS
+-- (EvTime, EvAddr, EvUser, EvCard, EvCode → created, ap_id, owner_id, card_number, code).
+--
+-- Нужен для INSERT ... ON CONFLICT DO NOTHING в utils.functions: события,
+-- повторно присланные контроллером после переподключения, не вставляются.
+-- Без индекса вставка работает как раньше, но дубликаты не отсекаются.
+--
+-- owner_id (EvUser = 0), card_number и code бывают NULL. Обычный уникальный
+-- индекс считает NULL различными, и такие дубликаты не отсекались бы, поэтому
+-- индекс строится с NULLS NOT DISTINCT (PostgreSQL 15+), а дубликаты
+-- сравниваются через IS NOT DISTINCT FROM. Для PostgreSQL 12–14 — индекс по
+-- выражениям с COALESCE ниже (ON CONFLICT DO NOTHING без указания ключа
+-- работает с любым из них).
+--
+-- Выполнять вне транзакции (CREATE INDEX CONCURRENTLY):
+--     psql -d <база> -f sql/pacs_event_unique.sql
+-- Повторное выполнение перестраивает индекс (в том числе созданный
+-- прежней версией скрипта без учёта NULL).
+
+-- 1. Удалить уже накопившиеся дубликаты, оставив самую раннюю запись
+DELETE FROM public.pacs_event e
+USING public.pacs_event d
+WHERE e.created = d.created
+  AND e.ap_id = d.ap_id
+  AND e.owner_id IS NOT DISTINCT FROM d.owner_id
+  AND e.card_number IS NOT DISTINCT FROM d.card_number
+  AND e.code IS NOT DISTINCT FROM d.code
+  AND e.id > d.id;
+
+-- 2. Построить индекс без блокировки вставок
+DROP INDEX CONCURRENTLY IF EXISTS public.pacs_event_natural_key_uidx;
+
+CREATE UNIQUE INDEX CONCURRENTLY pacs_event_natural_key_uidx
+    ON public.pacs_event (created, ap_id, owner_id, card_number, code) NULLS NOT DISTINCT;
+
+-- PostgreSQL 12–14 (вместо предыдущей команды):
+-- CREATE UNIQUE INDEX CONCURRENTLY pacs_event_natural_key_uidx
+--     ON public.pacs_event (created, ap_id, COALESCE(owner_id, 0), COALESCE(card_number::text, ''), COALESCE(code, -1));
@@ -0,0 +1,105 @@
+"""Заглушки Postgres, RabbitMQ и справочников для тестов конвейера и обработчиков."""
+import asyncio
+import contextlib
+
+from asyncpg.exceptions import ForeignKeyViolationError
+
+COLUMNS = ("created", "ap_id", "owner_id", "card_number", "code")
+
+
+class FakeDB:
+    """pacs_event с уникальным ключом и транзакциями: строки видны после фиксации."""
+    def __init__(self, fail_on_call: int | None = None, unknown_ap: int | None = None):
+        self.available = True
+        self.gate: asyncio.Event | None = None
+        self.rows: dict[tuple, int] = {}
+        self.calls = 0
+        self.queries: set[str] = set()
+        self.transactions = 0
+        self.fail_on_call = fail_on_call
+        self.unknown_ap = unknown_ap
+        self._next_id = 1
+        self._staged: list[dict[tuple, int]] = []
+
+    def _insert(self, query, args) -> list[dict]:
+        self.calls += 1
+        self.queries.add(query)
+        if not self.available or self.calls == self.fail_on_call:
+            raise ConnectionError("соединение с БД потеряно")
+        keys = list(zip(*args))  # по массиву на колонку (INSERT ... SELECT FROM unnest)
+        if self.unknown_ap is not None and any(key[1] == self.unknown_ap for key in keys):
+            raise ForeignKeyViolationError("нет точки доступа")
+        target = self._staged[-1] if self._staged else self.rows
+        records = []
+        for key in keys:
+            if key in self.rows or any(key in staged for staged in self._staged):
+                continue  # ON CONFLICT DO NOTHING
+            target[key] = self._next_id
+            records.append({"id": self._next_id, **dict(zip(COLUMNS, key))})
+            self._next_id += 1
+        return records
+
+    async def fetch_all(self, query, *args):
+        if self.gate is not None:
+            await self.gate.wait()
+        return self._insert(query, args)
+
+    async def fetch_row(self, query, *args):
+        records = self._insert(query, args)
+        return records[0] if records else None
+
+    async def fetch(self, query, *args):
+        return self._insert(query, args)
+
+    async def fetchrow(self, query, *args):
+        return await self.fetch_row(query, *args)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self._staged.append({})
+        if len(self._staged) == 1:
+            self.transactions += 1
+        try:
+            yield self
+        except BaseException:
+            self._staged.pop()
+            raise
+        staged = self._staged.pop()
+        (self._staged[-1] if self._staged else self.rows).update(staged)
+
+
+class FakeProducer:
+    """RabbitMQ: публикации копятся в `published`, при available=False публикация не удаётся."""
+    def __init__(self):
+        self.available = True
+        self.published: list[tuple[str, dict]] = []
+
+    async def publish_many(self, exchange_name: str, messages: list, max_retries: int = 3):
+        if not self.available:
+            raise ConnectionError("RabbitMQ недоступен")
+        self.published.extend((exchange_name, message) for message in messages)
+
+    async def publish(self, exchange_name: str, message: dict, max_retries: int = 3):
+        await self.publish_many(exchange_name, [message], max_retries)
+
+
+class FakeDirectory:
+    """Справочники точек доступа и владельцев карт без БД."""
+    def __init__(self):
+        self.card_owners = []
+        self.access_points = []
+
+    async def sync_card_owners(self, owners):
+        self.card_owners = list(owners)
+
+    async def sync_access_points(self, points):
+        self.access_points = list(points)
+
+    async def warm(self):
+        pass
+
+    def access_point_name(self, system_id: int) -> str:
+        return f"Точка {system_id}"
+
+    def card_owner(self, system_id: int):
+        return None
@@ -0,0 +1,62 @@
+import logging
+import os
+import time
+
+import pytest
+
+from utils.capture import INBOUND, OUTBOUND, CaptureFormatError, CaptureWriter, read_capture
+
+logger = logging.getLogger("tests")
+
+
+def test_records_roundtrip(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    writer = CaptureWriter(path, logger)
+    writer.open()
+    writer.write(OUTBOUND, b'{"Command": "filterevents"}')
+    writer.write(INBOUND, b'{"Command": "events", "Data": []}')
+    writer.close()
+
+    records = list(read_capture(path))
+    assert [(direction, payload) for _, direction, payload in records] == [
+        (OUTBOUND, b'{"Command": "filterevents"}'),
+        (INBOUND, b'{"Command": "events", "Data": []}'),
+    ]
+    assert records[0][0] <= records[1][0]
+    assert writer.stats() == {"written": 2, "dropped": 0, "failed": False}
+
+
+def test_truncated_record_is_skipped(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    writer = CaptureWriter(path, logger)
+    writer.open()
+    writer.write(INBOUND, b"first")
+    writer.write(INBOUND, b"second")
+    writer.close()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 2)
+    assert [payload for _, _, payload in read_capture(path)] == [b"first"]
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a capture")
+    with pytest.raises(CaptureFormatError):
+        list(read_capture(str(path)))
+
+
+@pytest.mark.skipif(not os.path.exists("/dev/full"), reason="нужен /dev/full")
+def test_write_error_stops_writer():
+    writer = CaptureWriter("/dev/full", logger, queue_size=10, buffer_size=16, flush_interval=0.01)
+    writer.open()
+    writer.write(INBOUND, b"x" * 64)
+    deadline = time.monotonic() + 5
+    while not writer.stats()["failed"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.stats()["failed"]
+
+    for _ in range(100):
+        writer.write(INBOUND, b"x")
+    started = time.monotonic()
+    writer.close(timeout=1)
+    assert time.monotonic() - started < 1
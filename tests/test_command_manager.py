@@ -0,0 +1,65 @@
+import logging
+import time
+
+from core.command_manager import EVICTED, CommandManager
+
+logger = logging.getLogger("tests")
+
+
+def test_duplicate_command_for_card_is_rejected():
+    manager = CommandManager(logger, ttl=10, capacity=10)
+    assert manager.add(1, 100, "issue", "sent")
+    assert not manager.add(2, 100, "issue", "sent")
+    assert manager.get_by_card(100).event_id == 1
+
+
+def test_command_of_other_type_replaces_pending():
+    manager = CommandManager(logger, ttl=10, capacity=10)
+    manager.add(1, 100, "issue", "sent")
+    assert manager.add(2, 100, "wdraw", "sent")
+    assert manager.get(1) is None
+    assert manager.get_by_card(100).event_id == 2
+
+
+def test_expired_commands_are_removed():
+    manager = CommandManager(logger, ttl=10, capacity=10)
+    manager.add(1, 100, "issue", "sent")
+    manager.add(2, 200, "issue", "sent")
+    now = time.monotonic()
+    assert manager.expire(now) == []
+    expired = manager.expire(now + 11)
+    assert sorted(command.event_id for command in expired) == [1, 2]
+    assert manager.all() == {}
+    assert manager.get_by_card(100) is None
+
+
+def test_update_stage_extends_deadline():
+    manager = CommandManager(logger, ttl=10, capacity=10)
+    manager.add(1, 100, "issue", "sent")
+    deadline = manager.get(1).deadline
+    time.sleep(0.01)
+    manager.update_stage(1, "written")
+    assert manager.get(1).stage == "written"
+    assert manager.expire(deadline) == []
+    assert [command.event_id for command in manager.expire(manager.get(1).deadline)] == [1]
+
+
+def test_removed_command_does_not_expire():
+    manager = CommandManager(logger, ttl=10, capacity=10)
+    manager.add(1, 100, "issue", "sent")
+    assert manager.remove(1).event_id == 1
+    assert manager.expire(time.monotonic() + 11) == []
+
+
+def test_capacity_evicts_oldest():
+    evicted = []
+    manager = CommandManager(
+        logger, ttl=10, capacity=2, on_timeout=lambda command, reason: evicted.append((command.event_id, reason))
+    )
+    manager.add(1, 100, "issue", "sent")
+    manager.add(2, 200, "issue", "sent")
+    manager.add(3, 300, "issue", "sent")
+    assert evicted == [(1, EVICTED)]
+    assert sorted(manager.all()) == [2, 3]
+    assert manager.stats()["evictions"] == 1
+    assert manager.stats()["pending"] == 2
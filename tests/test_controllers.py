@@ -0,0 +1,24 @@
+import pytest
+
+from core.controllers import ControllerEndpoint, parse_controllers
+
+
+def test_empty_spec_uses_default_controller():
+    assert parse_controllers("", "10.0.0.1", 8000) == [ControllerEndpoint("default", "10.0.0.1", 8000)]
+
+
+def test_names_and_ports():
+    assert parse_controllers(" main=10.0.0.1:9000 , 10.0.0.2 ,", "", 8000) == [
+        ControllerEndpoint("main", "10.0.0.1", 9000),
+        ControllerEndpoint("10.0.0.2", "10.0.0.2", 8000),
+    ]
+
+
+def test_duplicate_names_are_rejected():
+    with pytest.raises(ValueError):
+        parse_controllers("a=10.0.0.1,a=10.0.0.2", "", 8000)
+
+
+def test_invalid_port_is_rejected():
+    with pytest.raises(ValueError):
+        parse_controllers("a=10.0.0.1:port", "", 8000)
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from core.dedup import EventDeduplicator
+from core.models import PacsEvent
+
+
+def event(card: str, code: int = 1) -> PacsEvent:
+    return PacsEvent(datetime(2024, 1, 2, 3, 4, 5), 1, 7, card, code)
+
+
+def test_duplicates_within_batch_are_dropped():
+    dedup = EventDeduplicator(cache_size=10)
+    assert dedup.filter([event("a"), event("a"), event("b")]) == [event("a"), event("b")]
+    assert dedup.stats()["duplicates"] == 1
+
+
+def test_remembered_events_are_dropped():
+    dedup = EventDeduplicator(cache_size=10)
+    dedup.remember([event("a")])
+    assert dedup.filter([event("a"), event("a", code=2)]) == [event("a", code=2)]
+
+
+def test_filtered_events_are_not_remembered():
+    # не сохранённые из-за сбоя БД события должны пройти при повторе
+    dedup = EventDeduplicator(cache_size=10)
+    assert dedup.filter([event("a")]) == [event("a")]
+    assert dedup.filter([event("a")]) == [event("a")]
+
+
+def test_cache_keeps_recent_keys():
+    dedup = EventDeduplicator(cache_size=2)
+    dedup.remember([event("a"), event("b")])
+    dedup.filter([event("a")])  # "a" становится последним использованным
+    dedup.remember([event("c")])
+    assert dedup.filter([event("a"), event("b"), event("c")]) == [event("b")]
+    assert dedup.stats()["cache_size"] == 2
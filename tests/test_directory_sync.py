@@ -0,0 +1,130 @@
+import asyncio
+import contextlib
+import logging
+
+from core.directory_sync import DirectorySync
+from core.models import AccessPoint, CardOwner
+
+logger = logging.getLogger("tests")
+
+
+class DirectoryDB:
+    """Справочная таблица в памяти: запоминает выполненные запросы."""
+    def __init__(self, rows: dict[int, tuple] | None = None):
+        self.rows = dict(rows or {})
+        self.statements: list[str] = []
+        self.copied: list[tuple] = []
+        self.fail = False
+
+    async def fetch_all(self, query, *args):
+        return [(system_id, *values) for system_id, values in self.rows.items()]
+
+    async def execute(self, query, *args):
+        if self.fail:
+            raise ConnectionError("соединение с БД потеряно")
+        statement = query.split()[0]
+        self.statements.append(statement)
+        if statement == "INSERT" and args:
+            for system_id, *values in zip(*args):
+                self.rows[system_id] = tuple(values)
+        elif statement == "DELETE":
+            for system_id in args[0]:
+                self.rows.pop(system_id, None)
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.statements.append("COPY")
+        self.copied.extend(records)
+        for system_id, *values in records:
+            self.rows[system_id] = tuple(values)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield self
+
+
+def points(*names: str) -> list[AccessPoint]:
+    return [AccessPoint(system_id=i, name=name) for i, name in enumerate(names, 1)]
+
+
+def test_unchanged_list_does_not_write():
+    async def scenario():
+        db = DirectoryDB({1: ("Вход",), 2: ("Выход",)})
+        sync = DirectorySync(db, logger, delete_missing=False, copy_threshold=100)
+        result = await sync.sync_access_points(points("Вход", "Выход"))
+        assert (result.inserted, result.updated, result.unchanged) == (0, 0, 2)
+        assert db.statements == []
+
+    asyncio.run(scenario())
+
+
+def test_only_changed_rows_are_written():
+    async def scenario():
+        db = DirectoryDB({1: ("Вход",), 2: ("Выход",)})
+        sync = DirectorySync(db, logger, delete_missing=True, copy_threshold=100)
+        result = await sync.sync_access_points(points("Вход", "Выход 2", "Склад"))
+        assert (result.inserted, result.updated, result.unchanged) == (1, 1, 1)
+        assert db.statements == ["INSERT"]
+        assert db.rows == {1: ("Вход",), 2: ("Выход 2",), 3: ("Склад",)}
+
+        # повторная выгрузка без изменений не пишет в БД
+        await sync.sync_access_points(points("Вход", "Выход 2", "Склад"))
+        assert db.statements == ["INSERT"]
+
+    asyncio.run(scenario())
+
+
+def test_missing_rows_are_deleted_unless_list_is_empty():
+    async def scenario():
+        db = DirectoryDB({1: ("Вход",), 2: ("Выход",)})
+        sync = DirectorySync(db, logger, delete_missing=True, copy_threshold=100)
+        await sync.sync_access_points([])
+        assert db.rows.keys() == {1, 2}
+
+        result = await sync.sync_access_points(points("Вход"))
+        assert result.deleted == 1
+        assert db.rows == {1: ("Вход",)}
+
+    asyncio.run(scenario())
+
+
+def test_failed_sync_rereads_table():
+    async def scenario():
+        db = DirectoryDB({1: ("Вход",)})
+        sync = DirectorySync(db, logger, delete_missing=False, copy_threshold=100)
+        db.fail = True
+        result = await sync.sync_access_points(points("Вход 2"))
+        assert (result.inserted, result.updated) == (0, 0)
+        db.fail = False
+        result = await sync.sync_access_points(points("Вход 2"))
+        assert result.updated == 1
+        assert db.rows == {1: ("Вход 2",)}
+
+    asyncio.run(scenario())
+
+
+def test_names_are_kept_for_enrichment():
+    async def scenario():
+        db = DirectoryDB()
+        sync = DirectorySync(db, logger, delete_missing=False, copy_threshold=100, keep_names=True)
+        await sync.sync_card_owners([CardOwner(system_id=7, firstname="Иван", secondname="Иванович", lastname="Иванов")])
+        assert sync.card_owner(7) == ("Иван", "Иванович", "Иванов")
+        assert sync.access_point_name(1) is None
+
+    asyncio.run(scenario())
+
+
+def test_large_diff_is_loaded_via_copy():
+    async def scenario():
+        db = DirectoryDB({1: ("Вход",)})
+        sync = DirectorySync(db, logger, delete_missing=True, copy_threshold=3)
+        await sync.sync_access_points(points("Вход", "Выход"))
+        assert db.statements == ["INSERT"]
+
+        db.statements.clear()
+        await sync.sync_access_points(points("Вход", "Выход", "Склад", "Офис", "Цех")[1:])
+        # CREATE TEMP TABLE, COPY, INSERT ... SELECT из временной таблицы, DELETE — в одной транзакции
+        assert db.statements == ["CREATE", "COPY", "INSERT", "DELETE"]
+        assert len(db.copied) == 3
+        assert 1 not in db.rows
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+import pytest
+
+from rabbitmq.dispatcher import KeyedDispatcher
+
+logger = logging.getLogger("tests")
+
+
+def test_jobs_with_same_key_run_in_order():
+    async def scenario():
+        dispatcher = KeyedDispatcher(8, logger)
+        order = []
+
+        def job(name: str, delay: float):
+            async def run():
+                await asyncio.sleep(delay)
+                order.append(name)
+            return run
+
+        # issue первой карты медленнее wdraw, но wdraw ждёт его завершения
+        futures = [
+            dispatcher.submit(1, job("issue-1", 0.03)),
+            dispatcher.submit(2, job("issue-2", 0.01)),
+            dispatcher.submit(1, job("wdraw-1", 0)),
+        ]
+        await asyncio.gather(*futures)
+        assert order == ["issue-2", "issue-1", "wdraw-1"]
+        assert dispatcher.pending() == 0
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_is_bounded():
+    async def scenario():
+        dispatcher = KeyedDispatcher(3, logger)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            peak = max(peak, dispatcher.active)
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(dispatcher.submit(None, job) for _ in range(10)))
+        assert peak == 3
+
+    asyncio.run(scenario())
+
+
+def test_failed_job_does_not_block_key():
+    async def scenario():
+        dispatcher = KeyedDispatcher(2, logger)
+
+        async def fail():
+            raise ValueError("ошибка обработчика")
+
+        async def ok():
+            return "ok"
+
+        failed = dispatcher.submit("card", fail)
+        succeeded = dispatcher.submit("card", ok)
+        with pytest.raises(ValueError):
+            await failed
+        assert await succeeded == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_close_cancels_pending_jobs():
+    async def scenario():
+        dispatcher = KeyedDispatcher(1, logger)
+        running = dispatcher.submit("card", lambda: asyncio.sleep(10))
+        waiting = dispatcher.submit("card", lambda: asyncio.sleep(0))
+        await asyncio.sleep(0)
+        await dispatcher.close()
+        assert waiting.cancelled()
+        assert running.cancelled()
+        assert dispatcher.pending() == 0
+
+    asyncio.run(scenario())
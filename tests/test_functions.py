@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from datetime import datetime
+
+import pytest
+
+from core.models import PacsEvent
+from tests.fakes import FakeDB
+from utils.functions import insert_events_batch
+
+logger = logging.getLogger("tests")
+
+def events(count: int, ap_id: int = 1) -> list[PacsEvent]:
+    return [PacsEvent(datetime(2024, 1, 1, 0, 0, i), ap_id, None, f"{i}", 1) for i in range(count)]
+
+
+def test_small_frame_is_one_insert_without_transaction():
+    db = FakeDB()
+    result = asyncio.run(insert_events_batch(db, events(3), logger, batch_size=10))
+    assert result.ids == ["1", "2", "3"]
+    assert db.calls == 1
+    assert db.transactions == 0
+
+
+def test_large_frame_is_inserted_in_one_transaction():
+    db = FakeDB()
+    result = asyncio.run(insert_events_batch(db, events(5), logger, batch_size=2))
+    assert len(result.ids) == 5
+    assert db.calls == 3
+    assert db.transactions == 1
+    # части разной длины и построчный повтор используют один и тот же запрос
+    assert len(db.queries) == 1
+
+
+def test_failed_chunk_rolls_back_frame_and_redrive_returns_all_ids():
+    db = FakeDB(fail_on_call=2)
+    with pytest.raises(ConnectionError):
+        asyncio.run(insert_events_batch(db, events(5), logger, batch_size=2))
+    assert db.rows == {}
+
+    # повтор пакета из журнала получает ID всех событий, в том числе первой части
+    result = asyncio.run(insert_events_batch(db, events(5), logger, batch_size=2))
+    assert len(result.ids) == 5
+
+
+def test_rejected_rows_are_retried_one_by_one():
+    db = FakeDB(unknown_ap=2)
+    frame = events(2) + events(1, ap_id=2)
+    result = asyncio.run(insert_events_batch(db, frame, logger, batch_size=10))
+    assert result.ids == ["1", "2"]
+    assert [index for index, _, _ in result.rejected] == [2]
+    assert len(db.queries) == 1
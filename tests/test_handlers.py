@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+import pytest
+
+from core.command_manager import CommandManager
+from core.scheduler import CommandScheduler
+from core.tcpclient import DuplicateRequestError
+from rabbitmq.handlers import rmq_handler
+from utils import codec
+from utils.functions import calculate_card_number
+
+logger = logging.getLogger("tests")
+
+
+class FakeMessage:
+    def __init__(self, event_id: int = 1, card_number: str = "12.345", event_type: str = "issue"):
+        self.body = codec.dumps({"event_id": event_id, "card_number": card_number, "event_type": event_type})
+        self.requeued = False
+
+    async def nack(self, requeue: bool = True):
+        self.requeued = requeue
+
+
+class FakeClient:
+    """Контроллер: на каждую команду выполняет `reply` (ответ или исключение)."""
+    def __init__(self, reply):
+        self.reply = reply
+        self.commands = []
+
+    async def request(self, command):
+        self.commands.append(command["Command"])
+        if isinstance(self.reply, BaseException):
+            raise self.reply
+        if self.reply == "hang":
+            await asyncio.sleep(10)
+        return self.reply
+
+
+async def handle(client, message, manager=None):
+    manager = manager or CommandManager(logger, ttl=10, capacity=10)
+    scheduler = CommandScheduler(logger)
+    await rmq_handler(message, client, manager, scheduler)
+    return manager
+
+
+def test_executed_command_is_not_requeued():
+    async def scenario():
+        message = FakeMessage()
+        manager = await handle(FakeClient({"ErrCode": 0, "Command": "addcard"}), message)
+        assert not message.requeued
+        assert manager.get(1) is None
+
+    asyncio.run(scenario())
+
+
+def test_closed_connection_requeues_command():
+    async def scenario():
+        message = FakeMessage()
+        manager = await handle(FakeClient(ConnectionError("клиент закрыт")), message)
+        assert message.requeued
+        assert manager.get(1) is None
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_handler_requeues_command():
+    async def scenario():
+        message = FakeMessage()
+        task = asyncio.create_task(handle(FakeClient("hang"), message))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert message.requeued
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_request_keeps_command_in_flight():
+    async def scenario():
+        manager = CommandManager(logger, ttl=10, capacity=10)
+        message = FakeMessage()
+        await handle(FakeClient(DuplicateRequestError("уже ожидает ответа")), message, manager)
+        assert not message.requeued
+        # запись выполняющейся команды остаётся в менеджере
+        assert manager.get(1).card_number == calculate_card_number("12.345")
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_command_for_card_is_skipped():
+    async def scenario():
+        manager = CommandManager(logger, ttl=10, capacity=10)
+        manager.add(7, calculate_card_number("12.345"), "issue", "addcard")
+        client = FakeClient({"ErrCode": 0, "Command": "addcard"})
+        message = FakeMessage(event_id=8)
+        await handle(client, message, manager)
+        assert client.commands == []
+        assert not message.requeued
+        assert manager.get(7) is not None
+
+    asyncio.run(scenario())
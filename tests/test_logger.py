@@ -0,0 +1,49 @@
+import json
+import logging
+import queue
+
+from utils.logger import JsonFormatter, NonBlockingQueueHandler, RateLimitFilter
+
+
+def make_record(msg: str, *args, created: float = 0.0, **extra) -> logging.LogRecord:
+    record = logging.makeLogRecord({"name": "pacs_tcp_client", "levelno": logging.WARNING,
+                                    "levelname": "WARNING", "msg": msg, "args": args, **extra})
+    record.created = created
+    return record
+
+
+def test_rate_limit_keys_by_template_and_reports_suppressed():
+    limiter = RateLimitFilter(burst=2, interval=10)
+    passed = [limiter.filter(make_record("Нет команды %s", i, created=i * 0.1)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limiter.filter(make_record("Другое сообщение", created=0.5))
+    assert limiter.suppressed == 3
+
+    record = make_record("Нет команды %s", 99, created=11)
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+
+
+def test_rate_limit_disabled_with_zero_burst():
+    limiter = RateLimitFilter(burst=0, interval=10)
+    assert all(limiter.filter(make_record("Нет команды %s", i)) for i in range(100))
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record("Пакет %s", "events", controller="main")
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Пакет events"
+    assert entry["level"] == "WARNING"
+    assert entry["controller"] == "main"
+
+
+def test_queue_handler_formats_args_and_drops_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    data = ["a"]
+    handler.handle(make_record("Данные %s", data))
+    data.append("b")  # аргументы подставлены в момент вызова
+    handler.handle(make_record("Данные %s", data))
+
+    queued = handler.queue.get_nowait()
+    assert queued.getMessage() == "Данные ['a']"
+    assert handler.dropped == 1
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+from core.metrics import MetricsRegistry, MetricsServer, samples_from_stats
+
+logger = logging.getLogger("tests")
+
+
+def test_busy_port_does_not_stop_service():
+    async def scenario():
+        registry = MetricsRegistry()
+        async with MetricsServer(registry, "127.0.0.1", 0, logger) as first:
+            port = first._server.sockets[0].getsockname()[1]
+            async with MetricsServer(registry, "127.0.0.1", port, logger) as second:
+                assert second._server is None
+
+    asyncio.run(scenario())
+
+
+def test_metrics_endpoint():
+    async def scenario():
+        registry = MetricsRegistry()
+        registry.counter("pacs_test_total", "Тестовый счётчик").inc()
+        async with MetricsServer(registry, "127.0.0.1", 0, logger) as server:
+            port = server._server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert b"pacs_test_total 1" in response
+
+    asyncio.run(scenario())
+
+
+def test_samples_from_stats():
+    samples = samples_from_stats("pacs", {"sent": 3, "depth": 2, "nested": {"ok": True}, "name": "x"}, {}, ("sent",))
+    assert [(name, kind, value) for name, kind, _, _, value in samples] == [
+        ("pacs_sent_total", "counter", 3.0),
+        ("pacs_depth", "gauge", 2.0),
+        ("pacs_nested_ok", "gauge", 1.0),
+    ]
+
+
+def test_unknown_commands_share_one_label():
+    from main import command_label
+
+    assert command_label("events") == "events"
+    assert command_label("delcard") == "delcard"
+    assert command_label("something_new") == "other"
+    assert command_label(None) == "other"
+    assert command_label(["events"]) == "other"
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from datetime import datetime
+
+import pytest
+
+from core.models import PacsEvent
+from core.pipeline import EventPipeline
+from core.settings import settings
+from core.spool import Spool
+from tests.fakes import FakeDB, FakeDirectory, FakeProducer
+from utils import codec
+
+logger = logging.getLogger("tests")
+
+
+def frame(count: int, first: int = 0) -> tuple[list[PacsEvent], bytes]:
+    raw = [
+        {"EvTime": f"01.01.2024 00:00:{i:02d}", "EvAddr": 1, "EvUser": 0, "EvCard": str(i), "EvCode": 1}
+        for i in range(first, first + count)
+    ]
+    return [PacsEvent.from_wire(item) for item in raw], codec.dumps({"Command": "events", "Data": raw})
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнено"
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def fast_spool(monkeypatch):
+    monkeypatch.setattr(settings, "SPOOL_FLUSH_INTERVAL", 0.01)
+
+
+def make_pipeline(db, producer, spool=None, **kwargs) -> EventPipeline:
+    return EventPipeline(
+        db, producer, logger, directory=FakeDirectory(), spool=spool,
+        batch_event_messages=False, enrich_event_messages=False, **kwargs
+    )
+
+
+def test_events_are_persisted_and_published():
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        async with make_pipeline(db, producer) as pipeline:
+            events, _ = frame(3)
+            await pipeline.submit("events", events)
+            # повтор того же пакета отсекается до БД
+            await pipeline.submit("events", events)
+            await wait_for(lambda: len(producer.published) == 3 and pipeline.stats()["persisted"] == 2)
+        assert [message for _, message in producer.published] == [{"new_pacs_event_id": str(i)} for i in (1, 2, 3)]
+        assert pipeline.stats()["dedup"]["duplicates"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_full_persist_queue_blocks_submit():
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        db.gate = asyncio.Event()  # Postgres «завис»: первый пакет занимает стадию сохранения
+        pipeline = make_pipeline(db, producer, queue_size=1)
+        pipeline.start()
+        await pipeline.submit("events", frame(1, 0)[0])
+        await wait_for(lambda: pipeline.persist_queue.empty())
+        await pipeline.submit("events", frame(1, 1)[0])
+
+        blocked = asyncio.create_task(pipeline.submit("events", frame(1, 2)[0]))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        assert pipeline.stats()["backpressure_waits"] == 1
+
+        db.gate.set()
+        await asyncio.wait_for(blocked, 1)
+        await pipeline.stop(timeout=1)
+        assert len(db.rows) == 3
+        assert pipeline.stats()["persist_queue_high_watermark"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_queued_frames():
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        pipeline = make_pipeline(db, producer)
+        pipeline.start()
+        for i in range(5):
+            await pipeline.submit("events", frame(2, i * 2)[0])
+        await pipeline.stop(timeout=1)
+        assert len(db.rows) == 10
+        assert len(producer.published) == 10
+        assert pipeline.stats()["persisted"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_failed_frame_is_redriven_from_spool(tmp_path, fast_spool):
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        db.available = False
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        async with make_pipeline(db, producer, spool, retry_interval=0.01) as pipeline:
+            events, raw = frame(2)
+            await pipeline.submit("events", events, raw)
+            await wait_for(lambda: pipeline.stats()["persist_errors"] == 1)
+            assert spool.pending() == 1
+
+            db.available = True
+            await wait_for(lambda: len(producer.published) == 2)
+            await wait_for(lambda: spool.pending() == 0)
+        assert pipeline.stats()["redriven"] >= 1
+        spool.close()
+
+    asyncio.run(scenario())
+
+
+def test_unpublished_messages_are_redriven(tmp_path, fast_spool):
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        producer.available = False
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        async with make_pipeline(db, producer, spool, retry_interval=0.01) as pipeline:
+            events, raw = frame(2)
+            await pipeline.submit("events", events, raw)
+            await wait_for(lambda: pipeline.stats()["publish_errors"] >= 2)
+            producer.available = True
+            await wait_for(lambda: spool.pending() == 0)
+        # события вставлены один раз, сообщения опубликованы после восстановления RabbitMQ
+        assert len(db.rows) == 2
+        assert {message["new_pacs_event_id"] for _, message in producer.published} == {"1", "2"}
+        spool.close()
+
+    asyncio.run(scenario())
+
+
+def test_redrive_does_not_stall_spool_flush(tmp_path, fast_spool):
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        for i in range(20):
+            events, raw = frame(1, i)
+            spool.append(1, raw)
+        spool.close()
+
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        flushes = 0
+        flush = spool.flush
+
+        def counting_flush():
+            nonlocal flushes
+            flushes += 1
+            flush()
+
+        spool.flush = counting_flush
+        db.gate = asyncio.Event()  # Postgres «завис»: повтор упирается в заполненную очередь
+        pipeline = make_pipeline(db, producer, spool, queue_size=1, retry_interval=0.01)
+        async with pipeline:
+            await wait_for(lambda: pipeline._redrive_task is not None)
+            started = flushes
+            await asyncio.sleep(0.1)
+            assert not pipeline._redrive_task.done()
+            assert flushes - started >= 3
+            db.gate.set()
+            await wait_for(lambda: spool.pending() == 0)
+        assert len(producer.published) == 20
+        spool.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_keeps_unredriven_records(tmp_path, fast_spool):
+    async def scenario():
+        db, producer = FakeDB(), FakeProducer()
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        for i in range(10):
+            spool.append(1, frame(1, i)[1])
+        spool.close()
+
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        db.gate = asyncio.Event()
+        pipeline = make_pipeline(db, producer, spool, queue_size=1, retry_interval=0.01)
+        pipeline.start()
+        await wait_for(lambda: pipeline._redrive_task is not None)
+        await asyncio.sleep(0.05)
+        await pipeline.stop(timeout=0.05)
+        spool.close()
+
+        spool = Spool(str(tmp_path), logger)
+        spool.open()
+        assert len(spool.recovered) == 10
+        spool.close()
+
+    asyncio.run(scenario())
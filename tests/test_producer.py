@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from rabbitmq import producer as producer_module
+from rabbitmq.producer import RabbitMQProducer
+from utils import codec
+
+logger = logging.getLogger("tests")
+
+
+class FakeExchange:
+    """Обменник: подтверждает публикации, кроме тел из `reject` (по одному разу)."""
+    def __init__(self):
+        self.published: list[dict] = []
+        self.reject: set[bytes] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def publish(self, message, routing_key):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0)
+            if message.body in self.reject:
+                self.reject.discard(message.body)
+                raise RuntimeError("брокер не подтвердил сообщение")
+            self.published.append(codec.loads(message.body))
+        finally:
+            self.in_flight -= 1
+
+
+class FakeChannel:
+    def __init__(self):
+        self.is_closed = False
+        self.exchange = FakeExchange()
+        self.declared = 0
+
+    async def declare_exchange(self, name, type, durable):
+        self.declared += 1
+        return self.exchange
+
+
+def make_producer(max_in_flight: int = 256) -> tuple[RabbitMQProducer, FakeChannel]:
+    producer = RabbitMQProducer("localhost", 5672, "/", "guest", "guest", logger, max_in_flight=max_in_flight)
+    producer.channel = FakeChannel()
+    return producer, producer.channel
+
+
+def test_exchange_is_declared_once():
+    async def scenario():
+        producer, channel = make_producer()
+        await producer.publish("events", {"id": 1})
+        await producer.publish_many("events", [{"id": 2}, {"id": 3}])
+        assert channel.declared == 1
+        assert channel.exchange.published == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+    asyncio.run(scenario())
+
+
+def test_publishes_are_pipelined_up_to_max_in_flight():
+    async def scenario():
+        producer, channel = make_producer(max_in_flight=4)
+        await producer.publish_many("events", [{"id": i} for i in range(20)])
+        assert channel.exchange.max_in_flight == 4
+        assert len(channel.exchange.published) == 20
+
+    asyncio.run(scenario())
+
+
+def test_only_unconfirmed_messages_are_retried(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    async def scenario():
+        monkeypatch.setattr(producer_module.asyncio, "sleep", no_sleep)
+        producer, channel = make_producer()
+        channel.exchange.reject = {codec.dumps({"id": 1})}
+        await producer.publish_many("events", [{"id": i} for i in range(3)])
+        assert sorted(message["id"] for message in channel.exchange.published) == [0, 1, 2]
+        # после неудачи обменник объявляется заново
+        assert channel.declared == 2
+
+    asyncio.run(scenario())
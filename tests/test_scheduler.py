@@ -0,0 +1,133 @@
+import asyncio
+import logging
+
+import pytest
+
+from core.scheduler import CommandCancelledError, CommandScheduler, RetryPolicy
+
+logger = logging.getLogger("tests")
+
+
+def test_scheduled_command_runs_after_delay():
+    async def scenario():
+        calls = []
+
+        async def callback(value):
+            calls.append(value)
+            return value * 2
+
+        async with CommandScheduler(logger) as scheduler:
+            future = scheduler.schedule("cmd", 0.01, callback, 21)
+            assert scheduler.pending() == 1
+            assert await asyncio.wait_for(future, 1) == 42
+        assert calls == [21]
+
+    asyncio.run(scenario())
+
+
+def test_cancel_prevents_execution():
+    async def scenario():
+        calls = []
+
+        async def callback():
+            calls.append(True)
+
+        async with CommandScheduler(logger) as scheduler:
+            future = scheduler.schedule("cmd", 0.05, callback)
+            assert scheduler.cancel("cmd")
+            assert not scheduler.cancel("cmd")
+            with pytest.raises(CommandCancelledError):
+                await future
+            await asyncio.sleep(0.1)
+        assert calls == []
+
+    asyncio.run(scenario())
+
+
+def test_reschedule_replaces_command():
+    async def scenario():
+        calls = []
+
+        async def callback(value):
+            calls.append(value)
+
+        async with CommandScheduler(logger) as scheduler:
+            first = scheduler.schedule("cmd", 0.05, callback, "first")
+            second = scheduler.schedule("cmd", 0.01, callback, "second")
+            with pytest.raises(CommandCancelledError):
+                await first
+            await asyncio.wait_for(second, 1)
+            await asyncio.sleep(0.06)
+        assert calls == ["second"]
+
+    asyncio.run(scenario())
+
+
+def test_retry_stops_after_max_attempts():
+    async def scenario():
+        calls = []
+
+        async def callback():
+            calls.append(True)
+
+        policy = RetryPolicy(max_attempts=2, delay=0.01)
+        async with CommandScheduler(logger) as scheduler:
+            await scheduler.retry("cmd", policy, callback)
+            assert scheduler.attempts("cmd") == 1
+            await scheduler.retry("cmd", policy, callback)
+            assert scheduler.attempts("cmd") == 2
+            assert scheduler.retry("cmd", policy, callback) is None
+            assert scheduler.attempts("cmd") == 0
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancel_resets_retry_attempts():
+    async def scenario():
+        async def callback():
+            pass
+
+        policy = RetryPolicy(max_attempts=1, delay=10)
+        async with CommandScheduler(logger) as scheduler:
+            scheduler.retry("cmd", policy, callback)
+            scheduler.cancel("cmd")
+            assert scheduler.attempts("cmd") == 0
+            assert scheduler.retry("cmd", policy, callback) is not None
+
+    asyncio.run(scenario())
+
+
+def test_failed_command_sets_exception():
+    async def scenario():
+        async def callback():
+            raise RuntimeError("нет соединения")
+
+        async with CommandScheduler(logger) as scheduler:
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(scheduler.schedule("cmd", 0, callback), 1)
+
+    asyncio.run(scenario())
+
+
+def test_stop_cancels_pending_commands():
+    async def scenario():
+        async def callback():
+            pass
+
+        scheduler = CommandScheduler(logger)
+        scheduler.start()
+        future = scheduler.schedule("cmd", 10, callback)
+        await scheduler.stop()
+        assert scheduler.pending() == 0
+        with pytest.raises(CommandCancelledError):
+            await future
+
+    asyncio.run(scenario())
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(max_attempts=5, delay=1, backoff=2, max_delay=5)
+    assert [policy.delay_for(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+    jittered = RetryPolicy(max_attempts=5, delay=10, jitter=0.5)
+    assert all(5 <= jittered.delay_for(1) <= 10 for _ in range(100))
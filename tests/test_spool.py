@@ -0,0 +1,193 @@
+import logging
+import os
+import struct
+
+import pytest
+
+from core.spool import FRAME, PUBLISH, Spool, SpoolError, SpoolFullError
+
+logger = logging.getLogger("tests")
+
+HEADER_SIZE = struct.calcsize("<IIQB")
+
+
+def open_spool(directory, segment_size=4096, max_bytes=0) -> Spool:
+    spool = Spool(str(directory), logger, segment_size, max_bytes)
+    spool.open()
+    return spool
+
+
+def segment_paths(directory) -> list[str]:
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+def test_unacked_records_are_recovered(tmp_path):
+    spool = open_spool(tmp_path)
+    first = spool.append(FRAME, b"first")
+    second = spool.append(PUBLISH, b"second")
+    spool.ack(first)
+    spool.close()
+
+    spool = open_spool(tmp_path)
+    assert spool.recovered == [second]
+    assert spool.read(second) == (PUBLISH, b"second")
+    with pytest.raises(SpoolError):
+        spool.read(first)
+    third = spool.append(FRAME, b"third")
+    assert third > second
+    spool.close()
+
+
+def test_recovery_without_close(tmp_path):
+    # процесс упал: flush/close не вызывались, но записи уже в page cache
+    spool = open_spool(tmp_path)
+    record_id = spool.append(FRAME, b"payload")
+    for segment in spool._segments.values():
+        segment.close()
+
+    spool = open_spool(tmp_path)
+    assert spool.recovered == [record_id]
+    spool.close()
+
+
+def test_torn_tail_is_discarded(tmp_path):
+    spool = open_spool(tmp_path)
+    ids = [spool.append(FRAME, f"record {i}".encode()) for i in range(3)]
+    path = spool._segments[spool._records[ids[-1]][0]].path
+    offset = spool._records[ids[-1]][1]
+    spool.close()
+
+    # длина и crc последней записи не успели записаться
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(bytes(8))
+
+    spool = open_spool(tmp_path)
+    assert spool.recovered == ids[:2]
+    spool.close()
+
+
+def test_corrupt_crc_discards_rest_of_segment(tmp_path):
+    spool = open_spool(tmp_path)
+    ids = [spool.append(FRAME, f"record {i}".encode()) for i in range(3)]
+    path = spool._segments[spool._records[ids[1]][0]].path
+    offset = spool._records[ids[1]][1]
+    spool.close()
+
+    with open(path, "r+b") as f:
+        f.seek(offset + HEADER_SIZE)
+        f.write(b"X")
+
+    spool = open_spool(tmp_path)
+    assert spool.recovered == ids[:1]
+    assert spool.read(ids[0]) == (FRAME, b"record 0")
+    spool.close()
+
+
+def test_compacted_records_are_recovered_once(tmp_path):
+    spool = open_spool(tmp_path, segment_size=1024)
+    payload = b"x" * 200
+    ids = [spool.append(FRAME, payload + bytes([i])) for i in range(12)]
+    first_segment = spool._records[ids[0]][0]
+    in_first = [record_id for record_id in ids if spool._records[record_id][0] == first_segment]
+    for record_id in in_first[1:]:
+        spool.ack(record_id)
+
+    spool.compact()
+    assert spool.stats()["compacted_segments"] == 1
+    assert first_segment not in spool._segments
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_size=1024)
+    expected = [in_first[0]] + [record_id for record_id in ids if record_id not in in_first]
+    assert spool.recovered == expected
+    assert spool.read(in_first[0]) == (FRAME, payload + bytes([ids.index(in_first[0])]))
+    spool.close()
+
+    # повторное открытие не размножает перенесённые записи
+    spool = open_spool(tmp_path, segment_size=1024)
+    assert spool.recovered == expected
+    spool.close()
+
+
+def test_acks_in_old_segments_survive_reopen(tmp_path):
+    spool = open_spool(tmp_path, segment_size=1024)
+    ids = [spool.append(FRAME, b"y" * 300) for i in range(9)]
+    spool.ack(ids[0])
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_size=1024)
+    assert spool.recovered == ids[1:]
+    spool.close()
+
+
+def test_segments_are_preallocated(tmp_path):
+    spool = open_spool(tmp_path, segment_size=64 * 1024)
+    spool.append(FRAME, b"z")
+    (path,) = segment_paths(tmp_path)
+    spool.close()
+    assert os.stat(path).st_blocks * 512 >= 64 * 1024
+
+
+def test_full_spool_rejects_new_records(tmp_path):
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=2048)
+    ids = []
+    with pytest.raises(SpoolFullError):
+        while True:
+            ids.append(spool.append(FRAME, b"w" * 300))
+    assert len(ids) == 6
+    assert spool.stats()["segment_bytes"] <= 2048
+
+    # место освобождается, когда записи подтверждены
+    for record_id in ids:
+        spool.ack(record_id)
+    record_id = spool.append(FRAME, b"w" * 300)
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=2048)
+    assert spool.recovered == [record_id]
+    spool.close()
+
+
+def test_compaction_stops_when_spool_is_full(tmp_path):
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=2048)
+    ids = [spool.append(FRAME, bytes([i]) * 300) for i in range(6)]
+    first_segment = spool._records[ids[0]][0]
+    # в первом сегменте остаётся одна запись, текущий сегмент заполнен: переносить некуда
+    spool.ack(ids[1])
+    spool.ack(ids[2])
+    spool.compact(max_live_ratio=0.5)
+
+    assert first_segment in spool._segments
+    assert spool._records[ids[0]][0] == first_segment
+    segment = spool._segments[first_segment]
+    assert (segment.live, segment.live_bytes) == (1, spool._records[ids[0]][2])
+    assert spool.stats()["compacted_segments"] == 0
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=2048)
+    assert spool.recovered == [ids[0]] + ids[3:]
+    assert spool.read(ids[0]) == (FRAME, bytes([0]) * 300)
+    spool.close()
+
+
+def test_partially_compacted_segment_keeps_consistent_counters(tmp_path):
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=3072)
+    ids = [spool.append(FRAME, bytes([i]) * 300) for i in range(7)]  # сегменты: 3 + 3 + 1
+    first_segment = spool._records[ids[0]][0]
+    # текущий сегмент вмещает ещё две записи, из первого сегмента переносятся три
+    spool.compact(max_live_ratio=1.0)
+
+    segment = spool._segments[first_segment]
+    moved = [record_id for record_id in ids[:3] if spool._records[record_id][0] != first_segment]
+    assert len(moved) == 2
+    assert segment.live == 1
+    assert segment.live_bytes == sum(spool._records[i][2] for i in ids[:3] if i not in moved)
+    spool.close()
+
+    # перенесённые записи восстанавливаются один раз, из нового места
+    spool = open_spool(tmp_path, segment_size=1024, max_bytes=3072)
+    assert spool.recovered == ids
+    for record_id in moved:
+        assert spool._records[record_id][0] != first_segment
+    spool.close()
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+import pytest
+
+from core.scheduler import RetryPolicy
+from core.supervisor import ConnectionSupervisor
+
+logger = logging.getLogger("tests")
+
+
+class FakeClient:
+    """Клиент контроллера: первые `failures` подключений не удаются."""
+    host = "pacs"
+    port = 1
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.connected = False
+        self.connects = 0
+        self.replays = 0
+
+    async def connect(self, retries: int = 1):
+        self.connects += 1
+        if self.connects <= self.failures:
+            raise ConnectionError("в соединении отказано")
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def replay(self):
+        self.replays += 1
+
+    def stats(self) -> dict:
+        return {}
+
+
+def test_session_is_restarted_after_disconnect():
+    async def scenario():
+        client = FakeClient()
+        sessions = 0
+
+        async def session(connected_client):
+            nonlocal sessions
+            sessions += 1
+            if sessions == 1:
+                raise ConnectionError("соединение разорвано")
+
+        supervisor = ConnectionSupervisor(client, RetryPolicy(max_attempts=0, delay=0.001), asyncio.Event(), logger)
+        await supervisor.run(session)
+        assert sessions == 2
+        assert client.connects == 2
+        # ожидающие ответа команды повторяются после каждого подключения
+        assert client.replays == 2
+        assert supervisor.stats()["reconnects"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_attempts():
+    async def scenario():
+        client = FakeClient(failures=10)
+
+        async def session(connected_client):
+            pass
+
+        supervisor = ConnectionSupervisor(client, RetryPolicy(max_attempts=3, delay=0.001), asyncio.Event(), logger)
+        with pytest.raises(ConnectionError):
+            await supervisor.run(session)
+        assert client.connects == 4
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_interrupts_backoff():
+    async def scenario():
+        client = FakeClient(failures=10)
+        shutdown = asyncio.Event()
+
+        async def session(connected_client):
+            pass
+
+        supervisor = ConnectionSupervisor(client, RetryPolicy(max_attempts=0, delay=60), shutdown, logger)
+        task = asyncio.create_task(supervisor.run(session))
+        await asyncio.sleep(0.01)
+        shutdown.set()
+        await asyncio.wait_for(task, 1)
+        assert client.connects == 1
+
+    asyncio.run(scenario())
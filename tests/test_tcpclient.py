@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import ssl
+
+import pytest
+
+from core.tcpclient import TcpClient
+
+logger = logging.getLogger("tests")
+
+
+class FailingReader:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def readexactly(self, n: int) -> bytes:
+        raise self.error
+
+
+class FailingWriter:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def is_closing(self) -> bool:
+        return False
+
+    def write(self, data: bytes):
+        pass
+
+    async def drain(self):
+        raise self.error
+
+
+def make_client() -> TcpClient:
+    return TcpClient("127.0.0.1", 0, "", "", "", logger, use_ssl=False)
+
+
+@pytest.mark.parametrize("error", [ssl.SSLError(1, "bad record mac"), TimeoutError(), OSError(113, "No route to host")])
+def test_receive_wraps_socket_errors(error):
+    client = make_client()
+    client.reader = FailingReader(error)
+    with pytest.raises(ConnectionError) as info:
+        asyncio.run(client.receive_exactly(4))
+    assert info.value.__cause__ is error
+
+
+def test_receive_incomplete_read():
+    client = make_client()
+    client.reader = FailingReader(asyncio.IncompleteReadError(b"ab", 4))
+    with pytest.raises(ConnectionError):
+        asyncio.run(client.receive_exactly(4))
+
+
+@pytest.mark.parametrize("error", [ssl.SSLError(1, "bad record mac"), OSError(32, "Broken pipe")])
+def test_send_wraps_socket_errors(error):
+    client = make_client()
+    client.writer = FailingWriter(error)
+    with pytest.raises(ConnectionError):
+        asyncio.run(client.send(b"data"))
+    assert client.bytes_sent == 0
+
+
+def test_stalled_frame_body_raises_connection_error():
+    async def scenario():
+        client = make_client()
+        client.frame_timeout = 0.05
+        client.reader = asyncio.StreamReader()
+        client.reader.feed_data((10).to_bytes(4, "little") + b"abc")
+        with pytest.raises(ConnectionError):
+            await client.receive_frame(idle_timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_frame_is_received():
+    async def scenario():
+        client = make_client()
+        client.reader = asyncio.StreamReader()
+        client.reader.feed_data((3).to_bytes(4, "little") + b"abc")
+        assert await client.receive_frame(idle_timeout=1) == b"abc"
+        assert await client.receive_frame(idle_timeout=0.01) is None
+
+    asyncio.run(scenario())
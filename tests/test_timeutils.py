@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+from utils.timeutils import format_datetime, parse_datetime
+
+
+def test_parse_fixed_width():
+    assert parse_datetime("02.01.2024 03:04:05") == datetime(2024, 1, 2, 3, 4, 5)
+
+
+def test_parse_falls_back_to_strptime():
+    assert parse_datetime("2.1.2024 3:04:05") == datetime(2024, 1, 2, 3, 4, 5)
+
+
+@pytest.mark.parametrize("value", ["31.02.2024 00:00:00", "2024-01-02 03:04:05", "02.01.2024 25:00:00", ""])
+def test_invalid_datetime(value):
+    with pytest.raises(ValueError):
+        parse_datetime(value)
+
+
+def test_format_roundtrip():
+    value = datetime(2024, 12, 31, 23, 59, 7)
+    assert format_datetime(value) == "31.12.2024 23:59:07"
+    assert parse_datetime(format_datetime(value)) == value
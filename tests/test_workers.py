@@ -0,0 +1,18 @@
+from core.controllers import ControllerEndpoint
+from core.workers import shard_controllers
+
+
+def test_shards_cover_all_controllers_once():
+    endpoints = [ControllerEndpoint(f"c{i}", f"10.0.0.{i}", 8000) for i in range(20)]
+    shards = shard_controllers(endpoints, 3)
+    assert len(shards) == 3
+    assert sorted(endpoint.name for shard in shards for endpoint in shard) == sorted(e.name for e in endpoints)
+
+
+def test_sharding_is_stable():
+    endpoints = [ControllerEndpoint(f"c{i}", f"10.0.0.{i}", 8000) for i in range(20)]
+    # тот же контроллер попадает в тот же процесс независимо от порядка и состава списка
+    shards = shard_controllers(endpoints, 4)
+    assert shard_controllers(list(reversed(endpoints)), 4) == [list(reversed(shard)) for shard in shards]
+    index = next(i for i, shard in enumerate(shards) if endpoints[5] in shard)
+    assert endpoints[5] in shard_controllers([endpoints[5]], 4)[index]
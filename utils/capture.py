@@ -0,0 +1,170 @@
+import queue
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator
+
+# Файл записи трафика: сигнатура, затем записи подряд.
+# Запись: время от начала записи (сек, float64), направление, длина данных, данные пакета без заголовка длины
+MAGIC = b"PACSCAP1"
+RECORD_HEADER = struct.Struct("<dBI")
+
+INBOUND = 0   # от контроллера к клиенту
+OUTBOUND = 1  # от клиента к контроллеру
+
+
+class CaptureFormatError(ValueError):
+    """Файл не является записью трафика PACS или повреждён."""
+
+
+def write_header(f: BinaryIO):
+    f.write(MAGIC)
+
+
+def write_record(f: BinaryIO, timestamp: float, direction: int, payload: bytes):
+    """
+    Дописать пакет в файл записи.
+
+    :param f: файл, открытый на запись в двоичном режиме (после write_header)
+    :param timestamp: время от начала записи (сек)
+    :param direction: INBOUND или OUTBOUND
+    :param payload: данные пакета (JSON без 4-байтового заголовка)
+    """
+    f.write(RECORD_HEADER.pack(timestamp, direction, len(payload)))
+    f.write(payload)
+
+
+def read_capture(path: str) -> Iterator[tuple[float, int, bytes]]:
+    """
+    Читает файл записи трафика.
+
+    Недописанная последняя запись (процесс остановлен во время записи)
+    пропускается.
+
+    :param path: путь к файлу
+    :return: итератор (время, направление, данные пакета)
+    :raises CaptureFormatError: если у файла нет сигнатуры записи
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise CaptureFormatError(f"{path} не является записью трафика PACS")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, direction, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield timestamp, direction, payload
+
+
+class CaptureWriter:
+    """
+    Запись трафика TcpClient в файл в фоновом потоке.
+
+    `write` только ставит пакет с временем приёма/отправки (monotonic) в
+    очередь и не обращается к диску, поэтому не задерживает цикл событий.
+    Поток пишет записи через буфер `buffer_size` байт и сбрасывает его не
+    реже раза в `flush_interval` сек. При переполненной очереди пакет
+    отбрасывается и учитывается в `dropped`: запись трафика не должна
+    тормозить приём. После ошибки записи (например, нет места на диске)
+    поток завершается, и пакеты больше не ставятся в очередь.
+    """
+    def __init__(
+        self,
+        path: str,
+        logger,
+        queue_size: int = 100000,
+        buffer_size: int = 1024 * 1024,
+        flush_interval: float = 1.0
+    ):
+        """
+        :param path: файл записи (перезаписывается)
+        :param logger:
+        :param queue_size: сколько пакетов может ждать записи
+        :param buffer_size: размер буфера файла (байт)
+        :param flush_interval: период сброса буфера на диск (сек)
+        """
+        self.path = path
+        self.logger = logger
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+        self._failed = False
+
+        self.written = 0
+        self.dropped = 0
+
+    def open(self):
+        """Создаёт файл и запускает поток записи."""
+        f = open(self.path, "wb", buffering=self.buffer_size)
+        write_header(f)
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, args=(f,), name="pacs-capture", daemon=True)
+        self._thread.start()
+        self.logger.info("Запись трафика в %s", self.path)
+
+    def close(self, timeout: float = 5.0):
+        """
+        Дописывает очередь и закрывает файл.
+
+        :param timeout: сколько ждать дописывания очереди (сек)
+        """
+        if self._thread is None:
+            return
+        if not self._failed:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning("Запись трафика в %s не завершилась за %s сек", self.path, timeout)
+        self._thread = None
+
+    def write(self, direction: int, payload: bytes):
+        """
+        Записать пакет.
+
+        :param direction: INBOUND или OUTBOUND
+        :param payload: данные пакета без 4-байтового заголовка
+        """
+        if self._thread is None or self._failed:
+            return
+        try:
+            self._queue.put_nowait((time.monotonic() - self._started, direction, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, f: BinaryIO):
+        flush_at = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    record = self._queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+                except queue.Empty:
+                    record = ()
+                if record is None:
+                    break
+                if record:
+                    write_record(f, *record)
+                    self.written += 1
+                if time.monotonic() >= flush_at:
+                    f.flush()
+                    flush_at = time.monotonic() + self.flush_interval
+        except OSError as e:
+            self._failed = True
+            self.logger.error("Запись трафика в %s остановлена: %s", self.path, e)
+        finally:
+            try:
+                f.close()
+            except OSError:
+                pass  # буфер не дописан по той же причине
+
+    def stats(self) -> dict:
+        """Записанные и отброшенные пакеты, признак остановки из-за ошибки."""
+        return {"written": self.written, "dropped": self.dropped, "failed": self._failed}
@@ -0,0 +1,92 @@
+import json
+from typing import Any, Callable
+
+from core.settings import settings
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # необязательная зависимость
+    msgspec = None
+
+
+class JsonCodec:
+    """
+    JSON-кодек для протокола PACS и сообщений RabbitMQ.
+
+    Все реализации декодируют bytes напрямую и кодируют сразу в bytes (UTF-8),
+    без промежуточных str.
+    """
+    def __init__(self, name: str, loads: Callable[[bytes | str], Any], dumps: Callable[[Any], bytes], decode_errors: tuple):
+        """
+        :param name: имя реализации (orjson, msgspec, json)
+        :param loads: bytes/str → объект
+        :param dumps: объект → bytes
+        :param decode_errors: исключения, которые бросает loads на некорректных данных
+        """
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.decode_errors = decode_errors
+
+    def __repr__(self):
+        return f"JsonCodec({self.name})"
+
+
+def _stdlib_codec() -> JsonCodec:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    return JsonCodec("json", json.loads, dumps, (ValueError,))
+
+
+def _orjson_codec() -> JsonCodec:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return JsonCodec("orjson", orjson.loads, dumps, (ValueError,))
+
+
+def _msgspec_codec() -> JsonCodec:
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+    return JsonCodec("msgspec", decoder.decode, encoder.encode, (ValueError, msgspec.DecodeError))
+
+
+_BACKENDS = {
+    "orjson": (lambda: orjson is not None, _orjson_codec),
+    "msgspec": (lambda: msgspec is not None, _msgspec_codec),
+    "json": (lambda: True, _stdlib_codec),
+}
+
+
+def available_backends() -> list[str]:
+    """Имена реализаций, доступных в текущем окружении (в порядке предпочтения)."""
+    return [name for name, (is_available, _) in _BACKENDS.items() if is_available()]
+
+
+def get_codec(backend: str = "auto") -> JsonCodec:
+    """
+    Возвращает JSON-кодек.
+
+    :param backend: "auto" (orjson → msgspec → json), либо имя конкретной реализации.
+                    Если запрошенная реализация не установлена, используется json.
+    :return: кодек
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    is_available, factory = _BACKENDS.get(backend, _BACKENDS["json"])
+    if not is_available():
+        return _stdlib_codec()
+    return factory()
+
+
+codec = get_codec(settings.JSON_BACKEND)
+
+loads = codec.loads
+dumps = codec.dumps
+DecodeError = codec.decode_errors
@@ -1,8 +1,10 @@
-import asyncio
-from datetime import datetime as dt
-from typing import List, Dict, Any
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Tuple
 
-from core.db import DB
+from core.db import DB, is_data_error
+from core.models import ModelValidationError, PacsEvent, decode_list
+from core.settings import settings
 from core.tcpclient import TcpClient
 # from utils.logger import get_logger
 
@@ -26,20 +28,6 @@ def create_buffer(json_data: str) -> bytes:
     header = len(data).to_bytes(4, 'little')
     return header + data
 
-def datetime_to_timestamp(date_time):
-    time_object = dt.strptime(date_time,"%d.%m.%Y %H:%M:%S")
-    #ts = int(round(dt.timestamp(time_object)))
-    return time_object
-
-def parse_datetime(date_str: str) -> dt:
-    """
-    Парсит строку формата "dd.MM.yyyy HH:mm:ss" в datetime.
-
-    :param date_str: строка даты/времени
-    :return: объект даты и времени
-    """
-    return dt.strptime(date_str, "%d.%m.%Y %H:%M:%S")
-
 # def chunk_data(client: TcpClient, buff_size: int = 1024) -> bytes:
 #     """
 #     Синхронное получение данных от клиента.
@@ -61,128 +49,153 @@ def parse_datetime(date_str: str) -> dt:
 #             break
 #     return data
 
-async def chunk_data_async(client: TcpClient, timeout: int = 5) -> bytes:
+async def chunk_data_async(client: TcpClient, timeout: int = 5) -> bytes | None:
     """
-      Асинхронное получение одного пакета (заголовок + данные).
+    Асинхронное получение данных одного пакета (без 4-байтового заголовка).
 
-      :param client: TCP-клиент
-      :param timeout:
-      :return: принятый пакет
-      """
-    try:
-        header = await asyncio.wait_for(client.receive_exactly(4), timeout=timeout)
-        length = int.from_bytes(header, "little")
-        payload = await asyncio.wait_for(client.receive_exactly(length), timeout=timeout)
-        return header + payload
-    except asyncio.TimeoutError:
-        return b""  # ничего не получили → проверим shutdown_event
+    :param client: TCP-клиент
+    :param timeout: сколько ждать начала пакета (сек)
+    :return: данные пакета или None, если за timeout ничего не пришло
+    """
+    return await client.receive_frame(idle_timeout=timeout)
 
-async def insert_event_to_db(db: DB, events: List[Dict[str, Any]], logger) -> List[str]:
+@dataclass
+class EventInsertResult:
     """
-    Сохраняет события в БД.
+    Результат пакетной вставки событий.
 
-    :param logger:
-    :param db: объект базы данных
-    :param events: список событий (dict)
-    :return: список ID вставленных событий
+    :ivar ids: ID вставленных событий в порядке входного списка
+    :ivar rejected: отклонённые события — (индекс во входном списке, событие, причина)
+    :ivar records: вставленные строки (id, created, ap_id, owner_id, card_number, code) в том же порядке, что ids
     """
-    if not isinstance(events, list):
-        logger.warning(f"insert_event_to_db: ожидаемый тип 'list', получен {type(events)}")
-        return []
+    ids: List[str] = field(default_factory=list)
+    rejected: List[Tuple[int, Any, str]] = field(default_factory=list)
+    records: List[Any] = field(default_factory=list)
 
-    results = []
-    for event in events:
-        if not isinstance(event, dict):
-            logger.warning(f"Неверные данные о событии (не dict): {event}")
-            continue
-
-        ev_time = event.get('EvTime')
-        ev_ap = event.get('EvAddr')
-        ev_user = event.get('EvUser')
-        ev_card = event.get('EvCard')
-        ev_code = event.get('EvCode')
-
-        if not ev_time or not ev_ap or ev_user is None:
-            logger.warning(f"Отсутствуют обязательные поля в событии: {event}")
-            continue
-
-        ev_owner = ev_user if ev_user != 0 else None
-
-        try:
-            row = await db.fetch_row(
-                """
-                INSERT INTO public.pacs_event(created, ap_id, owner_id, card_number, code)
-                VALUES($1, $2, $3, $4, $5)
-                RETURNING id
-                """,
-                parse_datetime(ev_time), ev_ap, ev_owner, ev_card, ev_code
-            )
-            if row:
-                results.append(str(row['id']))
-        except Exception as e:
-            logger.error(f"Failed to insert event {event}: {e}")
 
-    return results
+# Один запрос для пачки любой длины: значения колонок передаются массивами,
+# поэтому текст запроса не меняется и подготовленный запрос переиспользуется.
+#
+# ON CONFLICT DO NOTHING пропускает события, уже сохранённые ранее
+# (при наличии уникального индекса из sql/pacs_event_unique.sql);
+# RETURNING возвращает только вставленные строки — вместе со значениями,
+# так как без пропущенных строк их уже нельзя сопоставить с входным списком.
+_EVENT_INSERT_QUERY = """
+    INSERT INTO public.pacs_event(created, ap_id, owner_id, card_number, code)
+    SELECT * FROM unnest($1::timestamp[], $2::int[], $3::int[], $4::text[], $5::int[])
+    ON CONFLICT DO NOTHING
+    RETURNING id, created, ap_id, owner_id, card_number, code
+"""
+
+
+def _event_arrays(events: List[PacsEvent]) -> List[list]:
+    """Параметры _EVENT_INSERT_QUERY: по массиву значений на колонку."""
+    columns = [list(column) for column in zip(*(event.as_row() for event in events))]
+    # EvCard приходит строкой "A.B", но модель допускает и число
+    columns[3] = [None if card is None else str(card) for card in columns[3]]
+    return columns
+
+
+async def insert_events_batch(
+    db: DB,
+    events: List[PacsEvent],
+    logger,
+    batch_size: int | None = None
+) -> EventInsertResult:
+    """
+    Пакетно сохраняет события в БД.
+
+    Все события пачки вставляются одним INSERT ... SELECT FROM unnest(...) RETURNING id
+    (одно соединение из пула и один round trip на пачку).
+    Если пачка отклонена самой БД (например, нарушение внешнего ключа),
+    она повторяется построчно, чтобы отсеять только проблемные события.
+    Если же БД недоступна, ошибка пробрасывается: события не отбрасываются,
+    а остаются в журнале конвейера до восстановления БД.
 
-async def load_system_ap(db: DB, ap_list: List[Dict[str, Any]], logger):
+    Пакет длиннее batch_size вставляется частями в одной транзакции: при
+    сбое посередине не сохраняется ничего, и повтор пакета из журнала
+    получает ID всех его событий (ON CONFLICT DO NOTHING не вернул бы ID
+    частей, сохранённых до сбоя, и о них не узнали бы подписчики RabbitMQ).
+
+    :param db: объект базы данных
+    :param events: проверенные события
+    :param logger:
+    :param batch_size: максимальное число событий в одном INSERT
+    :return: ID вставленных событий (в порядке входного списка) и отклонённые события
+    :raises Exception: ошибка БД, не связанная с самими данными (см. core.db.is_data_error)
     """
-       Загружает список access points в БД.
-
-       :param logger:
-       :param db: объект базы данных
-       :param ap_list: список access points
-       """
-    if not isinstance(ap_list, list):
-        logger.warning(f"load_system_ap: expected list, got {type(ap_list)}")
-        return
-
-    for ap in ap_list:
-        try:
-            system_id = ap["Id"]
-            name = ap["Name"]
-            await db.execute(
-                """
-                INSERT INTO public.pacs_access_point(system_id, name)
-                VALUES($1, $2)
-                ON CONFLICT (system_id)
-                DO UPDATE SET name=$2
-                """,
-                system_id, name
+    result = EventInsertResult()
+    batch_size = batch_size or settings.EVENT_INSERT_BATCH_SIZE
+
+    if len(events) <= batch_size:
+        # один INSERT атомарен сам по себе
+        await _insert_events_chunk(db.fetch_all, db.fetch_row, nullcontext, events, 0, result, logger)
+        return result
+
+    async with db.transaction() as conn:
+        for start in range(0, len(events), batch_size):
+            # точка сохранения: отклонённая часть повторяется построчно, не прерывая транзакцию
+            await _insert_events_chunk(
+                conn.fetch, conn.fetchrow, conn.transaction, events[start:start + batch_size], start, result, logger
             )
-        except Exception as e:
-            logger.error(f"Не удалось вставить/обновить AP {ap}: {e}")
+    return result
 
 
-async def load_system_card_owner(db: DB, user_list: List[Dict[str, Any]], logger):
+async def _insert_events_chunk(fetch, fetch_row, savepoint, chunk: List[PacsEvent], start: int, result, logger):
+    try:
+        # RETURNING отдаёт строки в порядке unnest, т.е. в порядке входного списка
+        async with savepoint():
+            records = await fetch(_EVENT_INSERT_QUERY, *_event_arrays(chunk))
+        result.ids.extend(str(record['id']) for record in records)
+        result.records.extend(records)
+    except Exception as e:
+        if not is_data_error(e):
+            raise
+        logger.error("Пакетная вставка %s событий не удалась: %s, повтор построчно", len(chunk), e)
+        for index, event in enumerate(chunk, start):
+            try:
+                async with savepoint():
+                    record = await fetch_row(_EVENT_INSERT_QUERY, *_event_arrays([event]))
+                if record:
+                    result.ids.append(str(record['id']))
+                    result.records.append(record)
+            except Exception as row_error:
+                if not is_data_error(row_error):
+                    raise
+                result.rejected.append((index, event, str(row_error)))
+
+
+def log_rejected(rejected: List[Tuple[int, Any, str]], what: str, logger):
     """
-    Загружает список владельцев карт в БД.
+    Логирует элементы пакета, отклонённые при разборе или сохранении.
+
+    :param rejected: (индекс, элемент, причина)
+    :param what: что отклонено (для сообщения)
+    :param logger:
+    """
+    for index, item, reason in rejected:
+        logger.warning("%s #%d отклонено (%s): %s", what, index, reason, item)
+
+
+async def insert_event_to_db(db: DB, events: List[Dict[str, Any]], logger) -> List[str]:
+    """
+    Сохраняет события в БД.
 
     :param logger:
     :param db: объект базы данных
-    :param user_list: список пользователей
+    :param events: список событий (dict)
+    :return: список ID вставленных событий
     """
-    if not isinstance(user_list, list):
-        logger.warning(f"load_system_card_owner: ожидаемый тип 'List', получен {type(user_list)}")
-        return
-
-    for user in user_list:
-        try:
-            system_id = user["Id"]
-            firstname = user["FirstName"]
-            secondname = user["SecondName"]
-            lastname = user["LastName"]
-            await db.execute(
-                """
-                INSERT INTO public.pacs_card_owner(system_id, firstname, secondname, lastname)
-                VALUES ($1, $2, $3, $4) ON CONFLICT (system_id)
-                   DO
-                UPDATE SET firstname=$2, secondname=$3, lastname=$4
-                """,
-                system_id, firstname, secondname, lastname
-            )
-        except Exception as e:
-            logger.error(f"Не удалось вставить/обновить пользователя {user}: {e}")
+    try:
+        models, rejected = decode_list(PacsEvent, events)
+    except ModelValidationError as e:
+        logger.warning("insert_event_to_db: %s", e)
+        return []
+    log_rejected(rejected, "Событие", logger)
 
+    result = await insert_events_batch(db, models, logger)
+    log_rejected(result.rejected, "Событие", logger)
+    return result.ids
 
 def calculate_card_number(card_number: str) -> int:
     """
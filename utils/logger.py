@@ -1,27 +1,153 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
+
+from core.settings import settings
+
+# Стандартные атрибуты LogRecord: всё остальное пришло через extra= и попадает в JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись — одна строка JSON: время, уровень, логгер, сообщение,
+    поля из extra= и трассировка исключения.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает частоту одинаковых сообщений.
+
+    Ключ сообщения — логгер, уровень и шаблон (msg до подстановки
+    аргументов), поэтому сообщения нужно писать в %-стиле:
+    `logger.warning("Нет команды %s", command)`, а не f-строкой.
+    За интервал пропускается не больше `burst` записей с одним ключом;
+    число отброшенных добавляется к следующей пропущенной записи в поле
+    `suppressed`.
+    """
+    def __init__(self, burst: int, interval: float):
+        """
+        :param burst: сколько записей с одним ключом пропускать за интервал (0 — без ограничения)
+        :param interval: длина интервала (сек)
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # ключ → [начало интервала, пропущено, отброшено]
+        self._windows: dict[tuple, list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.burst:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        window = self._windows.get(key)
+        if window is None or record.created - window[0] >= self.interval:
+            dropped = window[2] if window is not None else 0
+            if len(self._windows) >= 10000:
+                self._windows.clear()  # шаблоны с переменной частью не должны копиться бесконечно
+            self._windows[key] = [record.created, 1, 0]
+            if dropped:
+                record.suppressed = dropped
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Передаёт записи в ограниченную очередь, которую разбирает поток
+    QueueListener. Вызывающий (цикл событий) никогда не ждёт вывода:
+    при переполненной очереди запись отбрасывается и учитывается в `dropped`.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются здесь (они могут измениться после вызова),
+        # а JSON и запись в stdout — уже в потоке QueueListener
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 
 def get_logger(is_verbose: bool) -> logging.Logger:
     """
     Возвращает логгер pacs_tcp_client.
 
+    Записи проходят фильтр частоты (LOG_RATE_LIMIT за LOG_RATE_INTERVAL)
+    и попадают в очередь (LOG_QUEUE_SIZE); в stdout их пишет отдельный
+    поток в формате LOG_FORMAT ("text" или "json"). Очередь дописывается
+    при завершении процесса.
+
     Args:
         is_verbose (bool): если True — уровень DEBUG, иначе INFO.
 
     Returns:
         logging.Logger: настроенный логгер без дублирования хэндлеров.
     """
+    global _listener
+
     log_level = logging.DEBUG if is_verbose else logging.INFO
     logger = logging.getLogger("pacs_tcp_client")
     logger.setLevel(log_level)
 
-    if not logger.handlers:  # предотвращает повторное добавление
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(log_level)
-        handler.setFormatter(
-            logging.Formatter("[%(asctime)s] [%(levelname)s] - %(message)s")
-        )
-        logger.addHandler(handler)
+    with _lock:
+        if not logger.handlers:  # предотвращает повторное добавление
+            stream = logging.StreamHandler(sys.stdout)
+            if settings.LOG_FORMAT == "json":
+                stream.setFormatter(JsonFormatter())
+            else:
+                stream.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] - %(message)s"))
+
+            handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+            handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_INTERVAL))
+            logger.addHandler(handler)
+            logger.propagate = False
+
+            _listener = logging.handlers.QueueListener(handler.queue, stream)
+            _listener.start()
+            atexit.register(_listener.stop)
 
-    return logger
\ No newline at end of file
+    return logger
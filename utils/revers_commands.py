@@ -1,12 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict
 
 from core.settings import settings
+from utils.timeutils import format_datetime
 
 
 def _format_datetime(dt: datetime) -> str:
     """Форматирует дату в 'dd.mm.yyyy HH:MM:SS' (требуемый формат PACS)"""
-    return dt.strftime("%d.%m.%Y %H:%M:%S")
+    return format_datetime(dt)
 
 
 def get_edit_card_command(
@@ -75,6 +76,26 @@ def get_delete_card_command(event_id: int, card_number: int) -> Dict:
         "CardNum": card_number,
     }
 
+def get_stage_command(stage: str, event_id: int, card_number: int) -> Dict:
+    """
+    Генерирует команду для стадии ожидающей команды (используется при повторе).
+
+    Для addcard/editcard срок действия карты отсчитывается от текущего момента:
+    -1 час … +8 часов.
+    """
+    now = datetime.now()
+    match stage:
+        case "addcard":
+            return get_add_card_command(event_id, card_number, now - timedelta(hours=1), now + timedelta(hours=8))
+        case "editcard":
+            return get_edit_card_command(event_id, card_number, now - timedelta(hours=1), now + timedelta(hours=8))
+        case "loadcard":
+            return get_load_card_command(event_id, card_number)
+        case "delcard":
+            return get_delete_card_command(event_id, card_number)
+        case _:
+            raise ValueError(f"Неизвестная стадия команды: {stage}")
+
 # def get_state_card_command(event_id: str, card_number: int) -> Dict:
 #     """Генерирует команду статуса карты"""
 #     return {
@@ -0,0 +1,63 @@
+from datetime import datetime as dt
+from functools import lru_cache
+
+# Формат даты/времени протокола Revers 8000: "dd.MM.yyyy HH:mm:ss"
+PACS_DATETIME_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+
+@lru_cache(maxsize=256)
+def _parse_date(date_part: str) -> tuple[int, int, int]:
+    """
+    Разбирает дату "dd.MM.yyyy" в (год, месяц, день).
+
+    События одной пачки почти всегда относятся к одной дате, поэтому
+    разбор кэшируется по строке даты.
+    """
+    return int(date_part[6:10]), int(date_part[3:5]), int(date_part[0:2])
+
+
+@lru_cache(maxsize=256)
+def _format_date(year: int, month: int, day: int) -> str:
+    return f"{day:02d}.{month:02d}.{year:04d}"
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(date_str: str) -> dt:
+    """
+    Парсит строку формата "dd.MM.yyyy HH:mm:ss" в datetime.
+
+    Строки фиксированной ширины разбираются срезами и int() без strptime;
+    дата кэшируется отдельно, а вся строка — целиком (события одной секунды
+    часто приходят пачкой). Строки другой формы разбираются strptime,
+    который и сообщает об ошибке формата.
+
+    :param date_str: строка даты/времени
+    :return: объект даты и времени
+    :raises ValueError: если строка не соответствует формату
+    """
+    if (
+        len(date_str) == 19
+        and date_str[2] == "." and date_str[5] == "." and date_str[10] == " "
+        and date_str[13] == ":" and date_str[16] == ":"
+    ):
+        try:
+            year, month, day = _parse_date(date_str[:10])
+            return dt(year, month, day, int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19]))
+        except ValueError:
+            pass
+    return dt.strptime(date_str, PACS_DATETIME_FORMAT)
+
+
+def datetime_to_timestamp(date_time):
+    return parse_datetime(date_time)
+
+
+def format_datetime(value: dt) -> str:
+    """
+    Форматирует дату в "dd.MM.yyyy HH:mm:ss" (формат PACS) без strftime.
+
+    :param value: дата и время
+    :return: строка даты/времени
+    """
+    date_part = _format_date(value.year, value.month, value.day)
+    return f"{date_part} {value.hour:02d}:{value.minute:02d}:{value.second:02d}"